@@ -1,7 +1,8 @@
+import bisect
 import enum
-import string
-import subprocess
-from typing import Any, Callable, Optional, Text
+import functools
+import itertools
+from typing import Any, Callable, List, NamedTuple, Optional, Sequence, Text
 import magic
 import imghdr
 from bitcoin.core import CScript, script
@@ -10,42 +11,50 @@ import re
 
 from database import (
     BLOCKCHAIN,
+    BatchDetectorFunc,
     Database,
     DatabaseWriteFunc,
     DetectedAsciiPayload,
     DetectedFilePayload,
     DetectorFunc,
     DetectorPayload,
+    RecordFilter,
 )
-
+from file_types import classify_magic_description
 
 magic_handle = magic.Magic()
 
 
+def init_detection_worker() -> None:
+    """Opens a libmagic handle of its own in a detection worker process,
+    instead of sharing the one inherited from the parent process"""
+    global magic_handle
+    magic_handle = magic.Magic()
+
+
+@functools.lru_cache(maxsize=None)
+def get_gnu_strings_regex(min: int) -> re.Pattern:
+    """Matches the strings GNU strings -n min prints in its default 7-bit
+    encoding, runs of at least min printable ASCII characters or tabs"""
+    return re.compile(rb"[\t\x20-\x7e]{%d,}" % min)
+
+
 def gnu_strings(
     payload: DetectorPayload, min: int = 10
 ) -> Optional[DetectedAsciiPayload]:
-    """Find and return a string with the specified minimum size using gnu strings
-    :param bytestring: Bytes to be examined.
-    :type bytestring: bytes
-    :param min: Minimum length of the to be detected string.
+    """Find and return the length of the strings with the specified minimum size
+    as printed by gnu strings, one per line and stripped of the surrounding whitespace
+    :param payload: Contains data to be examined.
+    :type payload: DetectorPayload
+    :param min: Minimum length of the to be detected strings.
     :type min: int
-    :return: A string of minimum length min as detected in the bytestring.
-    :rtype: str
+    :return: DetectedAsciiPayload if detected, None if not.
+    :rtype: Optional[DetectedAsciiPayload]
     """
-    cmd = "strings -n {}".format(min)
-    process = subprocess.Popen(
-        cmd,
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        stdin=subprocess.PIPE,
-    )
-    assert process.stdin is not None
-    process.stdin.write(payload.data)
-    output = process.communicate()[0]
-    output_str = output.decode("ascii").strip()
-    length = len(output_str)
+    # Scanned in process, running strings -n min for every payload cost far
+    # more than the scan, see benchmarks.strings for the comparison
+    output = b"\n".join(get_gnu_strings_regex(min).findall(payload.data)).strip()
+    length = len(output)
     if length < min:
         return None
     return DetectedAsciiPayload(
@@ -68,6 +77,57 @@ def bitcoin_detect_op_return_output(cscript: CScript) -> str:
     return ""
 
 
+class PrintableRun(NamedTuple):
+    """A run of printable characters within a payload"""
+
+    offset: int
+    length: int
+
+
+@functools.lru_cache(maxsize=None)
+def get_printable_run_regex(min: int) -> re.Pattern:
+    """Matches runs of at least min characters of string.printable"""
+    return re.compile(rb"[\t\n\x0b\x0c\r\x20-\x7e]{%d,}" % min)
+
+
+def find_printable_runs(data: bytes, min: int = 10) -> List[PrintableRun]:
+    """Find every run of printable characters with the specified minimum size
+    :param data: Bytes to be examined.
+    :type data: bytes
+    :param min: Minimum length of the to be detected runs.
+    :type min: int
+    :return: The offset and length of every run, in the order they appear.
+    :rtype: List[PrintableRun]
+    """
+    return [
+        PrintableRun(match.start(), match.end() - match.start())
+        for match in get_printable_run_regex(min).finditer(data)
+    ]
+
+
+def find_printable_runs_batch(
+    data: Sequence[bytes], min: int = 10
+) -> List[List[PrintableRun]]:
+    """Runs find_printable_runs over a batch of payloads with a single scan
+    :param data: Payloads to be examined.
+    :type data: Sequence[bytes]
+    :param min: Minimum length of the to be detected runs.
+    :type min: int
+    :return: The runs of every payload, their offsets relative to the payload.
+    :rtype: List[List[PrintableRun]]
+    """
+
+    # Separated by a byte that is not printable, so no run spans two payloads.
+    # ends holds the offset after the separator of every payload.
+    ends = list(itertools.accumulate(len(payload) + 1 for payload in data))
+    runs: List[List[PrintableRun]] = [[] for _ in data]
+    for match in get_printable_run_regex(min).finditer(b"\x00".join(data)):
+        index = bisect.bisect_right(ends, match.start())
+        start = match.start() - (ends[index - 1] if index > 0 else 0)
+        runs[index].append(PrintableRun(start, match.end() - match.start()))
+    return runs
+
+
 def native_strings(
     detector_payload: DetectorPayload, min: int = 10
 ) -> Optional[DetectedAsciiPayload]:
@@ -76,36 +136,56 @@ def native_strings(
     :type detector_payload: DetectorPayload
     :param min: Minimum length of the to be detected string.
     :type min: int
-    :return: DetectedAsciiPayload if detected, None if not.
+    :return: DetectedAsciiPayload with the length of the first such string if detected, None if not.
     :rtype: Optional[DetectedAsciiPayload]
     """
 
-    result = ""
-    for c in detector_payload.data:
-        if type(c) is not int:
-            continue
-        if chr(c) in string.printable:
-            result += chr(c)
-            continue
-        if len(result) >= min:
-            return DetectedAsciiPayload(
-                detector_payload.txid,
-                detector_payload.data_type,
-                detector_payload.extra_index,
-                len(result),
-            )
-
-        result = ""
-    if len(result) < min:  # catch result at EOF
+    # hex encoded payloads hold no bytes to be examined
+    if type(detector_payload.data) is str:
+        return None
+    runs = find_printable_runs(detector_payload.data, min)
+    if len(runs) == 0:
         return None
     return DetectedAsciiPayload(
         detector_payload.txid,
         detector_payload.data_type,
         detector_payload.extra_index,
-        len(result),
+        runs[0].length,
     )
 
 
+def native_strings_batch(
+    detector_payloads: Sequence[DetectorPayload], min: int = 10
+) -> List[Optional[DetectedAsciiPayload]]:
+    """Runs native_strings over a batch of payloads with a single scan
+    :param detector_payloads: Contain the data to be examined.
+    :type detector_payloads: Sequence[DetectorPayload]
+    :param min: Minimum length of the to be detected string.
+    :type min: int
+    :return: DetectedAsciiPayload of every payload if detected, None if not.
+    :rtype: List[Optional[DetectedAsciiPayload]]
+    """
+
+    all_runs = find_printable_runs_batch(
+        [
+            b"" if type(payload.data) is str else payload.data
+            for payload in detector_payloads
+        ],
+        min,
+    )
+    results: List[Optional[DetectedAsciiPayload]] = []
+    for payload, runs in zip(detector_payloads, all_runs):
+        if len(runs) == 0:
+            results.append(None)
+            continue
+        results.append(
+            DetectedAsciiPayload(
+                payload.txid, payload.data_type, payload.extra_index, runs[0].length
+            )
+        )
+    return results
+
+
 def find_file_with_imghdr(data: bytes) -> Optional[str]:
     """Find images with the help of imghdr magic numbers
     :param bytestring: Bytes to be examined.
@@ -137,169 +217,8 @@ def find_file_with_magic(data: bytes) -> Optional[str]:
         print(e)
         # ignore any exceptions and return None
         raise e
-    if (
-        res == "data"
-        or res == "shared library"
-        or res == "(non-conforming)"
-        or "title:" in res
-        or "ddis/ddif" in res
-        or "Message Sequence" in res
-        or "rawbits" in res
-        or "Binary II" in res
-        or "ZPAQ stream" in res
-        or "QL disk" in res
-        or "LN03 output" in res
-        or "LADS" in res
-        or "XWD X" in res
-        or "Smile" in res
-        or "Nintendo" in res
-        or "Kerberos" in res
-        or "AMF" in res
-        or "ctors/track" in res
-        or "ICE authority" in res
-        or "SAS" in res
-        or "Stereo" in res
-        or "ddis/dtif" in res
-        or "Virtual TI skin" in res
-        or "Multitracker" in res
-        or "HP s200" in res
-        or "ECMA-363" in res
-        or "Monaural" in res
-        or "32 kHz" in res
-        or "48 kHz" in res
-        or "locale archive" in res
-        or "terminfo" in res
-        or "GRand" in res
-        or "font" in res
-        or "Apache" in res
-        or "OEM-ID" in res
-        or "Bentley" in res
-        or "huf output" in res
-        or "disk quotas" in res
-        or "PRCS" in res
-        or "PEX" in res
-        or "C64" in res
-        or "lif file" in res
-        or "GHost image" in res
-        or "Linux" in res
-        or "amd" in res
-        or "XENIX" in res
-        or "structured file" in res
-        or "gfxboot" in res
-        or "X11" in res
-        or "cpio" in res
-        or "Squeezed" in res
-        or "compacted" in res
-        or "Quasijarus" in res
-        or "JVT" in res
-        or "Poskanzer" in res
-        or "VISX" in res
-        or "TIM" in res
-        or "PCX" in res
-        or "MSVC" in res
-        or "LZH" in res
-        or "LVM1" in res
-        or "Encore" in res
-        or "ATSC" in res
-        or "BASIC" in res
-        or "frozen file" in res
-        or "dBase" in res
-        or "SCO" in res
-        or "RDI" in res
-        or "PostScript" in res
-        or "Netpbm" in res
-        or "Maple" in res
-        or "i386" in res
-        or "archive data" in res
-        or "Motorola" in res
-        or "FoxPro" in res
-        or "packed data" in res
-        or "fsav" in res
-        or "crunched" in res
-        or "compress'd" in res
-        or "Terse" in res
-        or "SoftQuad" in res
-        or "Sendmail" in res
-        or "OS9" in res
-        or "MySQL" in res
-        or "IRIS" in res
-        or "Java" in res
-        or "SOFF" in res
-        or "PSI " in res
-        or "Clarion" in res
-        or "BIOS" in res
-        or "Atari" in res
-        or "Ai32" in res
-        or "ALAN" in res
-        or "44.1" in res
-        or "Microsoft" in res
-        or "TeX" in res
-        or "floppy" in res
-        or "GLF_BINARY" in res
-        or "AIN" in res
-        or "Alpha" in res
-        or "vfont" in res
-        or "DOS" in res
-        or "Sun disk" in res
-        or "Group 3" in res
-        or "Logitech" in res
-        or "Solitaire" in res
-        or "old " in res
-        or "SYMMETRY" in res
-        or "DOS/MBR" in res
-        or "Amiga" in res
-        or "mumps" in res
-        or "ID tags" in res
-        or "GLS" in res
-        or "dBase IV DBT" in res
-        or "TTComp" in res
-        or "EBCDIC" in res
-        or "MGR bitmap" in res
-        or "CLIPPER" in res
-        or "Dyalog" in res
-        or "PARIX" in res
-        or "AIX" in res
-        or "SysEx" in res
-        or "ARJ" in res
-        or "Applesoft" in res
-        or "GeoSwath" in res
-        or "ISO-8859" in res
-        or "YAC" in res
-        or "capture file" in res
-        or "COFF" in res
-        or "locale data table" in res
-        or "Ucode" in res
-        or "PDP" in res
-        or "LXT" in res
-        or "Tower" in res
-        or "SGI" in res
-        or "BS" in res
-        or "exe" in res
-        or "curses" in res
-        or "endian" in res
-        or "byte" in res
-        or "ASCII" in res
-    ):
-        return None
-    if "mcrypt" in res:
-        return "mcrypt encrypted data"
-    if "MPEG" in res:
-        return "MPEG stream"
-    if "RLE image" in res:
-        return "RLE image data"
-    if "gzip compressed data" in res:
-        return "gzip compressed data"
-    if "GPG key public" in res:
-        return "GPG public key ring"
-    if "PGP Secret" in res or "PGP\\011Secret" in res:
-        return "PGP Secret key"
-    if "PGP symmetric" in res:
-        return "PGP symmetric key encrypted data"
-    if "Bio-Rad" in res:
-        return "Bio-Rad .PIC Image File"
-    if "Targa" in res:
-        return "Targa image data"
-    return res
+    # None for the descriptions of random bytes, see file_types
+    return classify_magic_description(res)
 
 
 def get_monero_offset_regex() -> re.Pattern:
@@ -476,15 +395,30 @@ class Detector(enum.Enum):
 
 
 class Analyzer:
-    def __init__(self, blockchain: Optional[BLOCKCHAIN], database: Database):
+    def __init__(
+        self, blockchain: Optional[BLOCKCHAIN], database: Database, workers: int = 1
+    ):
+        """
+        :param blockchain: Only analyze the records of this blockchain, all if None.
+        :type blockchain: Optional[BLOCKCHAIN]
+        :param database: Database holding the records and their detections.
+        :type database: Database
+        :param workers: Number of worker processes running the detector.
+        :type workers: int
+        """
         self._blockchain = blockchain
         self._database = database
+        self._workers = workers
 
-    def analyze(self, detector: Detector) -> None:
+    def analyze(
+        self, detector: Detector, record_filter: RecordFilter = RecordFilter()
+    ) -> None:
         detector_func: DetectorFunc
         database_write_func: DatabaseWriteFunc
+        batch_detector_func: Optional[BatchDetectorFunc] = None
         if detector == Detector.native_strings:
             detector_func = native_strings
+            batch_detector_func = native_strings_batch
             database_write_func = self._database.insert_detected_ascii_records
         elif detector == Detector.gnu_strings:
             detector_func = gnu_strings
@@ -525,5 +459,12 @@ class Analyzer:
                 )
 
         self._database.run_detection(
-            detector_func, database_write_func, self._blockchain
+            detector_func,
+            database_write_func,
+            self._blockchain,
+            record_filter,
+            detector.value,
+            self._workers,
+            init_detection_worker,
+            batch_detector_func,
         )
@@ -0,0 +1,213 @@
+"""Insert, scan and aggregation times of the SQLite and DuckDB storage backends
+
+Loads the same synthetic records and detections into a database of every
+backend and times the operations of the parse, analysis and view modes on it.
+Run from the repository root with:
+    python -m benchmarks.backends --records 1000000 --output backends.json
+"""
+
+import argparse
+import io
+import json
+import platform
+import random
+import shutil
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.utxo_decoder import random_bytes
+from database import (
+    BACKEND,
+    BLOCKCHAIN,
+    DATATYPE,
+    CryptoDataRecord,
+    Database,
+    DetectedAsciiPayload,
+    DetectedFilePayload,
+    DetectorPayload,
+)
+
+# Records per inserted batch, the frame size of the parsers
+BATCH_SIZE = 4096
+
+FILE_TYPES = ("PNG image data", "JPEG image data", "PDF document", "GIF image data")
+
+
+def generate_records(
+    records: int, duplicates: float, seed: int
+) -> List[CryptoDataRecord]:
+    """Returns records whose payloads repeat an earlier payload with the given probability"""
+    rng = random.Random(seed)
+    payloads: List[bytes] = []
+    result = []
+    for i in range(records):
+        if len(payloads) > 0 and rng.random() < duplicates:
+            data = rng.choice(payloads)
+        else:
+            data = random_bytes(rng, rng.randint(20, 200))
+            payloads.append(data)
+        result.append(
+            CryptoDataRecord(
+                data,
+                random_bytes(rng, 32).hex(),
+                BLOCKCHAIN.BITCOIN_MAINNET.value,
+                rng.choice((DATATYPE.SCRIPT_SIG, DATATYPE.SCRIPT_PUBKEY)).value,
+                i // 100,
+                rng.randint(0, 3),
+            )
+        )
+    return result
+
+
+def timed(operation: Callable[[], Any]) -> float:
+    """Returns the seconds an operation took, discarding its output"""
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        operation()
+    return round(time.perf_counter() - start, 3)
+
+
+def length_detector(payload: DetectorPayload) -> Optional[DetectedAsciiPayload]:
+    """Cheap stand-in of the string detectors, so the scan dominates the detection time"""
+    if len(payload.data) < 100:
+        return None
+    return DetectedAsciiPayload(
+        payload.txid, payload.data_type, payload.extra_index, len(payload.data)
+    )
+
+
+def run_backend(
+    backend: BACKEND,
+    path: Path,
+    records: List[CryptoDataRecord],
+    deduplicate: bool,
+    seed: int,
+) -> Dict[str, Any]:
+    """Loads the records into a fresh database and times the operations on it
+    :param backend: Storage backend of the database.
+    :type backend: BACKEND
+    :param path: Path of the database, an existing one is replaced.
+    :type path: Path
+    :param records: Records to be inserted.
+    :type records: List[CryptoDataRecord]
+    :param deduplicate: Store every distinct payload once.
+    :type deduplicate: bool
+    :param seed: Seed of the synthetic detections.
+    :type seed: int
+    :return: Seconds per operation and the database size.
+    :rtype: Dict[str, Any]
+    """
+    for existing in path.parent.glob(path.name + "*"):
+        existing.unlink()
+    database = Database(str(path), deduplicate=deduplicate, backend=backend)
+    rng = random.Random(seed)
+    result: Dict[str, Any] = {}
+
+    def insert() -> None:
+        for start in range(0, len(records), BATCH_SIZE):
+            database.insert_records(records[start : start + BATCH_SIZE])
+        database.commit()
+
+    def insert_detections() -> None:
+        sampled = rng.sample(records, len(records) // 10)
+        database.insert_detected_ascii_records(
+            [
+                DetectedAsciiPayload(
+                    record.txid,
+                    record.data_type,
+                    record.extra_index,
+                    rng.randint(4, 200),
+                )
+                for record in sampled
+            ]
+        )
+        database.insert_detected_magic_file_records(
+            [
+                DetectedFilePayload(
+                    record.txid,
+                    record.data_type,
+                    record.extra_index,
+                    rng.choice(FILE_TYPES),
+                )
+                for record in sampled
+            ]
+        )
+
+    def scan() -> None:
+        for _ in database.iter_batches(
+            "SELECT DATA, TXID, DATA_TYPE, EXTRA_INDEX FROM cryptoData", BATCH_SIZE
+        ):
+            pass
+
+    result["insert_s"] = timed(insert)
+    result["insert_rows_per_s"] = round(len(records) / max(result["insert_s"], 1e-9))
+    result["insert_detections_s"] = timed(insert_detections)
+    result["create_indexes_s"] = timed(database.create_indexes)
+    result["record_statistics_s"] = timed(lambda: database.get_record_statistics(None))
+    result["ascii_histogram_s"] = timed(lambda: database.ascii_histogram(None))
+    result["magic_file_histogram_s"] = timed(
+        lambda: database.magic_file_histogram(None)
+    )
+    result["data_of_type_s"] = timed(lambda: database.get_data(DATATYPE.SCRIPT_PUBKEY))
+    result["rebuild_summaries_s"] = timed(database.rebuild_summaries)
+    result["scan_s"] = timed(scan)
+    result["detection_s"] = timed(
+        lambda: database.run_detection(
+            length_detector, database.insert_detected_ascii_records, None
+        )
+    )
+    database.close()
+    result["database_bytes"] = sum(
+        existing.stat().st_size for existing in path.parent.glob(path.name + "*")
+    )
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-b",
+        "--backends",
+        nargs="+",
+        choices=[backend.value for backend in BACKEND],
+        default=[backend.value for backend in BACKEND],
+    )
+    parser.add_argument("-n", "--records", type=int, default=200000)
+    parser.add_argument(
+        "-p", "--duplicates", type=float, default=0.5, help="share of repeated payloads"
+    )
+    parser.add_argument("-d", "--deduplicate", action="store_true")
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="backends.json")
+    args = parser.parse_args()
+
+    records = generate_records(args.records, args.duplicates, args.seed)
+    directory = Path(tempfile.mkdtemp(prefix="backend_benchmark_"))
+    report: Dict[str, Any] = {
+        "arguments": vars(args),
+        "python": platform.python_version(),
+        "results": {},
+    }
+    try:
+        for name in args.backends:
+            backend = BACKEND(name)
+            report["results"][name] = run_backend(
+                backend,
+                directory / ("records." + name),
+                records,
+                args.deduplicate,
+                args.seed,
+            )
+    finally:
+        shutil.rmtree(directory)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Throughput of the detectors of the analysis mode
+
+Loads synthetic records, a share of them holding text or the header of a
+file, into a fresh database and times Analyzer.analyze for every detector and
+number of worker processes. Run from the repository root with:
+    python -m benchmarks.detection --workers 1 2 4 --output detection.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Any, Dict, List
+
+from analyzer import Analyzer, Detector
+from benchmarks.utxo_decoder import random_bytes
+from database import (
+    BACKEND,
+    BLOCKCHAIN,
+    DATATYPE,
+    CryptoDataRecord,
+    Database,
+)
+
+# Records per inserted batch, the frame size of the parsers
+BATCH_SIZE = 4096
+
+FILE_HEADERS = (
+    b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR",
+    b"\xff\xd8\xff\xe0\x00\x10JFIF\x00",
+    b"GIF89a",
+    b"%PDF-1.4\n",
+    b"\x1f\x8b\x08\x00",
+)
+
+WORDS = (b"hello", b"bitcoin", b"block", b"chain", b"message", b"from", b"the")
+
+
+def generate_payload(rng: random.Random, text: float, files: float) -> bytes:
+    """Returns random bytes, text or the header of a file followed by random bytes"""
+    kind = rng.random()
+    if kind < text:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(2, 30))]
+        return random_bytes(rng, rng.randint(0, 8)) + b" ".join(words)
+    if kind < text + files:
+        return rng.choice(FILE_HEADERS) + random_bytes(rng, rng.randint(20, 200))
+    return random_bytes(rng, rng.randint(20, 200))
+
+
+def generate_records(
+    records: int,
+    duplicates: float,
+    text: float,
+    files: float,
+    blockchain: BLOCKCHAIN,
+    seed: int,
+) -> List[CryptoDataRecord]:
+    """Returns records whose payloads repeat an earlier payload with the given probability"""
+    rng = random.Random(seed)
+    payloads: List[bytes] = []
+    result = []
+    for i in range(records):
+        if len(payloads) > 0 and rng.random() < duplicates:
+            data = rng.choice(payloads)
+        else:
+            data = generate_payload(rng, text, files)
+            payloads.append(data)
+        result.append(
+            CryptoDataRecord(
+                data,
+                random_bytes(rng, 32).hex(),
+                blockchain.value,
+                DATATYPE.TX_DATA.value,
+                i // 100,
+                0,
+            )
+        )
+    return result
+
+
+def run_detector(
+    path: Path,
+    records: List[CryptoDataRecord],
+    deduplicate: bool,
+    backend: BACKEND,
+    blockchain: BLOCKCHAIN,
+    detector: Detector,
+    workers: int,
+) -> Dict[str, Any]:
+    """Loads the records into a fresh database and runs a detector over them
+    :param path: Path of the database, an existing one is replaced.
+    :type path: Path
+    :param records: Records to be inserted.
+    :type records: List[CryptoDataRecord]
+    :param deduplicate: Store every distinct payload once.
+    :type deduplicate: bool
+    :param backend: Storage backend of the database.
+    :type backend: BACKEND
+    :param blockchain: Blockchain the records were generated for.
+    :type blockchain: BLOCKCHAIN
+    :param detector: Detector to be timed.
+    :type detector: Detector
+    :param workers: Number of worker processes running the detector.
+    :type workers: int
+    :return: Seconds, records per second and number of detections of the run.
+    :rtype: Dict[str, Any]
+    """
+    for existing in path.parent.glob(path.name + "*"):
+        existing.unlink()
+    with redirect_stdout(io.StringIO()):
+        database = Database(str(path), deduplicate=deduplicate, backend=backend)
+        for start in range(0, len(records), BATCH_SIZE):
+            database.insert_records(records[start : start + BATCH_SIZE])
+        database.commit()
+        started = time.perf_counter()
+        Analyzer(blockchain, database, workers).analyze(detector)
+        seconds = time.perf_counter() - started
+        statistics = database.get_record_statistics(None)
+        database.close()
+    return {
+        "seconds": round(seconds, 3),
+        "records_per_s": round(len(records) / max(seconds, 1e-9)),
+        "detections": statistics.ascii_data_count
+        + statistics.magic_file_data_count
+        + statistics.imghdr_file_data_count,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-t",
+        "--detectors",
+        nargs="+",
+        choices=[detector.value for detector in Detector],
+        default=[detector.value for detector in Detector],
+    )
+    parser.add_argument("-w", "--workers", type=int, nargs="+", default=[1])
+    parser.add_argument("-n", "--records", type=int, default=20000)
+    parser.add_argument(
+        "-p", "--duplicates", type=float, default=0.5, help="share of repeated payloads"
+    )
+    parser.add_argument("--text", type=float, default=0.1, help="share of text")
+    parser.add_argument("--files", type=float, default=0.05, help="share of files")
+    parser.add_argument(
+        "-c",
+        "--coin",
+        choices=("bitcoin_mainnet", "ethereum_mainnet", "monero_mainnet"),
+        default=BLOCKCHAIN.ETHEREUM_MAINNET.value,
+    )
+    parser.add_argument("-d", "--deduplicate", action="store_true")
+    parser.add_argument(
+        "-k",
+        "--backend",
+        choices=[backend.value for backend in BACKEND],
+        default=BACKEND.SQLITE.value,
+    )
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="detection.json")
+    args = parser.parse_args()
+
+    blockchain = BLOCKCHAIN(args.coin)
+    directory = Path(tempfile.mkdtemp(prefix="detection_benchmark_"))
+    report: Dict[str, Any] = {
+        "arguments": vars(args),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "results": {},
+    }
+    records = generate_records(
+        args.records, args.duplicates, args.text, args.files, blockchain, args.seed
+    )
+    try:
+        for name in args.detectors:
+            report["results"][name] = {
+                str(workers): run_detector(
+                    directory / ("records." + args.backend),
+                    records,
+                    args.deduplicate,
+                    BACKEND(args.backend),
+                    blockchain,
+                    Detector(name),
+                    workers,
+                )
+                for workers in args.workers
+            }
+    finally:
+        shutil.rmtree(directory)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
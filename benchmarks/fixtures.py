@@ -0,0 +1,466 @@
+"""Synthetic, reproducible chain data in the on-disk formats the parsers read
+
+Every generator takes a seed, so the same arguments always produce the same
+fixture. Signatures, proofs of work and merkle roots are random bytes, the
+parsers never validate them.
+
+Bitcoin:  <root>/blocks/blk*.dat, xor.dat, index and <root>/chainstate
+Ethereum: <root>/geth/chaindata with the oldest blocks in its ancient freezer
+Monero:   <root>/lmdb with the tx_indices and txs_pruned tables
+"""
+
+import hashlib
+import os
+import random
+import struct
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+import lmdb
+import plyvel
+import rlp
+import snappy
+
+from benchmarks.utxo_decoder import b128_encode, random_bytes, sample_utxos
+from bitcoin_block_reader import (
+    BLOCK_HAVE_DATA,
+    CHAINSTATE_BEST_BLOCK,
+    CHAINSTATE_OBFUSCATE_KEY,
+    xor_bytes,
+)
+from bitcoin_utxo_iterator import Deobfuscator
+from ethereum_leveldb_tables import block_body_key, header_hash_key, header_key
+from ethereum_rlp import Body, Header, Transaction, keccak
+
+REGTEST_MAGIC = bytes.fromhex("fabfb5da")
+# Bitcoin Core starts a new blk file once the current one reaches 128 MiB
+MAX_BLOCKFILE_SIZE = 128 * 1024 * 1024
+BLOCK_VALID_SCRIPTS = 5
+CLIENT_VERSION = 250000
+
+# Share of the oldest blocks moved into the freezer, the rest stay in LevelDB
+ETH_ANCIENT_FRACTION = 0.9
+
+MONERO_TX_VERSION = 2
+MONERO_TXIN_GEN = 0xFF
+MONERO_TXIN_TO_KEY = 0x02
+MONERO_TXOUT_TO_KEY = 0x02
+MONERO_RCT_TYPE_NULL = 0
+MONERO_RCT_TYPE_CLSAG = 5
+MONERO_LMDB_MAP_SIZE = 1 << 34
+
+
+def compact_size(n: int) -> bytes:
+    """Serializes a Bitcoin CompactSize unsigned integer"""
+    if n < 0xFD:
+        return bytes((n,))
+    if n <= 0xFFFF:
+        return b"\xfd" + n.to_bytes(2, "little")
+    if n <= 0xFFFFFFFF:
+        return b"\xfe" + n.to_bytes(4, "little")
+    return b"\xff" + n.to_bytes(8, "little")
+
+
+def push(data: bytes) -> bytes:
+    """Serializes a minimal script data push"""
+    if len(data) < 0x4C:
+        return bytes((len(data),)) + data
+    if len(data) <= 0xFF:
+        return b"\x4c" + bytes((len(data),)) + data
+    return b"\x4d" + len(data).to_bytes(2, "little") + data
+
+
+def double_sha256(data: bytes) -> bytes:
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def leb128_encode(n: int) -> bytes:
+    """Serializes a Monero varint"""
+    out = bytearray()
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def der_signature(rng: random.Random) -> bytes:
+    """A DER encoded ECDSA signature with SIGHASH_ALL"""
+    r = b"\x00" + random_bytes(rng, 32) if rng.random() < 0.5 else random_bytes(rng, 32)
+    s = random_bytes(rng, 32)
+    body = b"\x02" + bytes((len(r),)) + r + b"\x02" + bytes((len(s),)) + s
+    return b"\x30" + bytes((len(body),)) + body + b"\x01"
+
+
+def public_key(rng: random.Random) -> bytes:
+    return bytes((rng.choice((2, 3)),)) + random_bytes(rng, 32)
+
+
+def printable_bytes(rng: random.Random, n: int) -> bytes:
+    return bytes(rng.randint(0x20, 0x7E) for _ in range(n))
+
+
+# An input is its scriptSig and witness stack, weighted roughly like mainnet
+INPUT_TEMPLATES: List[
+    Tuple[int, Callable[[random.Random], Tuple[bytes, List[bytes]]]]
+] = [
+    (35, lambda rng: (push(der_signature(rng)) + push(public_key(rng)), [])),
+    (40, lambda rng: (b"", [der_signature(rng), public_key(rng)])),
+    (
+        10,
+        lambda rng: (
+            push(b"\x00\x14" + random_bytes(rng, 20)),
+            [der_signature(rng), public_key(rng)],
+        ),
+    ),
+    (3, lambda rng: (push(der_signature(rng)), [])),
+    (2, lambda rng: (push(printable_bytes(rng, rng.randint(20, 200))), [])),
+]
+
+OUTPUT_TEMPLATES: List[Tuple[int, Callable[[random.Random], bytes]]] = [
+    (30, lambda rng: b"\x76\xa9\x14" + random_bytes(rng, 20) + b"\x88\xac"),
+    (15, lambda rng: b"\xa9\x14" + random_bytes(rng, 20) + b"\x87"),
+    (25, lambda rng: b"\x00\x14" + random_bytes(rng, 20)),
+    (5, lambda rng: b"\x00\x20" + random_bytes(rng, 32)),
+    (15, lambda rng: b"\x51\x20" + random_bytes(rng, 32)),
+    (5, lambda rng: b"\x6a" + push(printable_bytes(rng, rng.randint(4, 80)))),
+    # 1-of-2 bare multisig with data in place of the second key
+    (
+        2,
+        lambda rng: b"\x51"
+        + push(public_key(rng))
+        + push(b"\x02" + printable_bytes(rng, 32))
+        + b"\x52\xae",
+    ),
+    (3, lambda rng: push(printable_bytes(rng, rng.randint(10, 60))) + b"\x75\x51"),
+]
+
+
+def bitcoin_transaction(rng: random.Random, height: int, coinbase: bool) -> bytes:
+    """Serializes a transaction, in the segwit format if any input has a witness"""
+    inputs: List[Tuple[bytes, bytes, List[bytes]]] = []
+    if coinbase:
+        script_sig = push(height.to_bytes(4, "little")) + push(random_bytes(rng, 8))
+        inputs.append((b"\x00" * 32 + b"\xff" * 4, script_sig, []))
+    else:
+        weights = [weight for weight, _ in INPUT_TEMPLATES]
+        for _ in range(rng.choice((1, 1, 1, 2, 3))):
+            script_sig, witness = rng.choices(INPUT_TEMPLATES, weights)[0][1](rng)
+            outpoint = random_bytes(rng, 32) + rng.randint(0, 3).to_bytes(4, "little")
+            inputs.append((outpoint, script_sig, witness))
+    weights = [weight for weight, _ in OUTPUT_TEMPLATES]
+    outputs = [
+        rng.choices(OUTPUT_TEMPLATES, weights)[0][1](rng)
+        for _ in range(rng.choice((1, 2, 2, 2, 3)))
+    ]
+    segwit = any(witness for _, _, witness in inputs)
+
+    parts = [struct.pack("<i", 2)]
+    if segwit:
+        parts.append(b"\x00\x01")
+    parts.append(compact_size(len(inputs)))
+    for outpoint, script_sig, _ in inputs:
+        parts += [outpoint, compact_size(len(script_sig)), script_sig, b"\xff" * 4]
+    parts.append(compact_size(len(outputs)))
+    for script in outputs:
+        amount = rng.randint(546, 10**9)
+        parts += [struct.pack("<q", amount), compact_size(len(script)), script]
+    if segwit:
+        for _, _, witness in inputs:
+            parts.append(compact_size(len(witness)))
+            for item in witness:
+                parts += [compact_size(len(item)), item]
+    parts.append(b"\x00" * 4)
+    return b"".join(parts)
+
+
+def write_bitcoin_fixture(
+    root: Path, blocks: int, txs_per_block: int, utxos: int, seed: int = 0
+) -> bytes:
+    """Writes a regtest style data directory with obfuscated blk files.
+    :param root: Data directory, the blocks and chainstate folders are created in it.
+    :type root: Path
+    :param blocks: Number of blocks, including the genesis block.
+    :type blocks: int
+    :param txs_per_block: Number of transactions besides the coinbase of a block.
+    :type txs_per_block: int
+    :param utxos: Number of coins in the chainstate.
+    :type utxos: int
+    :param seed: Seed of the generated data.
+    :type seed: int
+    :return: The hash of the chain tip.
+    :rtype: bytes
+    """
+
+    rng = random.Random(seed)
+    blocks_path = root / "blocks"
+    os.makedirs(blocks_path / "index")
+    xor_key = random_bytes(rng, 8)
+    with open(blocks_path / "xor.dat", "wb") as f:
+        f.write(xor_key)
+
+    index = plyvel.DB(str(blocks_path / "index"), create_if_missing=True)
+    file_number = 0
+    data = bytearray()
+
+    def write_blockfile() -> None:
+        with open(blocks_path / ("blk%05d.dat" % file_number), "wb") as f:
+            f.write(xor_bytes(bytes(data), xor_key))
+
+    prev_hash = b"\x00" * 32
+    with index.write_batch() as batch:
+        for height in range(blocks):
+            txs = [bitcoin_transaction(rng, height, True)]
+            if height > 0:
+                txs += [
+                    bitcoin_transaction(rng, height, False)
+                    for _ in range(txs_per_block)
+                ]
+            header = (
+                struct.pack("<i", 0x20000000)
+                + prev_hash
+                + random_bytes(rng, 32)
+                + struct.pack("<III", 1296688602 + height * 600, 0x207FFFFF, height)
+            )
+            block = header + compact_size(len(txs)) + b"".join(txs)
+            if len(data) + 8 + len(block) > MAX_BLOCKFILE_SIZE:
+                write_blockfile()
+                file_number += 1
+                data = bytearray()
+            data += REGTEST_MAGIC + len(block).to_bytes(4, "little")
+            data_pos = len(data)
+            data += block
+
+            block_hash = double_sha256(header)
+            batch.put(
+                b"b" + block_hash,
+                b128_encode(CLIENT_VERSION)
+                + b128_encode(height)
+                + b128_encode(BLOCK_VALID_SCRIPTS | BLOCK_HAVE_DATA)
+                + b128_encode(len(txs))
+                + b128_encode(file_number)
+                + b128_encode(data_pos)
+                + header,
+            )
+            prev_hash = block_hash
+    write_blockfile()
+    index.close()
+
+    obfuscation_key = random_bytes(rng, 8)
+    chainstate = plyvel.DB(str(root / "chainstate"), create_if_missing=True)
+    with chainstate.write_batch() as batch:
+        batch.put(CHAINSTATE_OBFUSCATE_KEY, b"\x08" + obfuscation_key)
+        batch.put(CHAINSTATE_BEST_BLOCK, Deobfuscator(obfuscation_key)(prev_hash))
+        for outpoint, value in sample_utxos(utxos, obfuscation_key, rng):
+            batch.put(outpoint, value)
+    chainstate.close()
+    return prev_hash
+
+
+def ethereum_transaction(rng: random.Random, nonce: int) -> Transaction:
+    """A value transfer, ERC20 call, other contract call or contract creation"""
+    kind = rng.random()
+    to = random_bytes(rng, 20)
+    if kind < 0.4:
+        data = b""
+    elif kind < 0.75:
+        # transfer(address, uint256), skipped by the parser
+        data = (
+            bytes.fromhex("a9059cbb")
+            + b"\x00" * 12
+            + random_bytes(rng, 20)
+            + rng.randint(1, 10**24).to_bytes(32, "big")
+        )
+    elif kind < 0.97:
+        data = random_bytes(rng, 4) + random_bytes(rng, 32 * rng.randint(1, 6))
+    else:
+        to = b""
+        data = random_bytes(rng, rng.randint(200, 4000))
+    return Transaction(
+        nonce,
+        rng.randint(10**9, 10**11),
+        rng.randint(21000, 3 * 10**6),
+        to,
+        rng.randint(0, 10**19),
+        data,
+        rng.choice((27, 28)),
+        rng.getrandbits(256),
+        rng.getrandbits(256),
+    )
+
+
+def write_freezer_table(path: Path, name: str, items: List[bytes]) -> None:
+    """Writes the items snappy compressed into a single data file of a freezer table"""
+    index = bytearray(b"\x00" * 6)  # file 0 and no items deleted from the tail
+    offset = 0
+    with open(path / ("%s.0000.cdat" % name), "wb") as f:
+        for item in items:
+            compressed = snappy.compress(item)
+            f.write(compressed)
+            offset += len(compressed)
+            index += (0).to_bytes(2, "big") + offset.to_bytes(4, "big")
+    with open(path / ("%s.cidx" % name), "wb") as f:
+        f.write(index)
+
+
+def write_ethereum_fixture(
+    root: Path, blocks: int, txs_per_block: int, seed: int = 0
+) -> None:
+    """Writes a geth data directory, the oldest blocks are stored in the freezer.
+    :param root: Data directory, the geth/chaindata folder is created in it.
+    :type root: Path
+    :param blocks: Number of blocks after the genesis block.
+    :type blocks: int
+    :param txs_per_block: Average number of transactions of a block.
+    :type txs_per_block: int
+    :param seed: Seed of the generated data.
+    :type seed: int
+    """
+
+    rng = random.Random(seed)
+    chaindata_path = root / "geth" / "chaindata"
+    ancient_path = chaindata_path / "ancient"
+    os.makedirs(ancient_path)
+    ancient = max(1, int((blocks + 1) * ETH_ANCIENT_FRACTION))
+
+    headers: List[bytes] = []
+    bodies: List[bytes] = []
+    chaindata = plyvel.DB(str(chaindata_path), create_if_missing=True)
+    parent_hash = b"\x00" * 32
+    nonce = 0
+    with chaindata.write_batch() as batch:
+        for number in range(blocks + 1):
+            txs = []
+            if number > 0:
+                for _ in range(rng.randint(0, 2 * txs_per_block)):
+                    txs.append(ethereum_transaction(rng, nonce))
+                    nonce += 1
+            body = rlp.encode(Body(txs, []))
+            # Miners commonly put their client version into the extra data
+            extra = (
+                b"\xd8\x83\x01\x0a\x00\x84geth\x88go1.17.2\x85linux"
+                if rng.random() < 0.8
+                else printable_bytes(rng, rng.randint(0, 32))
+            )
+            header = rlp.encode(
+                Header(
+                    parent_hash,
+                    random_bytes(rng, 32),
+                    random_bytes(rng, 20),
+                    random_bytes(rng, 32),
+                    random_bytes(rng, 32),
+                    random_bytes(rng, 32),
+                    rng.getrandbits(2048),
+                    rng.randint(10**15, 10**16),
+                    number,
+                    30000000,
+                    rng.randint(0, 30000000),
+                    1438269973 + number * 13,
+                    extra,
+                    random_bytes(rng, 32),
+                    random_bytes(rng, 8),
+                )
+            )
+            block_hash = keccak(header)
+            if number < ancient:
+                headers.append(header)
+                bodies.append(body)
+            else:
+                batch.put(header_hash_key(number), block_hash)
+                batch.put(header_key(number, block_hash), header)
+                batch.put(block_body_key(number, block_hash), body)
+            parent_hash = block_hash
+    chaindata.close()
+    write_freezer_table(ancient_path, "headers", headers)
+    write_freezer_table(ancient_path, "bodies", bodies)
+
+
+def monero_extra(rng: random.Random) -> bytes:
+    """tx_extra, mostly in the default format of a tx public key and payment id"""
+    tx_pubkey = b"\x01" + random_bytes(rng, 32)
+    kind = rng.random()
+    if kind < 0.7:
+        return tx_pubkey + b"\x02\x09\x01" + random_bytes(rng, 8)
+    if kind < 0.9:
+        return tx_pubkey
+    if kind < 0.97:
+        # additional public keys of subaddress outputs
+        return tx_pubkey + b"\x04\x02" + random_bytes(rng, 64)
+    nonce = printable_bytes(rng, rng.randint(10, 200))
+    return tx_pubkey + b"\x02" + leb128_encode(len(nonce)) + nonce
+
+
+def monero_transaction(rng: random.Random, height: int, coinbase: bool) -> bytes:
+    """A pruned v2 transaction, the prefix followed by the RingCT base"""
+    parts = [
+        leb128_encode(MONERO_TX_VERSION),
+        leb128_encode(height + 60 if coinbase else 0),
+    ]
+    if coinbase:
+        parts += [b"\x01", bytes((MONERO_TXIN_GEN,)), leb128_encode(height)]
+        outputs = 1
+    else:
+        inputs = rng.randint(1, 2)
+        parts.append(leb128_encode(inputs))
+        for _ in range(inputs):
+            parts += [bytes((MONERO_TXIN_TO_KEY,)), b"\x00", leb128_encode(16)]
+            parts += [leb128_encode(rng.randint(1, 5 * 10**6)) for _ in range(16)]
+            parts.append(random_bytes(rng, 32))  # key image
+        outputs = 2
+    parts.append(leb128_encode(outputs))
+    for _ in range(outputs):
+        amount = rng.randint(10**11, 10**13) if coinbase else 0
+        parts += [
+            leb128_encode(amount),
+            bytes((MONERO_TXOUT_TO_KEY,)),
+            random_bytes(rng, 32),
+        ]
+    extra = monero_extra(rng)
+    parts += [leb128_encode(len(extra)), extra]
+    if coinbase:
+        parts.append(bytes((MONERO_RCT_TYPE_NULL,)))
+    else:
+        parts += [
+            bytes((MONERO_RCT_TYPE_CLSAG,)),
+            leb128_encode(rng.randint(10**7, 10**9)),  # fee
+            random_bytes(rng, 8 * outputs),  # encrypted amounts
+            random_bytes(rng, 32 * outputs),  # output commitments
+        ]
+    return b"".join(parts)
+
+
+def write_monero_fixture(
+    root: Path, blocks: int, txs_per_block: int, seed: int = 0
+) -> None:
+    """Writes the tables of a monerod LMDB read by the parser.
+    :param root: Data directory, the lmdb folder is created in it.
+    :type root: Path
+    :param blocks: Number of blocks.
+    :type blocks: int
+    :param txs_per_block: Average number of transactions besides the coinbase of a block.
+    :type txs_per_block: int
+    :param seed: Seed of the generated data.
+    :type seed: int
+    """
+
+    rng = random.Random(seed)
+    os.makedirs(root / "lmdb")
+    env = lmdb.open(
+        str(root / "lmdb"), subdir=True, max_dbs=10, map_size=MONERO_LMDB_MAP_SIZE
+    )
+    index_db = env.open_db(b"tx_indices", integerkey=True, dupsort=True, dupfixed=True)
+    tx_db = env.open_db(b"txs_pruned", integerkey=True)
+    tx_id = 0
+    with env.begin(write=True) as txn:
+        for height in range(blocks):
+            coinbase = True
+            for _ in range(1 + rng.randint(0, 2 * txs_per_block)):
+                blob = monero_transaction(rng, height, coinbase)
+                coinbase = False
+                tx_hash = hashlib.sha3_256(blob).digest()
+                # All indices are duplicates of the zero key, sorted by tx hash
+                tx_index = tx_hash + struct.pack("<QQQ", tx_id, 0, height)
+                txn.put(struct.pack("<Q", 0), tx_index, db=index_db)
+                txn.put(struct.pack("<Q", tx_id), blob, db=tx_db)
+                tx_id += 1
+    env.close()
@@ -0,0 +1,261 @@
+"""End to end throughput of the parsers on synthetic chains
+
+Generates reproducible Bitcoin, Ethereum and Monero fixtures (see
+benchmarks.fixtures), runs every parser into a fresh database and writes the
+wall time, counters and per stage times of each run as JSON. Run from the
+repository root with:
+    python -m benchmarks.parsers --output parsers.json
+Fixtures are generated into a temporary directory, or into --fixtures where
+they are reused by later runs with the same fixture arguments.
+"""
+
+import argparse
+import io
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmarks.fixtures import (
+    write_bitcoin_fixture,
+    write_ethereum_fixture,
+    write_monero_fixture,
+)
+from bitcoin_parser import BitcoinParser
+from bitcoin_utxo_iterator import UTXOIterator
+from database import BACKEND, BLOCKCHAIN, PARSESTAGE, Database
+from ethereum_parser import EthereumParser
+from parser import DataExtractor
+
+COINS = ("bitcoin", "ethereum", "monero")
+
+
+def generate_fixture(
+    root: Path, parameters: Dict[str, int], generate: Callable[[Path], Any]
+) -> float:
+    """Generates a fixture unless it exists already with the same parameters,
+    returns the seconds it took"""
+    parameters_path = Path(str(root) + ".json")
+    if root.exists():
+        if parameters_path.exists():
+            with open(parameters_path) as f:
+                if json.load(f) == parameters:
+                    return 0.0
+        shutil.rmtree(root)
+    start = time.perf_counter()
+    generate(root)
+    seconds = time.perf_counter() - start
+    with open(parameters_path, "w") as f:
+        json.dump(parameters, f)
+    return seconds
+
+
+def check_checkpoints(
+    database: Database,
+    blockchain: BLOCKCHAIN,
+    checkpoints: List[Tuple[PARSESTAGE, int]],
+) -> None:
+    """Raises if the parser returned without committing the final checkpoints"""
+    for stage, height in checkpoints:
+        checkpoint = database.get_checkpoint(blockchain, stage)
+        if checkpoint != height:
+            raise BaseException(
+                "checkpoint of {} is {}, expected {}".format(
+                    stage.value, checkpoint, height
+                )
+            )
+
+
+def run_parser(
+    parser: DataExtractor,
+    blockchain: BLOCKCHAIN,
+    database_path: Path,
+    checkpoints: List[Tuple[PARSESTAGE, int]],
+    bulk_load: bool,
+    deduplicate: bool,
+    backend: BACKEND,
+    verbose: bool,
+) -> Dict[str, Any]:
+    """Parses a fixture into a fresh database
+    :param parser: Parser of the fixture.
+    :type parser: DataExtractor
+    :param blockchain: Blockchain the parser was constructed with.
+    :type blockchain: BLOCKCHAIN
+    :param database_path: Path of the database, an existing one is replaced.
+    :type database_path: Path
+    :param checkpoints: Checkpoints stored when the parser returns.
+    :type checkpoints: List[Tuple[PARSESTAGE, int]]
+    :param bulk_load: Open the database in bulk load mode.
+    :type bulk_load: bool
+    :param deduplicate: Store every distinct payload once.
+    :type deduplicate: bool
+    :param backend: Storage backend of the database.
+    :type backend: BACKEND
+    :param verbose: Print the output of the parser.
+    :type verbose: bool
+    :return: Wall times, counters, stage times and database size of the run.
+    :rtype: Dict[str, Any]
+    """
+
+    for path in database_path.parent.glob(database_path.name + "*"):
+        path.unlink()
+    database = Database(
+        str(database_path), bulk_load, deduplicate=deduplicate, backend=backend
+    )
+    log = sys.stdout if verbose else io.StringIO()
+    start = time.perf_counter()
+    with redirect_stdout(log):
+        parser.parse_and_extract_blockchain(database)
+    end = time.perf_counter()
+    # The parser returns once its DatabaseWriter committed every record
+    check_checkpoints(database, blockchain, checkpoints)
+
+    metrics = parser._metrics  # type: ignore
+    seconds = end - start
+    return {
+        "seconds": round(seconds, 3),
+        "blocks_per_s": round(metrics.counters["blocks"] / seconds, 1),
+        "txs_per_s": round(metrics.counters["txs"] / seconds, 1),
+        "counters": dict(metrics.counters),
+        "stage_seconds": {
+            stage: round(value, 3) for stage, value in metrics.stage_seconds.items()
+        },
+        "database_bytes": sum(
+            path.stat().st_size
+            for path in database_path.parent.glob(database_path.name + "*")
+        ),
+    }
+
+
+def run_utxo_iterator(root: Path) -> Dict[str, Any]:
+    """Iterates the chainstate of the Bitcoin fixture, decoding every and only the uncompressed UTXOs"""
+    result: Dict[str, Any] = {}
+    for name, skip_compressed in (("all", False), ("skip_compressed", True)):
+        iterator = UTXOIterator(root, "chainstate", skip_compressed=skip_compressed)
+        start = time.perf_counter()
+        decoded = sum(1 for _ in iterator)
+        seconds = time.perf_counter() - start
+        utxos = decoded + sum(iterator.compressed_counts.values())
+        result[name] = {
+            "seconds": round(seconds, 3),
+            "utxos": utxos,
+            "decoded": decoded,
+            "utxos_per_s": round(utxos / seconds, 1),
+            "bytes_read": iterator.bytes_read,
+        }
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-c", "--coins", nargs="+", choices=COINS, default=COINS)
+    parser.add_argument("-b", "--blocks", type=int, default=2000)
+    parser.add_argument("-t", "--txs", type=int, default=20, help="txs per block")
+    parser.add_argument("-u", "--utxos", type=int, default=100000)
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    parser.add_argument("-l", "--bulk-load", action="store_true")
+    parser.add_argument("-d", "--deduplicate", action="store_true")
+    parser.add_argument(
+        "-k",
+        "--backend",
+        choices=[backend.value for backend in BACKEND],
+        default=BACKEND.SQLITE.value,
+    )
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-f", "--fixtures", help="directory of reused fixtures")
+    parser.add_argument("-o", "--output", default="parsers.json")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    fixtures = Path(args.fixtures or tempfile.mkdtemp(prefix="parser_benchmark_"))
+    fixtures.mkdir(parents=True, exist_ok=True)
+    report: Dict[str, Any] = {
+        "arguments": vars(args),
+        "python": platform.python_version(),
+        "fixture_seconds": {},
+        "results": {},
+    }
+
+    if "bitcoin" in args.coins:
+        root = fixtures / "bitcoin"
+        report["fixture_seconds"]["bitcoin"] = generate_fixture(
+            root,
+            {
+                "blocks": args.blocks,
+                "txs": args.txs,
+                "utxos": args.utxos,
+                "seed": args.seed,
+            },
+            lambda path: write_bitcoin_fixture(
+                path, args.blocks, args.txs, args.utxos, args.seed
+            ),
+        )
+        report["results"]["bitcoin"] = run_parser(
+            BitcoinParser(root, BLOCKCHAIN.BITCOIN_REGTEST, args.workers),
+            BLOCKCHAIN.BITCOIN_REGTEST,
+            fixtures / "bitcoin.db",
+            [(PARSESTAGE.BLOCKS, args.blocks - 1)],
+            args.bulk_load,
+            args.deduplicate,
+            BACKEND(args.backend),
+            args.verbose,
+        )
+        report["results"]["utxo_iterator"] = run_utxo_iterator(root)
+
+    if "ethereum" in args.coins:
+        root = fixtures / "ethereum"
+        report["fixture_seconds"]["ethereum"] = generate_fixture(
+            root,
+            {"blocks": args.blocks, "txs": args.txs, "seed": args.seed},
+            lambda path: write_ethereum_fixture(path, args.blocks, args.txs, args.seed),
+        )
+        report["results"]["ethereum"] = run_parser(
+            EthereumParser(root, BLOCKCHAIN.ETHEREUM_MAINNET),
+            BLOCKCHAIN.ETHEREUM_MAINNET,
+            fixtures / "ethereum.db",
+            [(PARSESTAGE.BLOCKS, args.blocks), (PARSESTAGE.HEADERS, args.blocks)],
+            args.bulk_load,
+            args.deduplicate,
+            BACKEND(args.backend),
+            args.verbose,
+        )
+
+    if "monero" in args.coins:
+        root = fixtures / "monero"
+        report["fixture_seconds"]["monero"] = generate_fixture(
+            root,
+            {"blocks": args.blocks, "txs": args.txs, "seed": args.seed},
+            lambda path: write_monero_fixture(path, args.blocks, args.txs, args.seed),
+        )
+        try:
+            from monero_parser import MoneroParser
+        except ImportError as e:
+            report["results"]["monero"] = {"skipped": str(e)}
+        else:
+            report["results"]["monero"] = run_parser(
+                MoneroParser(root, BLOCKCHAIN.MONERO_STAGENET),
+                BLOCKCHAIN.MONERO_STAGENET,
+                fixtures / "monero.db",
+                [(PARSESTAGE.BLOCKS, args.blocks - 1)],
+                args.bulk_load,
+                args.deduplicate,
+                BACKEND(args.backend),
+                args.verbose,
+            )
+
+    for coin, seconds in report["fixture_seconds"].items():
+        report["fixture_seconds"][coin] = round(seconds, 3)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    if args.fixtures is None:
+        shutil.rmtree(fixtures)
+
+
+if __name__ == "__main__":
+    main()
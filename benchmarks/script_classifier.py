@@ -0,0 +1,183 @@
+"""Microbenchmark of the single pass script classifier against the predicate chain
+
+Run from the repository root with:
+    python -m benchmarks.script_classifier
+"""
+
+import argparse
+import os
+import random
+import timeit
+from typing import Callable, List
+
+from bitcoin.core import CScript
+
+from bitcoin_parser import (
+    is_p2ms_output,
+    is_p2pk_output,
+    is_p2pk_scriptsig,
+    is_p2pkh_output,
+    is_p2pkh_scriptsig,
+    is_p2sh_output,
+    is_p2sh_p2ms_scriptsig,
+    is_p2sh_p2wpkh_scriptsig,
+    is_p2tr_output,
+    is_p2wpkh_output,
+    is_p2wsh_output,
+)
+from bitcoin_script_classifier import (
+    STANDARD_SCRIPT_TYPES,
+    classify_output,
+    classify_scriptsig,
+)
+
+
+def push(data: bytes) -> bytes:
+    assert len(data) < 0x4C
+    return bytes([len(data)]) + data
+
+
+def signature() -> bytes:
+    r = os.urandom(32)
+    s = os.urandom(32)
+    return bytes([0x30, 68, 0x02, 32]) + r + bytes([0x02, 32]) + s + b"\x01"
+
+
+def pubkey() -> bytes:
+    return b"\x02" + os.urandom(32)
+
+
+def sample_outputs(n: int) -> List[bytes]:
+    """Output scripts roughly following the mainnet template distribution"""
+    templates = [
+        (30, lambda: b"\x00\x14" + os.urandom(20)),  # p2wpkh
+        (25, lambda: b"\x76\xa9\x14" + os.urandom(20) + b"\x88\xac"),  # p2pkh
+        (15, lambda: b"\x51\x20" + os.urandom(32)),  # p2tr
+        (15, lambda: b"\xa9\x14" + os.urandom(20) + b"\x87"),  # p2sh
+        (8, lambda: b"\x00\x20" + os.urandom(32)),  # p2wsh
+        (3, lambda: push(pubkey()) + b"\xac"),  # p2pk
+        (2, lambda: b"\x51" + push(pubkey()) + push(pubkey()) + b"\x52\xae"),  # p2ms
+        (2, lambda: b"\x6a" + push(os.urandom(40))),  # null data
+    ]
+    weights = [weight for weight, _ in templates]
+    return [
+        random.choices(templates, weights)[0][1]() for _ in range(n)  # type: ignore
+    ]
+
+
+def sample_scriptsigs(n: int) -> List[bytes]:
+    templates = [
+        (60, lambda: b""),  # segwit spends
+        (25, lambda: push(signature()) + push(pubkey())),  # p2pkh
+        (8, lambda: b"\x16\x00\x14" + os.urandom(20)),  # p2sh(p2wpkh)
+        (3, lambda: push(signature())),  # p2pk
+        (
+            2,
+            lambda: b"\x00"
+            + push(signature())
+            + b"\x47"
+            + b"\x51"
+            + push(pubkey())
+            + push(pubkey())
+            + b"\x52\xae",
+        ),  # p2sh(p2ms)
+        (2, lambda: push(os.urandom(40))),  # nonstandard
+    ]
+    weights = [weight for weight, _ in templates]
+    return [
+        random.choices(templates, weights)[0][1]() for _ in range(n)  # type: ignore
+    ]
+
+
+def predicate_chain_output_is_standard(raw: bytes) -> bool:
+    cscript = CScript(raw)
+    for predicate in (
+        is_p2pkh_output,
+        is_p2pk_output,
+        is_p2sh_output,
+        is_p2ms_output,
+        is_p2wpkh_output,
+        is_p2wsh_output,
+        is_p2tr_output,
+    ):
+        try:
+            if predicate(cscript):
+                return True
+        except BaseException:
+            pass
+    return False
+
+
+def predicate_chain_scriptsig_is_standard(raw: bytes) -> bool:
+    if len(raw) < 2:
+        return True
+    cscript = CScript(raw)
+    for predicate in (
+        is_p2pk_scriptsig,
+        is_p2pkh_scriptsig,
+        is_p2sh_p2ms_scriptsig,
+        is_p2sh_p2wpkh_scriptsig,
+    ):
+        try:
+            if predicate(cscript):
+                return True
+        except BaseException:
+            pass
+    return False
+
+
+def classifier_output_is_standard(raw: bytes) -> bool:
+    return classify_output(raw) in STANDARD_SCRIPT_TYPES
+
+
+def classifier_scriptsig_is_standard(raw: bytes) -> bool:
+    return classify_scriptsig(raw) in STANDARD_SCRIPT_TYPES
+
+
+def measure(func: Callable[[bytes], bool], scripts: List[bytes], repeat: int) -> float:
+    """Returns the best throughput in scripts per second"""
+    best = min(
+        timeit.repeat(lambda: [func(s) for s in scripts], number=1, repeat=repeat)
+    )
+    return len(scripts) / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--scripts", type=int, default=100000)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(0)
+    outputs = sample_outputs(args.scripts)
+    scriptsigs = sample_scriptsigs(args.scripts)
+
+    for name, scripts, old, new in (
+        (
+            "outputs",
+            outputs,
+            predicate_chain_output_is_standard,
+            classifier_output_is_standard,
+        ),
+        (
+            "inputs",
+            scriptsigs,
+            predicate_chain_scriptsig_is_standard,
+            classifier_scriptsig_is_standard,
+        ),
+    ):
+        disagreements = sum(1 for s in scripts if old(s) != new(s))
+        old_rate = measure(old, scripts, args.repeat)
+        new_rate = measure(new, scripts, args.repeat)
+        print(
+            name,
+            "predicate chain: %.0f scripts/s" % old_rate,
+            "classifier: %.0f scripts/s" % new_rate,
+            "speedup: %.1fx" % (new_rate / old_rate),
+            "disagreements:",
+            disagreements,
+        )
+
+
+if __name__ == "__main__":
+    main()
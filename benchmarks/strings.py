@@ -0,0 +1,188 @@
+"""Cross-check and throughput of the string detectors
+
+Runs the in-process gnu_strings detector and the former implementation, which
+started strings -n 10 for every payload, over the same synthetic payloads and
+a set of edge cases. native_strings runs over every payload and in batches of
+a page of records, as in the analysis. Raises if any detection differs and
+writes the payloads per second of every detector as JSON. Requires GNU
+strings on the PATH. Run from the repository root with:
+    python -m benchmarks.strings --payloads 100000 --output strings.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+from typing import Any, Dict, List, Optional
+
+from analyzer import gnu_strings, native_strings, native_strings_batch
+from benchmarks.detection import generate_payload
+from database import (
+    DATATYPE,
+    SCAN_PAGE_SIZE,
+    DetectedAsciiPayload,
+    DetectorPayload,
+)
+
+# Minimum string length of the detectors
+MIN_LENGTH = 10
+
+EDGE_CASES = (
+    b"",
+    b"abcdefghi",
+    b"abcdefghij",
+    b"\x00abcdefghij\x00",
+    b"  abcdefghij",
+    b"abcdefghij\t\t",
+    b"\tabcdefghi\t",
+    b" \t \t \t \t \t ",
+    b"abcdefghij\x00klmnopqrst\x01uvwxyz",
+    b"abcdefghij\nklmnopqrst",
+    b"abcdefghij\rklmnopqrst\x0b\x0c",
+    b"\x80\xff\xe4\xb8\xad\xe6\x96\x87abcdefghij\xc3\xa9",
+    b"~~~~~~~~~~~ \x7f !!!!!!!!!!",
+    bytes(range(256)) * 2,
+)
+
+
+def strings_per_row(
+    payload: DetectorPayload, min: int = MIN_LENGTH
+) -> Optional[DetectedAsciiPayload]:
+    """The former gnu_strings detector, starting strings for every payload"""
+    cmd = "strings -n {}".format(min)
+    process = subprocess.Popen(
+        cmd,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        stdin=subprocess.PIPE,
+    )
+    assert process.stdin is not None
+    process.stdin.write(payload.data)
+    output = process.communicate()[0]
+    output_str = output.decode("ascii").strip()
+    length = len(output_str)
+    if length < min:
+        return None
+    return DetectedAsciiPayload(
+        payload.txid, payload.data_type, payload.extra_index, length
+    )
+
+
+def generate_payloads(payloads: int, text: float, seed: int) -> List[DetectorPayload]:
+    """Returns the edge cases followed by synthetic payloads"""
+    rng = random.Random(seed)
+    data = list(EDGE_CASES) + [
+        generate_payload(rng, text, 0.0) for _ in range(payloads)
+    ]
+    return [
+        DetectorPayload("tx" + str(i), DATATYPE.TX_DATA.value, 0, payload)
+        for i, payload in enumerate(data)
+    ]
+
+
+def timed_detector(detector: Any, payloads: List[DetectorPayload]) -> Dict[str, Any]:
+    """Runs a detector over the payloads, returns its results and throughput"""
+    start = time.perf_counter()
+    results = [detector(payload) for payload in payloads]
+    seconds = time.perf_counter() - start
+    return {
+        "results": results,
+        "seconds": round(seconds, 3),
+        "payloads_per_s": round(len(payloads) / max(seconds, 1e-9)),
+    }
+
+
+def timed_batch_detector(
+    detector: Any, payloads: List[DetectorPayload]
+) -> Dict[str, Any]:
+    """Runs a batch detector over pages of the payloads, returns its results and throughput"""
+    start = time.perf_counter()
+    results = []
+    for page in range(0, len(payloads), SCAN_PAGE_SIZE):
+        results.extend(detector(payloads[page : page + SCAN_PAGE_SIZE]))
+    seconds = time.perf_counter() - start
+    return {
+        "results": results,
+        "seconds": round(seconds, 3),
+        "payloads_per_s": round(len(payloads) / max(seconds, 1e-9)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--payloads", type=int, default=100000)
+    parser.add_argument(
+        "-r",
+        "--reference-payloads",
+        type=int,
+        default=2000,
+        help="payloads cross-checked against strings, which runs once per payload",
+    )
+    parser.add_argument("--text", type=float, default=0.3, help="share of text")
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="strings.json")
+    args = parser.parse_args()
+
+    payloads = generate_payloads(args.payloads, args.text, args.seed)
+    checked = payloads[: len(EDGE_CASES) + args.reference_payloads]
+    reference = timed_detector(strings_per_row, checked)
+    in_process = timed_detector(gnu_strings, checked)
+    mismatches = [
+        (payload.data.hex(), expected, result)
+        for payload, expected, result in zip(
+            checked, reference["results"], in_process["results"]
+        )
+        if expected != result
+    ]
+
+    report: Dict[str, Any] = {
+        "arguments": vars(args),
+        "python": platform.python_version(),
+        "checked_payloads": len(checked),
+        "mismatches": len(mismatches),
+        "results": {},
+    }
+    report["results"]["strings_per_row"] = reference
+    for name, detector in (
+        ("gnu_strings", gnu_strings),
+        ("native_strings", native_strings),
+    ):
+        report["results"][name] = timed_detector(detector, payloads)
+    report["results"]["native_strings_batch"] = timed_batch_detector(
+        native_strings_batch, payloads
+    )
+    batch_mismatches = sum(
+        expected != result
+        for expected, result in zip(
+            report["results"]["native_strings"]["results"],
+            report["results"]["native_strings_batch"]["results"],
+        )
+    )
+    report["batch_mismatches"] = batch_mismatches
+    for result in report["results"].values():
+        result["detections"] = sum(
+            detected is not None for detected in result.pop("results")
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    if batch_mismatches > 0:
+        raise BaseException(
+            "native_strings_batch differs from native_strings for {} payloads".format(
+                batch_mismatches
+            )
+        )
+    if len(mismatches) > 0:
+        raise BaseException(
+            "gnu_strings differs from strings -n {} for {} payloads, e.g. {}".format(
+                MIN_LENGTH, len(mismatches), mismatches[0]
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
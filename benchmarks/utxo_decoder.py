@@ -0,0 +1,189 @@
+"""Throughput of the bytes based chainstate UTXO decoder against the hex string decoder
+
+Run from the repository root with:
+    python -m benchmarks.utxo_decoder
+or on the first UTXOs of a (copied, Bitcoin Core must not be running) chainstate:
+    python -m benchmarks.utxo_decoder --chainstate ~/.bitcoin/chainstate
+"""
+
+import argparse
+import os
+import random
+import timeit
+from binascii import hexlify
+from typing import Callable, List, Optional, Tuple
+
+import plyvel
+
+from bitcoin_utxo_iterator import (
+    NSPECIALSCRIPTS,
+    Deobfuscator,
+    decode_utxo,
+    decode_utxo_record,
+    deobfuscate_value,
+    read_obfuscation_key,
+)
+
+RawUTXO = Tuple[bytes, bytes]
+
+
+def b128_encode(n: int) -> bytes:
+    """Inverse of bitcoin_block_reader.read_varint"""
+    out = [n & 0x7F]
+    n >>= 7
+    while n:
+        n -= 1
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    return bytes(reversed(out))
+
+
+def txout_compress(n: int) -> int:
+    """Inverse of bitcoin_utxo_iterator.txout_decompress"""
+    if n == 0:
+        return 0
+    e = 0
+    while n % 10 == 0 and e < 9:
+        n //= 10
+        e += 1
+    if e < 9:
+        d = n % 10
+        n //= 10
+        return 1 + (n * 9 + d - 1) * 10 + e
+    return 1 + (n - 1) * 10 + 9
+
+
+def random_bytes(rng: random.Random, n: int) -> bytes:
+    """Reproducible replacement of os.urandom"""
+    return rng.getrandbits(8 * n).to_bytes(n, "little") if n > 0 else b""
+
+
+def sample_utxos(
+    n: int, key: bytes, rng: Optional[random.Random] = None
+) -> List[RawUTXO]:
+    """Obfuscated chainstate entries roughly following the mainnet script distribution"""
+    if rng is None:
+        rng = random.Random(0)
+    templates = [
+        (30, lambda: (0, random_bytes(rng, 20))),  # compressed p2pkh
+        (20, lambda: (1, random_bytes(rng, 20))),  # compressed p2sh
+        (3, lambda: (2, b"\x02" + random_bytes(rng, 32))),  # compressed p2pk
+        (25, lambda: (None, b"\x00\x14" + random_bytes(rng, 20))),  # p2wpkh
+        (15, lambda: (None, b"\x51\x20" + random_bytes(rng, 32))),  # p2tr
+        (5, lambda: (None, b"\x00\x20" + random_bytes(rng, 32))),  # p2wsh
+        (2, lambda: (None, b"\x6a" + random_bytes(rng, rng.randint(1, 80)))),
+    ]
+    weights = [weight for weight, _ in templates]
+    deobfuscate = Deobfuscator(key)
+    utxos: List[RawUTXO] = []
+    for _ in range(n):
+        out_type, script = rng.choices(templates, weights)[0][1]()  # type: ignore
+        if out_type is None:
+            out_type = len(script) + NSPECIALSCRIPTS
+            payload = b128_encode(out_type) + script
+        elif out_type < 2:
+            payload = b128_encode(out_type) + script
+        else:
+            # The type byte of a compressed public key is also its out_type
+            payload = script
+        amount = rng.choice((546, 10000, 100000000, rng.randint(1, 2**40)))
+        height = rng.randint(0, 900000)
+        value = (
+            b128_encode(height * 2 + (rng.random() < 0.01))
+            + b128_encode(txout_compress(amount))
+            + payload
+        )
+        outpoint = b"C" + random_bytes(rng, 32) + b128_encode(rng.randint(0, 300))
+        utxos.append((outpoint, deobfuscate(value)))
+    return utxos
+
+
+def read_utxos(path: str, n: int) -> Tuple[List[RawUTXO], Optional[bytes]]:
+    db = plyvel.DB(os.path.expanduser(path), compression=None)
+    key = read_obfuscation_key(db)
+    utxos: List[RawUTXO] = []
+    for entry in db.iterator(prefix=b"C"):
+        utxos.append(entry)
+        if len(utxos) == n:
+            break
+    db.close()
+    return utxos, key
+
+
+def hex_path(utxos: List[RawUTXO], key: Optional[bytes]) -> list:
+    hex_key = hexlify(key) if key is not None else None
+    results = []
+    for outpoint, o_value in utxos:
+        value = (
+            deobfuscate_value(hex_key, hexlify(o_value))
+            if hex_key is not None
+            else hexlify(o_value)
+        )
+        results.append(decode_utxo(value, hexlify(outpoint)))
+    return results
+
+
+def bytes_path(utxos: List[RawUTXO], key: Optional[bytes]) -> list:
+    if key is None:
+        return [decode_utxo_record(outpoint, value) for outpoint, value in utxos]
+    deobfuscate = Deobfuscator(key)
+    return [
+        decode_utxo_record(outpoint, deobfuscate(value)) for outpoint, value in utxos
+    ]
+
+
+def measure(
+    func: Callable[[List[RawUTXO], Optional[bytes]], list],
+    utxos: List[RawUTXO],
+    key: Optional[bytes],
+    repeat: int,
+) -> float:
+    """Returns the best throughput in UTXOs per second"""
+    best = min(timeit.repeat(lambda: func(utxos, key), number=1, repeat=repeat))
+    return len(utxos) / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--utxos", type=int, default=100000)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-c", "--chainstate", help="read the UTXOs from a chainstate")
+    args = parser.parse_args()
+
+    key: Optional[bytes]
+    if args.chainstate is not None:
+        utxos, key = read_utxos(args.chainstate, args.utxos)
+    else:
+        rng = random.Random(0)
+        key = random_bytes(rng, 8)
+        utxos = sample_utxos(args.utxos, key, rng)
+
+    mismatches = 0
+    for old, new in zip(hex_path(utxos, key), bytes_path(utxos, key)):
+        # The hex decoder returns str after a de-obfuscation and bytes otherwise
+        old_data = old["out"]["data"]
+        if isinstance(old_data, bytes):
+            old_data = old_data.decode()
+        if (
+            bytes.fromhex(old["tx_id"].decode())[::-1].hex() != new.txid
+            or old["index"] != new.index
+            or old["height"] != new.height
+            or old["out"]["amount"] != new.amount
+            or old["out"]["out_type"] != new.out_type
+            or old_data != new.script.hex()
+        ):
+            mismatches += 1
+
+    old_rate = measure(hex_path, utxos, key, args.repeat)
+    new_rate = measure(bytes_path, utxos, key, args.repeat)
+    print(
+        "hex decoder: %.0f utxos/s" % old_rate,
+        "bytes decoder: %.0f utxos/s" % new_rate,
+        "speedup: %.1fx" % (new_rate / old_rate),
+        "mismatches:",
+        mismatches,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,555 @@
+# Native reader for the Bitcoin Core blocks/blk*.dat files. The block index
+# serialization is defined in
+# https://github.com/bitcoin/bitcoin/blob/v28.0/src/chain.h#L386-L424
+# and the block file obfuscation in
+# https://github.com/bitcoin/bitcoin/blob/v28.0/src/node/blockstorage.cpp#L1164-L1198
+#
+# The resolved best chain is cached in a compact binary file:
+#
+#   header: magic (8 bytes) | tip block hash (32 bytes) | block count (u32)
+#   entry:  block hash (32 bytes) | file number (u32) | data position (u32) | size (u32)
+#
+# with one entry per height, so later runs only have to follow the chain from
+# the current tip back to the cached part instead of reading the whole index.
+
+import hashlib
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import plyvel
+
+# Block status flags of the block index entries
+BLOCK_HAVE_DATA = 8
+BLOCK_HAVE_UNDO = 16
+BLOCK_FAILED_MASK = 32 | 64
+
+BLOCK_HEADER_SIZE = 80
+XOR_KEY_SIZE = 8
+
+BLOCK_INDEX_CACHE_MAGIC = b"BLKIDX01"
+BLOCK_INDEX_CACHE_HEADER = struct.Struct("<8s32sI")
+BLOCK_INDEX_CACHE_ENTRY = struct.Struct("<32sIII")
+
+# Chainstate key of the obfuscation key and of the hash of the best block, see
+# https://github.com/bitcoin/bitcoin/blob/v28.0/src/txdb.cpp#L22-L27
+CHAINSTATE_OBFUSCATE_KEY = b"\x0e\x00obfuscate_key"
+CHAINSTATE_BEST_BLOCK = b"B"
+
+
+class BlockLocation(NamedTuple):
+    """Position of a block within the blk*.dat files"""
+
+    height: int
+    block_hash: bytes
+    file_number: int
+    data_pos: int
+    size: int  # -1 if the size has to be read from the block file
+
+
+class BlockTxInput(NamedTuple):
+    script_sig: memoryview
+
+
+class BlockTxOutput(NamedTuple):
+    value: int
+    script_pubkey: memoryview
+
+
+class BlockTransaction(NamedTuple):
+    txid: str
+    inputs: List[BlockTxInput]
+    outputs: List[BlockTxOutput]
+
+
+class Block(NamedTuple):
+    height: int
+    block_hash: str
+    size: int
+    transactions: List[BlockTransaction]
+
+
+def read_varint(data: bytes, offset: int = 0) -> Tuple[int, int]:
+    """Reads a MSB base-128 varint as used by the Bitcoin Core LevelDB serialization.
+    :param data: Serialized data containing the varint.
+    :type data: bytes
+    :param offset: Offset of the first byte of the varint.
+    :type offset: int
+    :return: The decoded value and the offset of the byte following the varint.
+    :rtype: Tuple[int, int]
+    """
+
+    n = 0
+    while True:
+        d = data[offset]
+        offset += 1
+        n = n << 7 | d & 0x7F
+        if d & 0x80:
+            n += 1
+        else:
+            return n, offset
+
+
+def read_compact_size(data: memoryview, offset: int) -> Tuple[int, int]:
+    """Reads a CompactSize integer as used by the Bitcoin p2p serialization.
+    :param data: Serialized data containing the integer.
+    :type data: memoryview
+    :param offset: Offset of the first byte of the integer.
+    :type offset: int
+    :return: The decoded value and the offset of the byte following the integer.
+    :rtype: Tuple[int, int]
+    """
+
+    n = data[offset]
+    if n < 0xFD:
+        return n, offset + 1
+    if n == 0xFD:
+        return int.from_bytes(data[offset + 1 : offset + 3], "little"), offset + 3
+    if n == 0xFE:
+        return int.from_bytes(data[offset + 1 : offset + 5], "little"), offset + 5
+    return int.from_bytes(data[offset + 1 : offset + 9], "little"), offset + 9
+
+
+def xor_bytes(data: bytes, key: bytes, offset: int = 0) -> bytes:
+    """XORs data with a repeating key in a single big integer operation.
+    :param data: Obfuscated data.
+    :type data: bytes
+    :param key: Repeating obfuscation key.
+    :type key: bytes
+    :param offset: Position of the first data byte relative to the start of the key stream.
+    :type offset: int
+    :return: The de-obfuscated data.
+    :rtype: bytes
+    """
+
+    length = len(data)
+    start = offset % len(key)
+    rotated_key = key[start:] + key[:start]
+    extended_key = (rotated_key * (length // len(key) + 1))[:length]
+    return (
+        int.from_bytes(data, "little") ^ int.from_bytes(extended_key, "little")
+    ).to_bytes(length, "little")
+
+
+def parse_block_index_entry(value: bytes) -> Tuple[int, int, int, int, bytes]:
+    """Parses a serialized CDiskBlockIndex from the blocks/index LevelDB.
+    :param value: Serialized block index entry.
+    :type value: bytes
+    :return: The height, status, file number, data position and previous block hash.
+    :rtype: Tuple[int, int, int, int, bytes]
+    """
+
+    _, offset = read_varint(value)  # client version
+    height, offset = read_varint(value, offset)
+    status, offset = read_varint(value, offset)
+    _, offset = read_varint(value, offset)  # number of transactions
+    file_number = -1
+    data_pos = -1
+    if status & (BLOCK_HAVE_DATA | BLOCK_HAVE_UNDO):
+        file_number, offset = read_varint(value, offset)
+    if status & BLOCK_HAVE_DATA:
+        data_pos, offset = read_varint(value, offset)
+    if status & BLOCK_HAVE_UNDO:
+        _, offset = read_varint(value, offset)
+    # The block header follows, the previous block hash comes after the version
+    prev_hash = value[offset + 4 : offset + 36]
+    return height, status, file_number, data_pos, prev_hash
+
+
+def read_block_locations(index_path: Path) -> List[BlockLocation]:
+    """Reads the blocks/index LevelDB and resolves the best chain.
+    :param index_path: Path to the blocks/index LevelDB.
+    :type index_path: Path
+    :return: The locations of the blocks of the best chain ordered by height.
+    :rtype: List[BlockLocation]
+    """
+
+    db = plyvel.DB(str(index_path), compression=None)
+    entries: Dict[bytes, Tuple[int, int, int, bytes]] = {}
+    tip: Optional[bytes] = None
+    tip_height = -1
+    for key, value in db.iterator(prefix=b"b"):
+        height, status, file_number, data_pos, prev_hash = parse_block_index_entry(
+            value
+        )
+        if not status & BLOCK_HAVE_DATA or status & BLOCK_FAILED_MASK:
+            continue
+        block_hash = key[1:]
+        entries[block_hash] = (height, file_number, data_pos, prev_hash)
+        if height > tip_height:
+            tip = block_hash
+            tip_height = height
+    db.close()
+
+    # Walk back from the highest block to genesis to discard stale branches
+    locations: List[BlockLocation] = []
+    while tip in entries:
+        height, file_number, data_pos, prev_hash = entries[tip]
+        locations.append(BlockLocation(height, tip, file_number, data_pos, -1))
+        tip = prev_hash
+    locations.reverse()
+    return locations
+
+
+def read_chain_tip(chainstate_path: Path) -> Optional[bytes]:
+    """Reads the hash of the best block from the chainstate LevelDB.
+    :param chainstate_path: Path to the chainstate LevelDB.
+    :type chainstate_path: Path
+    :return: The hash of the block the UTXO set is synchronized to, None if it is not available.
+    :rtype: Optional[bytes]
+    """
+
+    if not chainstate_path.exists():
+        return None
+    db = plyvel.DB(str(chainstate_path), compression=None)
+    obfuscate_key = db.get(CHAINSTATE_OBFUSCATE_KEY)
+    tip = db.get(CHAINSTATE_BEST_BLOCK)
+    db.close()
+    if tip is None:
+        return None
+    # The key is stored as a serialized vector, skip its length byte
+    if obfuscate_key is not None and any(obfuscate_key[1:]):
+        tip = xor_bytes(tip, obfuscate_key[1:])
+    return tip
+
+
+def read_block_index_cache(cache_path: Path) -> Tuple[bytes, List[BlockLocation]]:
+    """Reads a cached best chain.
+    :param cache_path: Path of the cache file.
+    :type cache_path: Path
+    :return: The hash of the cached tip and the locations ordered by height, empty if there is no valid cache.
+    :rtype: Tuple[bytes, List[BlockLocation]]
+    """
+
+    if not cache_path.exists():
+        return b"", []
+    with open(cache_path, "rb") as f:
+        data = f.read()
+    if len(data) < BLOCK_INDEX_CACHE_HEADER.size:
+        return b"", []
+    magic, tip, count = BLOCK_INDEX_CACHE_HEADER.unpack_from(data, 0)
+    entries = data[BLOCK_INDEX_CACHE_HEADER.size :]
+    if (
+        magic != BLOCK_INDEX_CACHE_MAGIC
+        or len(entries) != count * BLOCK_INDEX_CACHE_ENTRY.size
+    ):
+        return b"", []
+    locations = [
+        BlockLocation(height, block_hash, file_number, data_pos, size)
+        for height, (block_hash, file_number, data_pos, size) in enumerate(
+            BLOCK_INDEX_CACHE_ENTRY.iter_unpack(entries)
+        )
+    ]
+    return tip, locations
+
+
+def write_block_index_cache(
+    cache_path: Path, tip: bytes, locations: List[BlockLocation]
+) -> None:
+    """Writes the best chain to the cache, replacing the previous cache in a single step.
+    :param cache_path: Path of the cache file.
+    :type cache_path: Path
+    :param tip: Hash of the chain tip.
+    :type tip: bytes
+    :param locations: Locations of the blocks of the best chain, ordered by height starting at genesis.
+    :type locations: List[BlockLocation]
+    """
+
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(
+            BLOCK_INDEX_CACHE_HEADER.pack(BLOCK_INDEX_CACHE_MAGIC, tip, len(locations))
+        )
+        f.write(
+            b"".join(
+                BLOCK_INDEX_CACHE_ENTRY.pack(
+                    location.block_hash,
+                    location.file_number,
+                    location.data_pos,
+                    location.size,
+                )
+                for location in locations
+            )
+        )
+    os.replace(tmp_path, cache_path)
+
+
+def read_cached_block_locations(
+    blocks_path: Path, chainstate_path: Path, cache_path: Path
+) -> List[BlockLocation]:
+    """Resolves the best chain with the help of the cache and updates the cache.
+    Only the blocks between the chainstate tip and the cached chain are looked
+    up in the blocks/index LevelDB, a reorganization discards the cached blocks
+    above the fork point.
+    :param blocks_path: Path to the Bitcoin blocks directory (e.g. /home/user/.bitcoin/blocks).
+    :type blocks_path: Path
+    :param chainstate_path: Path to the chainstate LevelDB.
+    :type chainstate_path: Path
+    :param cache_path: Path of the cache file.
+    :type cache_path: Path
+    :return: The locations of the blocks of the best chain ordered by height.
+    :rtype: List[BlockLocation]
+    """
+
+    tip = read_chain_tip(chainstate_path)
+    if tip is None:
+        # Without a known tip the cache can not be validated
+        return read_block_locations(blocks_path / "index")
+
+    cached_tip, cached = read_block_index_cache(cache_path)
+    if cached_tip == tip:
+        return cached
+
+    db = plyvel.DB(str(blocks_path / "index"), compression=None)
+    new_locations: List[BlockLocation] = []
+    block_hash = tip
+    fork_height = -1
+    while True:
+        value = db.get(b"b" + block_hash)
+        if value is None:
+            db.close()
+            raise BaseException(
+                "block index is missing block " + block_hash[::-1].hex()
+            )
+        height, status, file_number, data_pos, prev_hash = parse_block_index_entry(
+            value
+        )
+        if height < len(cached) and cached[height].block_hash == block_hash:
+            fork_height = height
+            break
+        if not status & BLOCK_HAVE_DATA:
+            # Pruned, the chain continues from the oldest stored block
+            cached = []
+            break
+        new_locations.append(
+            BlockLocation(height, block_hash, file_number, data_pos, -1)
+        )
+        if height == 0:
+            break
+        block_hash = prev_hash
+    db.close()
+
+    reader = BlockFileReader(blocks_path)
+    locations = cached[: fork_height + 1]
+    for location in reversed(new_locations):
+        locations.append(
+            location._replace(
+                size=reader.read_block_size(location.file_number, location.data_pos)
+            )
+        )
+    reader.close()
+
+    # The cache holds one entry per height, a pruned chain is not cached
+    if len(locations) == 0 or locations[0].height == 0:
+        write_block_index_cache(cache_path, tip, locations)
+    return locations
+
+
+def parse_transaction(block: memoryview, offset: int) -> Tuple[BlockTransaction, int]:
+    """Parses a serialized transaction, the scripts are returned as slices of the block.
+    :param block: Serialized block.
+    :type block: memoryview
+    :param offset: Offset of the transaction within the block.
+    :type offset: int
+    :return: The parsed transaction and the offset of the byte following it.
+    :rtype: Tuple[BlockTransaction, int]
+    """
+
+    start = offset
+    offset += 4  # version
+    is_segwit = block[offset] == 0x00 and block[offset + 1] != 0x00
+    if is_segwit:
+        offset += 2  # marker and flag
+    body_start = offset
+
+    n_inputs, offset = read_compact_size(block, offset)
+    inputs: List[BlockTxInput] = []
+    for _ in range(n_inputs):
+        offset += 36  # previous outpoint
+        script_length, offset = read_compact_size(block, offset)
+        inputs.append(BlockTxInput(block[offset : offset + script_length]))
+        offset += script_length + 4  # script and sequence
+
+    n_outputs, offset = read_compact_size(block, offset)
+    outputs: List[BlockTxOutput] = []
+    for _ in range(n_outputs):
+        value = int.from_bytes(block[offset : offset + 8], "little")
+        script_length, offset = read_compact_size(block, offset + 8)
+        outputs.append(BlockTxOutput(value, block[offset : offset + script_length]))
+        offset += script_length
+    body_end = offset
+
+    if is_segwit:
+        for _ in range(n_inputs):
+            n_items, offset = read_compact_size(block, offset)
+            for _ in range(n_items):
+                item_length, offset = read_compact_size(block, offset)
+                offset += item_length
+
+    # The txid commits to the serialization without the witness data
+    tx_hash = hashlib.sha256(block[start : start + 4])
+    tx_hash.update(block[body_start:body_end])
+    tx_hash.update(block[offset : offset + 4])
+    txid = hashlib.sha256(tx_hash.digest()).digest()[::-1].hex()
+    offset += 4  # lock time
+    return BlockTransaction(txid, inputs, outputs), offset
+
+
+def parse_block(height: int, block: memoryview) -> Block:
+    """Parses a serialized block.
+    :param height: Height of the block.
+    :type height: int
+    :param block: Serialized block.
+    :type block: memoryview
+    :return: The parsed block.
+    :rtype: Block
+    """
+
+    header_hash = hashlib.sha256(block[:BLOCK_HEADER_SIZE]).digest()
+    block_hash = hashlib.sha256(header_hash).digest()[::-1].hex()
+    n_txs, offset = read_compact_size(block, BLOCK_HEADER_SIZE)
+    transactions: List[BlockTransaction] = []
+    for _ in range(n_txs):
+        tx, offset = parse_transaction(block, offset)
+        transactions.append(tx)
+    return Block(height, block_hash, len(block), transactions)
+
+
+class BlockFileReader:
+    """Memory maps the blk*.dat files and reads raw blocks from them"""
+
+    def __init__(self, blocks_path: Path):
+        """
+        :param blocks_path: Path to the Bitcoin blocks directory (e.g. /home/user/.bitcoin/blocks).
+        :type blocks_path: Path
+        """
+
+        self._blocks_path = blocks_path
+        self._files: Dict[int, mmap.mmap] = {}
+        self.xor_key: Optional[bytes] = None
+        xor_path = blocks_path / "xor.dat"
+        if xor_path.exists():
+            with open(xor_path, "rb") as f:
+                key = f.read(XOR_KEY_SIZE)
+            # An all zero key is a no-op, skip the copy in that case
+            if any(key):
+                self.xor_key = key
+
+    def _get_file(self, file_number: int) -> mmap.mmap:
+        if file_number not in self._files:
+            with open(self._blocks_path / ("blk%05d.dat" % file_number), "rb") as f:
+                self._files[file_number] = mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        return self._files[file_number]
+
+    def _read(self, file_number: int, offset: int, length: int) -> memoryview:
+        data = memoryview(self._get_file(file_number))[offset : offset + length]
+        if self.xor_key is None:
+            return data
+        return memoryview(xor_bytes(data, self.xor_key, offset))
+
+    def read_block_size(self, file_number: int, data_pos: int) -> int:
+        """Reads the size field stored in front of a block.
+        :param file_number: Number of the blk*.dat file.
+        :type file_number: int
+        :param data_pos: Offset of the block within the file, just after the size field.
+        :type data_pos: int
+        :return: The size of the serialized block.
+        :rtype: int
+        """
+
+        return int.from_bytes(self._read(file_number, data_pos - 4, 4), "little")
+
+    def read_block(self, file_number: int, data_pos: int, size: int = -1) -> memoryview:
+        """Returns the serialized block, without copying if the files are not obfuscated.
+        :param file_number: Number of the blk*.dat file.
+        :type file_number: int
+        :param data_pos: Offset of the block within the file, just after the size field.
+        :type data_pos: int
+        :param size: Size of the block if known, e.g. from the block index cache.
+        :type size: int
+        :return: The serialized block.
+        :rtype: memoryview
+        """
+
+        if size < 0:
+            size = self.read_block_size(file_number, data_pos)
+        return self._read(file_number, data_pos, size)
+
+    def close(self) -> None:
+        # Views into the maps may still be alive, let them be unmapped once
+        # they are garbage collected.
+        self._files.clear()
+
+
+def select_height_range(
+    locations: List[BlockLocation], start_height: int, end_height: Optional[int]
+) -> List[BlockLocation]:
+    """Selects the locations of a height range of the best chain.
+    :param locations: Locations of the best chain ordered by height.
+    :type locations: List[BlockLocation]
+    :param start_height: Height of the first selected block.
+    :type start_height: int
+    :param end_height: Height of the last selected block, None selects up to the tip.
+    :type end_height: Optional[int]
+    :return: The locations within the range.
+    :rtype: List[BlockLocation]
+    """
+
+    if len(locations) == 0:
+        return []
+    # The heights are contiguous, so the range is a plain slice
+    first_height = locations[0].height
+    start = max(start_height - first_height, 0)
+    if end_height is None:
+        return locations[start:]
+    return locations[start : max(end_height - first_height + 1, 0)]
+
+
+class BlockFileIterator:
+    def __init__(
+        self,
+        blocks_path: Path,
+        start_height: int = 0,
+        end_height: Optional[int] = None,
+        cache_path: Optional[Path] = None,
+    ) -> None:
+        """
+        Iterates the blocks of the best chain in height order.
+        :param blocks_path: Path to the Bitcoin blocks directory (e.g. /home/user/.bitcoin/blocks).
+        :type blocks_path: Path
+        :param start_height: Height of the first returned block.
+        :type start_height: int
+        :param end_height: Height of the last returned block, None iterates up to the tip.
+        :type end_height: Optional[int]
+        :param cache_path: Path of the block index cache, None reads the whole block index.
+        :type cache_path: Optional[Path]
+        """
+
+        self._reader = BlockFileReader(blocks_path)
+        if cache_path is None:
+            locations = read_block_locations(blocks_path / "index")
+        else:
+            locations = read_cached_block_locations(
+                blocks_path, blocks_path.parent / "chainstate", cache_path
+            )
+        self._locations = select_height_range(locations, start_height, end_height)
+        self._position = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Block:
+        if self._position >= len(self._locations):
+            self._reader.close()
+            raise StopIteration
+        location = self._locations[self._position]
+        self._position += 1
+        return parse_block(
+            location.height,
+            self._reader.read_block(
+                location.file_number, location.data_pos, location.size
+            ),
+        )
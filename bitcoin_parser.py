@@ -1,18 +1,60 @@
 from re import U
 import threading
-from typing import Iterable, List, NamedTuple
-from blockchain_parser.blockchain import Blockchain
+import multiprocessing
+import time
+from collections import deque
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
 import zmq
-from database import BLOCKCHAIN, DATATYPE, CryptoDataRecord, Database
+from database import BLOCKCHAIN, DATATYPE, PARSESTAGE, Database
+from database_writer import DatabaseWriter
+from metrics import ParseMetrics
 from parser import DataExtractor
 import bitcoin.rpc
 import os
-from bitcoin_utxo_iterator import UTXOIterator
+from bitcoin_block_reader import (
+    Block,
+    BlockFileReader,
+    BlockLocation,
+    parse_block,
+    read_cached_block_locations,
+    select_height_range,
+)
+from bitcoin_script_classifier import (
+    COMPRESSED_SCRIPT_TYPES,
+    STANDARD_SCRIPT_TYPES,
+    ScriptClassifier,
+)
+from bitcoin_utxo_iterator import (
+    Deobfuscator,
+    RawUTXO,
+    RawUTXOBatchIterator,
+    UTXOIterator,
+    UTXORecord,
+    decode_utxo_record,
+    read_out_type,
+)
 from pathlib import Path
-from bitcoin.core import CScript, script, CTransaction
+from bitcoin.core import CScript, script
+
+# Number of consecutive blocks handed to a worker process at once
+BLOCK_RANGE_SIZE = 100
+
+# Number of UTXO batches queued per worker process, bounds the memory used by
+# the raw chainstate entries that are read ahead
+UTXO_BATCHES_PER_WORKER = 2
+
 
 class BitcoinDataMessage(NamedTuple):
-    """ZMQ Message for the DatabaseWriter thread with contents to be written to the database"""
+    """Nonstandard payload to be sent to the DatabaseWriter thread"""
 
     data: bytes
     txid: str
@@ -21,48 +63,6 @@ class BitcoinDataMessage(NamedTuple):
     extra_index: int
 
 
-class DatabaseWriter(threading.Thread):
-    """DatabaseWriter acts as a worker thread for writing to the sql database
-    and receives from a zmq socket"""
-
-    def __init__(
-        self, database: Database, receiver: zmq.Socket, blockchain: BLOCKCHAIN
-    ):
-        """
-        :param database: Database to be written into
-        :type database: Database
-        :param receiver: Receives parsed extra bytes and monero transaction indices
-        :type receiver: zmq.Socket
-        :param blockchain: Some Bitcoin-compatible blockchain
-        :type blockchain: BLOCKCHAIN"""
-        self._db = database
-        self._receiver = receiver
-        self._blockchain = blockchain
-        threading.Thread.__init__(self)
-
-    def run(self) -> None:
-        records: List[CryptoDataRecord] = []
-        while True:
-            message: BitcoinDataMessage = self._receiver.recv_pyobj()
-
-            records.append(
-                CryptoDataRecord(
-                    message.data,
-                    message.txid,
-                    self._blockchain.value,
-                    message.data_type.value,
-                    message.block_height,
-                    message.extra_index,
-                )
-            )
-
-            if len(records) > 500:
-                print("writing:", records[0])
-                self._db.insert_records(records)
-                # print(self._coin.value + " written")
-                records = []
-
-
 opcode_counters = {
     script.OP_1: 1,
     script.OP_2: 2,
@@ -319,10 +319,10 @@ def is_p2ms_output(cscript: CScript) -> bool:
     if len(cscript) < 33:
         return False
     analyze_script = []
-    for item in script:
+    for item in cscript:
         analyze_script.append(item)
 
-    if analyze_script[-1] != OP_CHECKMULTISIG:
+    if analyze_script[-1] != script.OP_CHECKMULTISIG:
         return False
 
     if type(analyze_script[0]) == int and type(analyze_script[-2]) == int:
@@ -389,17 +389,343 @@ def is_p2tr_output(cscript: CScript) -> bool:
     return cscript[0] == script.OP_1
 
 
+class BlockParseResult(NamedTuple):
+    """Nonstandard payloads of a single parsed block"""
+
+    height: int
+    messages: List[BitcoinDataMessage]
+    txs: int
+    size: int
+
+
+def extract_block_data(block: Block, classifier: ScriptClassifier) -> BlockParseResult:
+    """Classifies the scripts of a block and collects the nonstandard ones
+    :param block: Block to be examined.
+    :type block: Block
+    :param classifier: Classifier counting the script types.
+    :type classifier: ScriptClassifier
+    :return: The nonstandard payloads of the block.
+    :rtype: BlockParseResult
+    """
+
+    messages: List[BitcoinDataMessage] = []
+    for tx in block.transactions:
+        for (input_index, tx_input) in enumerate(tx.inputs):
+            if (
+                classifier.classify_scriptsig(tx_input.script_sig)
+                in STANDARD_SCRIPT_TYPES
+            ):
+                continue
+            # The reader hands out views into the block file, only copy the
+            # scripts that are actually stored.
+            messages.append(
+                BitcoinDataMessage(
+                    bytes(tx_input.script_sig),
+                    tx.txid,
+                    DATATYPE.SCRIPT_SIG,
+                    block.height,
+                    input_index,
+                )
+            )
+
+        for (output_index, output) in enumerate(tx.outputs):
+            if (
+                classifier.classify_output(output.script_pubkey)
+                in STANDARD_SCRIPT_TYPES
+            ):
+                continue
+            messages.append(
+                BitcoinDataMessage(
+                    bytes(output.script_pubkey),
+                    tx.txid,
+                    DATATYPE.SCRIPT_PUBKEY,
+                    block.height,
+                    output_index,
+                )
+            )
+
+    return BlockParseResult(
+        block.height, messages, len(block.transactions), block.size
+    )
+
+
+# Block file reader of a worker process, every worker maps the files itself
+_worker_block_reader: Optional[BlockFileReader] = None
+
+
+def init_block_worker(blocks_path: Path) -> None:
+    """Initializer of the worker processes of the parallel parsing mode
+    :param blocks_path: Path to the Bitcoin blocks directory.
+    :type blocks_path: Path
+    """
+
+    global _worker_block_reader
+    _worker_block_reader = BlockFileReader(blocks_path)
+
+
+def extract_block_range_data(
+    locations: Sequence[BlockLocation],
+) -> Tuple[List[BlockParseResult], ScriptClassifier, Dict[str, float]]:
+    """Parses and classifies a contiguous height range of blocks in a worker process
+    :param locations: Locations of the blocks, ordered by height.
+    :type locations: Sequence[BlockLocation]
+    :return: The per block results, ordered by height, the script counts and the decode and classify times of the range.
+    :rtype: Tuple[List[BlockParseResult], ScriptClassifier, Dict[str, float]]
+    """
+
+    assert _worker_block_reader is not None
+    classifier = ScriptClassifier()
+    stage_seconds = {"decode": 0.0, "classify": 0.0}
+    results: List[BlockParseResult] = []
+    for location in locations:
+        start = time.perf_counter()
+        block = parse_block(
+            location.height,
+            _worker_block_reader.read_block(
+                location.file_number, location.data_pos, location.size
+            ),
+        )
+        decoded = time.perf_counter()
+        results.append(extract_block_data(block, classifier))
+        stage_seconds["decode"] += decoded - start
+        stage_seconds["classify"] += time.perf_counter() - decoded
+    return results, classifier, stage_seconds
+
+
+def extract_utxo_data(
+    utxo: UTXORecord, classifier: ScriptClassifier, start_height: int
+) -> Optional[BitcoinDataMessage]:
+    """Classifies the script of an UTXO
+    :param utxo: UTXO to be examined.
+    :type utxo: UTXORecord
+    :param classifier: Classifier counting the script types.
+    :type classifier: ScriptClassifier
+    :param start_height: Outputs of lower heights were stored by a previous run.
+    :type start_height: int
+    :return: The payload of the UTXO if the script is nonstandard.
+    :rtype: Optional[BitcoinDataMessage]
+    """
+
+    if utxo.height < start_height:
+        return None
+    if utxo.out_type in COMPRESSED_SCRIPT_TYPES:
+        classifier.count_output(COMPRESSED_SCRIPT_TYPES[utxo.out_type])
+        return None
+    if classifier.classify_output(utxo.script) in STANDARD_SCRIPT_TYPES:
+        return None
+    return BitcoinDataMessage(
+        utxo.script, utxo.txid, DATATYPE.SCRIPT_PUBKEY, utxo.height, utxo.index
+    )
+
+
+# Chainstate de-obfuscation and resume height of a UTXO worker process
+_worker_deobfuscate: Optional[Deobfuscator] = None
+_worker_utxo_start_height = 0
+
+
+def init_utxo_worker(obfuscation_key: Optional[bytes], start_height: int) -> None:
+    """Initializer of the worker processes decoding the chainstate
+    :param obfuscation_key: Obfuscation key of the chainstate, None if it is not obfuscated.
+    :type obfuscation_key: Optional[bytes]
+    :param start_height: Outputs of lower heights are skipped.
+    :type start_height: int
+    """
+
+    global _worker_deobfuscate, _worker_utxo_start_height
+    if obfuscation_key is not None:
+        _worker_deobfuscate = Deobfuscator(obfuscation_key)
+    _worker_utxo_start_height = start_height
+
+
+def extract_utxo_batch_data(
+    entries: List[RawUTXO],
+) -> Tuple[List[BitcoinDataMessage], ScriptClassifier, Dict[str, float]]:
+    """Decodes and classifies a batch of raw chainstate entries in a worker process
+    :param entries: Keys and still obfuscated values of the UTXOs.
+    :type entries: List[RawUTXO]
+    :return: The nonstandard payloads, the script counts and the decode and classify times of the batch.
+    :rtype: Tuple[List[BitcoinDataMessage], ScriptClassifier, Dict[str, float]]
+    """
+
+    start = time.perf_counter()
+    classifier = ScriptClassifier()
+    utxos: List[UTXORecord] = []
+    for key, value in entries:
+        # Compressed scripts are always standard, skip them before
+        # de-obfuscating and decoding the whole coin
+        out_type = read_out_type(_worker_deobfuscate, value)
+        if out_type in COMPRESSED_SCRIPT_TYPES:
+            classifier.count_output(COMPRESSED_SCRIPT_TYPES[out_type])
+            continue
+        if _worker_deobfuscate is not None:
+            value = _worker_deobfuscate(value)
+        utxos.append(decode_utxo_record(key, value))
+    decoded = time.perf_counter()
+
+    messages: List[BitcoinDataMessage] = []
+    for utxo in utxos:
+        message = extract_utxo_data(utxo, classifier, _worker_utxo_start_height)
+        if message is not None:
+            messages.append(message)
+    stage_seconds = {
+        "decode": decoded - start,
+        "classify": time.perf_counter() - decoded,
+    }
+    return messages, classifier, stage_seconds
+
+
 class BitcoinParser(DataExtractor):
-    def __init__(self, blockchain_path: Path, blockchain: BLOCKCHAIN):
+    def __init__(
+        self,
+        blockchain_path: Path,
+        blockchain: BLOCKCHAIN,
+        workers: int = 1,
+        resume: bool = False,
+    ):
         """
         :param blockchain_path: Path to the Bitcoin blockchain (e.g. /home/user/.bitcoin/).
         :type blockchain_path: str
         :param blockchain: One of the Bitcoin compatible blockchains.
         :type blockchain: BLOCKCHAIN
+        :param workers: Number of processes parsing blocks, 1 parses in the calling process.
+        :type workers: int
+        :param resume: Continue after the last checkpoint stored in the database.
+        :type resume: bool
         """
 
         self._blockchain_path = blockchain_path
         self._blockchain = blockchain
+        self._workers = workers
+        self._resume = resume
+        self._utxo_start_height = 0
+        # Error the UTXO scan thread failed with, raised after joining it
+        self._utxo_error: Optional[BaseException] = None
+        self._classifier = ScriptClassifier()
+        self._utxo_classifier = ScriptClassifier()
+        self._metrics = ParseMetrics(blockchain.value)
+
+    def _add_stage_seconds(self, stage_seconds: Dict[str, float]) -> None:
+        for stage, seconds in stage_seconds.items():
+            self._metrics.add_time(stage, seconds)
+
+    def _parse_blocks(
+        self, blocks_path: Path, locations: List[BlockLocation]
+    ) -> Iterator[BlockParseResult]:
+        """Yields the parse results of the given blocks in height order"""
+
+        if self._workers <= 1:
+            reader = BlockFileReader(blocks_path)
+            for location in locations:
+                with self._metrics.measure("decode"):
+                    block = parse_block(
+                        location.height,
+                        reader.read_block(
+                            location.file_number, location.data_pos, location.size
+                        ),
+                    )
+                with self._metrics.measure("classify"):
+                    result = extract_block_data(block, self._classifier)
+                yield result
+            reader.close()
+            return
+
+        # Hand out contiguous height ranges, imap returns them in submission
+        # order, so the merged results stay ordered by height.
+        chunks = [
+            locations[i : i + BLOCK_RANGE_SIZE]
+            for i in range(0, len(locations), BLOCK_RANGE_SIZE)
+        ]
+        with multiprocessing.Pool(
+            self._workers, initializer=init_block_worker, initargs=(blocks_path,)
+        ) as pool:
+            for results, classifier, stage_seconds in pool.imap(
+                extract_block_range_data, chunks
+            ):
+                self._classifier.merge(classifier)
+                self._add_stage_seconds(stage_seconds)
+                yield from results
+
+    def _parse_utxos(self) -> Iterator[List[BitcoinDataMessage]]:
+        """Yields the nonstandard payloads of the chainstate UTXOs"""
+
+        if self._workers <= 1:
+            utxos = UTXOIterator(path=self._blockchain_path, skip_compressed=True)
+            for utxo in self._metrics.timed(utxos, "decode"):
+                self._metrics.add("utxos")
+                with self._metrics.measure("classify"):
+                    message = extract_utxo_data(
+                        utxo, self._utxo_classifier, self._utxo_start_height
+                    )
+                if message is not None:
+                    yield [message]
+            self._metrics.add("bytes_read", utxos.bytes_read)
+            self._metrics.add("utxos", sum(utxos.compressed_counts.values()))
+            for out_type, count in utxos.compressed_counts.items():
+                self._utxo_classifier.count_output(
+                    COMPRESSED_SCRIPT_TYPES[out_type], count
+                )
+            return
+
+        # A single process reads the chainstate, LevelDB does not allow
+        # opening it in the workers, and the workers decode the batches.
+        batches = RawUTXOBatchIterator(path=self._blockchain_path)
+        pending: deque = deque()
+        with multiprocessing.Pool(
+            self._workers,
+            initializer=init_utxo_worker,
+            initargs=(batches.obfuscation_key, self._utxo_start_height),
+        ) as pool:
+            # Bound the number of batches in flight instead of letting the pool
+            # read the whole chainstate into its task queue.
+            for batch in batches:
+                self._metrics.add("utxos", len(batch))
+                self._metrics.add(
+                    "bytes_read", sum(len(key) + len(value) for key, value in batch)
+                )
+                pending.append(pool.apply_async(extract_utxo_batch_data, (batch,)))
+                if len(pending) < self._workers * UTXO_BATCHES_PER_WORKER:
+                    continue
+                messages, classifier, stage_seconds = pending.popleft().get()
+                self._utxo_classifier.merge(classifier)
+                self._add_stage_seconds(stage_seconds)
+                yield messages
+            while len(pending) > 0:
+                messages, classifier, stage_seconds = pending.popleft().get()
+                self._utxo_classifier.merge(classifier)
+                self._add_stage_seconds(stage_seconds)
+                yield messages
+
+    def _send_utxos(
+        self, writer: DatabaseWriter, context: zmq.Context, tip_height: int
+    ) -> None:
+        """Sends the nonstandard payloads of the chainstate UTXOs to the
+        DatabaseWriter, followed by the UTXO checkpoint at the chain tip"""
+
+        print("commencing UTXO parsing from height", self._utxo_start_height)
+        batch_sender = writer.connect(context)
+        try:
+            for messages in self._parse_utxos():
+                for message in messages:
+                    batch_sender.send(*message)
+                self._metrics.maybe_report()
+            # Every output of the chainstate up to its tip is stored now
+            batch_sender.send_checkpoint(PARSESTAGE.UTXOS, tip_height)
+        finally:
+            # The end frame lets the writer return, also if the scan failed
+            batch_sender.close()
+        print("Completed UTXO parsing")
+        print("utxo script types:", self._utxo_classifier.summary())
+
+    def _scan_utxos(
+        self, writer: DatabaseWriter, context: zmq.Context, tip_height: int
+    ) -> None:
+        """Runs _send_utxos in the UTXO scan thread and keeps its error, which
+        is raised by the parsing thread once it joined the scan"""
+
+        try:
+            self._send_utxos(writer, context, tip_height)
+        except BaseException as e:
+            self._utxo_error = e
 
     def parse_and_extract_blockchain(self, database: Database) -> None:
         """Parse the blockchain with the previously constructed options
@@ -407,143 +733,94 @@ class BitcoinParser(DataExtractor):
         :type database: Database
         """
 
-        blockchain = Blockchain(
-            os.path.expanduser(str(self._blockchain_path) + "/blocks")
-        )
-        height = 0
+        start_height = 0
+        self._utxo_start_height = 0
+        if self._resume:
+            checkpoint = database.get_checkpoint(self._blockchain, PARSESTAGE.BLOCKS)
+            if checkpoint is not None:
+                start_height = checkpoint + 1
+            # The UTXO scan may have been interrupted after the block checkpoint
+            # moved on, its outputs are skipped after its own checkpoint only
+            checkpoint = database.get_checkpoint(self._blockchain, PARSESTAGE.UTXOS)
+            if checkpoint is not None:
+                self._utxo_start_height = checkpoint + 1
+        height = start_height
         total_txs = 0
-        ignored_tx_inputs = 0
-        tx_inputs = 0
-        ignored_tx_outputs = 0
-        tx_outputs = 0
 
+        # The block and the UTXO scan both push into the DatabaseWriter
         context = zmq.Context()
-        database_event_sender = context.socket(zmq.PAIR)
-        database_event_receiver = context.socket(zmq.PAIR)
-        database_event_sender.bind("inproc://bitcoin_dbbridge")
-        database_event_receiver.connect("inproc://bitcoin_dbbridge")
-
-        writer = DatabaseWriter(database, database_event_receiver, self._blockchain)
-        writer.start()
-
-        print(
-            "commencing bitcoin parsing of "
-            + str(self._blockchain_path)
-            + "/blocks/index"
+        self._metrics = ParseMetrics(self._blockchain.value)
+        writer = DatabaseWriter(
+            database,
+            context,
+            "inproc://bitcoin_dbbridge",
+            self._blockchain,
+            self._metrics,
+            senders=2,
         )
-
-        for block in blockchain.get_ordered_blocks(
-            os.path.expanduser(str(self._blockchain_path.absolute()) + "/blocks/index"),
-        ):
-            height += 1
-            for (tx_index, tx) in enumerate(block.transactions):
-                total_txs += 1
-                c_tx: CTransaction = CTransaction.deserialize(tx.hex)
-                for (input_index, input) in enumerate(c_tx.vin):
-                    tx_inputs += 1
-                    if len(input.scriptSig) < 2:
-                        # print("input is too small, ignoring")
-                        ignored_tx_inputs += 1
-                        continue
-                    if is_p2pk_scriptsig(input.scriptSig):
-                        # print("input is p2pk, ignoring")
-                        ignored_tx_inputs += 1
-                        continue
-                    if is_p2pkh_scriptsig(input.scriptSig):
-                        # print("input is p2pkh, ignoring")
-                        ignored_tx_inputs += 1
-                        continue
-                    if is_p2sh_p2ms_scriptsig(input.scriptSig):
-                        # print("input is p2sh(p2ms), ignoring")
-                        ignored_tx_inputs += 1
-                        continue
-                    if is_p2sh_p2wpkh_scriptsig(input.scriptSig):
-                        # print("input is p2sh(p2wpkh), ignoring")
-                        ignored_tx_inputs += 1
-                        continue
-
-                    database_event_sender.send_pyobj(
-                        BitcoinDataMessage(
-                            input.scriptSig,
-                            tx.txid,
-                            DATATYPE.SCRIPT_SIG,
-                            block.height,
-                            input_index,
-                        )
-                    )
-
-                for (output_index, output) in enumerate(c_tx.vout):
-                    tx_outputs += 1
-                    if is_p2pkh_output(output.scriptPubKey):
-                        # print("output is p2pkh, ignoring")
-                        ignored_tx_outputs += 1
-                        continue
-                    if is_p2pk_output(output.scriptPubKey):
-                        # print("output is p2pk, ignoring")
-                        ignored_tx_outputs += 1
-                        continue
-                    if is_p2sh_output(output.scriptPubKey):
-                        # print("output is p2sh, ignoring")
-                        ignored_tx_outputs += 1
-                        continue
-                    if is_p2ms_output(output.scriptPubKey):
-                        # print("output is p2ms, ignoring")
-                        ignored_tx_outputs += 1
-                        continue
-                    if is_p2wpkh_output(output.scriptPubKey):
-                        # print("output is p2wpkh, ignoring")
-                        ignored_tx_outputs += 1
-                        continue
-                    if is_p2wsh_output(output.scriptPubKey):
-                        # print("output is p2wsh, ignoring")
-                        ignored_tx_outputs += 1
-                        continue
-                    if is_p2tr_output(output.scriptPubKey):
-                        # print("output is p2tr, ignoring")
-                        ignored_tx_outputs += 1
-                        continue
-
-                    # print("nonstandard output:", output)
-                    database_event_sender.send_pyobj(
-                        BitcoinDataMessage(
-                            output.scriptPubKey,
-                            tx.txid,
-                            DATATYPE.SCRIPT_PUBKEY,
-                            block.height,
-                            output_index,
-                        )
-                    )
-
-            if height % 500 == 0:
-                print(
-                    "bitcoin parsed until height:",
-                    height,
-                    "n inputs:",
-                    tx_inputs,
-                    "n ignored inputs:",
-                    ignored_tx_inputs,
-                    "n outputs:",
-                    tx_outputs,
-                    "n ignored outputs:",
-                    ignored_tx_outputs,
-                )
-
-        print("Completed blockchain parsing, commencing UTXO parsing")
-
-        utxo_counter = 0
-        for utxo in UTXOIterator(path=self._blockchain_path):
-            utxo_counter += 1
-            if utxo_counter % 1000 == 0:
-                print(utxo_counter)
-            print("out data:", utxo["out"]["data"], "txid:", utxo["tx_id"])
-            database_event_sender.send_pyobj(
-                BitcoinDataMessage(
-                    utxo["out"]["data"],
-                    utxo["tx_id"],
-                    DATATYPE.SCRIPT_PUBKEY,
-                    utxo["height"],
-                    utxo["index"],
-                )
+        with writer.running():
+            batch_sender = writer.connect(context)
+
+            print(
+                "commencing bitcoin parsing of "
+                + str(self._blockchain_path)
+                + "/blocks/index with "
+                + str(self._workers)
+                + " worker(s) from height "
+                + str(start_height)
             )
 
-        print("Completed UTXO parsing")
+            blocks_path = Path(
+                os.path.expanduser(str(self._blockchain_path.absolute()) + "/blocks")
+            )
+            # The resolved best chain is cached next to the database
+            locations = read_cached_block_locations(
+                blocks_path,
+                blocks_path.parent / "chainstate",
+                Path(database.name + "." + self._blockchain.value + ".blockindex"),
+            )
+            print("resolved best chain with", len(locations), "blocks")
+            tip_height = locations[-1].height if len(locations) > 0 else -1
+
+            # With worker processes the chainstate is decoded while the blocks are
+            # parsed, its outputs are independent of the block checkpoints. The
+            # chain tip has been read, so the scan may lock the chainstate now.
+            utxo_scan: Optional[threading.Thread] = None
+            self._utxo_error = None
+            if self._workers > 1:
+                # A daemon, so an interrupted run does not wait for the scan
+                utxo_scan = threading.Thread(
+                    target=self._scan_utxos,
+                    args=(writer, context, tip_height),
+                    daemon=True,
+                )
+                utxo_scan.start()
+
+            for result in self._parse_blocks(
+                blocks_path, select_height_range(locations, start_height, None)
+            ):
+                height += 1
+                total_txs += result.txs
+                self._metrics.add("blocks")
+                self._metrics.add("txs", result.txs)
+                self._metrics.add("bytes_read", result.size)
+                for message in result.messages:
+                    batch_sender.send(*message)
+
+                if height % 500 == 0:
+                    batch_sender.send_checkpoint(PARSESTAGE.BLOCKS, result.height)
+                self._metrics.maybe_report()
+
+            if height > start_height:
+                batch_sender.send_checkpoint(PARSESTAGE.BLOCKS, result.height)
+            print("Completed blockchain parsing, n txs:", total_txs)
+            print("block script types:", self._classifier.summary())
+
+            batch_sender.close()
+            if utxo_scan is None:
+                self._send_utxos(writer, context, tip_height)
+            else:
+                utxo_scan.join()
+                if self._utxo_error is not None:
+                    raise self._utxo_error
+        print(self._metrics.summary())
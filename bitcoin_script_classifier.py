@@ -0,0 +1,325 @@
+# Single pass classification of Bitcoin scripts on their raw bytes. Scripts are
+# dispatched on their length and first opcode, so the common templates are
+# recognized with a handful of byte comparisons instead of iterating a CScript.
+
+import enum
+from typing import Dict, Optional, Tuple
+
+OP_0 = 0x00
+OP_PUSHDATA1 = 0x4C
+OP_PUSHDATA2 = 0x4D
+OP_PUSHDATA4 = 0x4E
+OP_1 = 0x51
+OP_16 = 0x60
+OP_RETURN = 0x6A
+OP_DUP = 0x76
+OP_EQUAL = 0x87
+OP_EQUALVERIFY = 0x88
+OP_HASH160 = 0xA9
+OP_CHECKSIG = 0xAC
+OP_CHECKMULTISIG = 0xAE
+
+
+class SCRIPTTYPE(enum.Enum):
+    """Bitcoin script templates"""
+
+    EMPTY = "empty"  # input scripts that are too small to carry data
+    NONSTANDARD = "nonstandard"
+    NULL_DATA = "null_data"  # OP_RETURN outputs
+    P2PK = "p2pk"
+    P2PKH = "p2pkh"
+    P2SH = "p2sh"
+    P2MS = "p2ms"
+    P2WPKH = "p2wpkh"
+    P2WSH = "p2wsh"
+    P2TR = "p2tr"
+    P2SH_P2MS = "p2sh_p2ms"
+    P2SH_P2WPKH = "p2sh_p2wpkh"
+
+
+# Script types that never carry embedded data and are not stored
+STANDARD_SCRIPT_TYPES = frozenset(
+    (
+        SCRIPTTYPE.EMPTY,
+        SCRIPTTYPE.P2PK,
+        SCRIPTTYPE.P2PKH,
+        SCRIPTTYPE.P2SH,
+        SCRIPTTYPE.P2MS,
+        SCRIPTTYPE.P2WPKH,
+        SCRIPTTYPE.P2WSH,
+        SCRIPTTYPE.P2TR,
+        SCRIPTTYPE.P2SH_P2MS,
+        SCRIPTTYPE.P2SH_P2WPKH,
+    )
+)
+
+# Script types of the compressed scripts in the chainstate, see
+# https://github.com/bitcoin/bitcoin/blob/v0.13.2/src/compressor.cpp#L98
+COMPRESSED_SCRIPT_TYPES = {
+    0: SCRIPTTYPE.P2PKH,
+    1: SCRIPTTYPE.P2SH,
+    2: SCRIPTTYPE.P2PK,
+    3: SCRIPTTYPE.P2PK,
+    4: SCRIPTTYPE.P2PK,
+    5: SCRIPTTYPE.P2PK,
+}
+
+
+def read_push(script: bytes, offset: int) -> Optional[Tuple[int, int]]:
+    """Reads a data push at the given offset of the script.
+    :param script: Raw script.
+    :type script: bytes
+    :param offset: Offset of the push opcode.
+    :type offset: int
+    :return: Start and end offset of the pushed data, None if the opcode is not a push or truncated.
+    :rtype: Optional[Tuple[int, int]]
+    """
+
+    op = script[offset]
+    if op == OP_0 or op > OP_PUSHDATA4:
+        return None
+    offset += 1
+    if op < OP_PUSHDATA1:
+        length = op
+    elif op == OP_PUSHDATA1:
+        if offset >= len(script):
+            return None
+        length = script[offset]
+        offset += 1
+    elif op == OP_PUSHDATA2:
+        length = int.from_bytes(script[offset : offset + 2], "little")
+        offset += 2
+    else:
+        length = int.from_bytes(script[offset : offset + 4], "little")
+        offset += 4
+    if offset + length > len(script):
+        return None
+    return offset, offset + length
+
+
+def is_der_signature(script: bytes, start: int, end: int) -> bool:
+    """Checks if the data is a DER encoded ECDSA signature followed by the sighash flag
+    :param script: Raw script containing the data.
+    :type script: bytes
+    :param start: Start offset of the potential signature.
+    :type start: int
+    :param end: End offset of the potential signature.
+    :type end: int
+    :return: True if the data is a DER signature.
+    :rtype: bool
+    """
+
+    if end - start < 9 or script[start] != 0x30 or script[start + 2] != 0x02:
+        return False
+    len_r = script[start + 3]
+    s_header = start + 4 + len_r
+    if s_header + 1 >= end or script[s_header] != 0x02:
+        return False
+    len_s = script[s_header + 1]
+    return end - start == 4 + len_r + 2 + len_s + 1
+
+
+def is_pubkey(script: bytes, start: int, end: int) -> bool:
+    """Checks if the data is a SEC serialized ECDSA public key
+    :param script: Raw script containing the data.
+    :type script: bytes
+    :param start: Start offset of the potential public key.
+    :type start: int
+    :param end: End offset of the potential public key.
+    :type end: int
+    :return: True if the data is a public key.
+    :rtype: bool
+    """
+
+    prefix = script[start]
+    if prefix == 0x02 or prefix == 0x03:
+        return end - start == 33
+    if prefix == 0x04:
+        return end - start == 65
+    return False
+
+
+def is_multisig(script: bytes) -> bool:
+    """Checks if the script is of the form:
+            OP_M <pubkeys> OP_N OP_CHECKMULTISIG
+    :param script: Raw script.
+    :type script: bytes
+    :return: True if the script is a bare multisig script.
+    :rtype: bool
+    """
+
+    length = len(script)
+    if length < 37 or script[-1] != OP_CHECKMULTISIG:
+        return False
+    if not OP_1 <= script[0] <= OP_16 or not OP_1 <= script[-2] <= OP_16:
+        return False
+    n_keys = 0
+    offset = 1
+    while offset < length - 2:
+        push = read_push(script, offset)
+        if push is None:
+            return False
+        offset = push[1]
+        n_keys += 1
+    return offset == length - 2 and n_keys == script[-2] - OP_1 + 1
+
+
+def classify_output(script: bytes) -> SCRIPTTYPE:
+    """Classifies an output script (scriptPubKey)
+    :param script: Raw output script.
+    :type script: bytes
+    :return: The script template of the output.
+    :rtype: SCRIPTTYPE
+    """
+
+    length = len(script)
+    if length == 0:
+        return SCRIPTTYPE.NONSTANDARD
+    op = script[0]
+    if length == 22:
+        if op == OP_0 and script[1] == 0x14:
+            return SCRIPTTYPE.P2WPKH
+    elif length == 34:
+        if script[1] == 0x20:
+            if op == OP_0:
+                return SCRIPTTYPE.P2WSH
+            if op == OP_1:
+                return SCRIPTTYPE.P2TR
+    elif length == 25:
+        if (
+            op == OP_DUP
+            and script[1] == OP_HASH160
+            and script[2] == 0x14
+            and script[23] == OP_EQUALVERIFY
+            and script[24] == OP_CHECKSIG
+        ):
+            return SCRIPTTYPE.P2PKH
+    elif length == 23:
+        if op == OP_HASH160 and script[1] == 0x14 and script[22] == OP_EQUAL:
+            return SCRIPTTYPE.P2SH
+    elif length == 35 or length == 67:
+        if (
+            op == length - 2
+            and script[-1] == OP_CHECKSIG
+            and is_pubkey(script, 1, length - 1)
+        ):
+            return SCRIPTTYPE.P2PK
+    if op == OP_RETURN:
+        return SCRIPTTYPE.NULL_DATA
+    if OP_1 <= op <= OP_16 and is_multisig(script):
+        return SCRIPTTYPE.P2MS
+    return SCRIPTTYPE.NONSTANDARD
+
+
+def classify_scriptsig(script: bytes) -> SCRIPTTYPE:
+    """Classifies an input script (scriptSig)
+    :param script: Raw input script.
+    :type script: bytes
+    :return: The script template of the input.
+    :rtype: SCRIPTTYPE
+    """
+
+    length = len(script)
+    if length < 2:
+        return SCRIPTTYPE.EMPTY
+    op = script[0]
+    if op == OP_0:
+        # OP_0 <sigs> <redeem script>, the OP_0 works around the P2MS bug
+        offset = 1
+        n_sigs = 0
+        while offset < length:
+            push = read_push(script, offset)
+            if push is None:
+                return SCRIPTTYPE.NONSTANDARD
+            start, offset = push
+            if offset == length:
+                if n_sigs > 0 and is_multisig(script[start:offset]):
+                    return SCRIPTTYPE.P2SH_P2MS
+                return SCRIPTTYPE.NONSTANDARD
+            if not is_der_signature(script, start, offset):
+                return SCRIPTTYPE.NONSTANDARD
+            n_sigs += 1
+        return SCRIPTTYPE.NONSTANDARD
+    if length == 23 and op == 0x16 and script[1] == OP_0 and script[2] == 0x14:
+        return SCRIPTTYPE.P2SH_P2WPKH
+    if length < 64:
+        return SCRIPTTYPE.NONSTANDARD
+    push = read_push(script, 0)
+    if push is None or not is_der_signature(script, push[0], push[1]):
+        return SCRIPTTYPE.NONSTANDARD
+    if push[1] == length:
+        return SCRIPTTYPE.P2PK
+    pubkey_push = read_push(script, push[1])
+    if (
+        pubkey_push is not None
+        and pubkey_push[1] == length
+        and is_pubkey(script, pubkey_push[0], pubkey_push[1])
+    ):
+        return SCRIPTTYPE.P2PKH
+    return SCRIPTTYPE.NONSTANDARD
+
+
+class ScriptClassifier:
+    """Classifies scripts and keeps a count of every encountered script type"""
+
+    def __init__(self) -> None:
+        self.input_counts: Dict[SCRIPTTYPE, int] = {
+            script_type: 0 for script_type in SCRIPTTYPE
+        }
+        self.output_counts: Dict[SCRIPTTYPE, int] = {
+            script_type: 0 for script_type in SCRIPTTYPE
+        }
+
+    def classify_scriptsig(self, script: bytes) -> SCRIPTTYPE:
+        script_type = classify_scriptsig(script)
+        self.input_counts[script_type] += 1
+        return script_type
+
+    def classify_output(self, script: bytes) -> SCRIPTTYPE:
+        script_type = classify_output(script)
+        self.output_counts[script_type] += 1
+        return script_type
+
+    def count_output(self, script_type: SCRIPTTYPE, count: int = 1) -> None:
+        """Counts outputs whose type is already known, e.g. compressed chainstate scripts"""
+        self.output_counts[script_type] += count
+
+    def merge(self, other: "ScriptClassifier") -> None:
+        """Adds the counts of another classifier, e.g. of a worker process"""
+        for script_type in SCRIPTTYPE:
+            self.input_counts[script_type] += other.input_counts[script_type]
+            self.output_counts[script_type] += other.output_counts[script_type]
+
+    def total_inputs(self) -> int:
+        return sum(self.input_counts.values())
+
+    def ignored_inputs(self) -> int:
+        return sum(
+            count
+            for script_type, count in self.input_counts.items()
+            if script_type in STANDARD_SCRIPT_TYPES
+        )
+
+    def total_outputs(self) -> int:
+        return sum(self.output_counts.values())
+
+    def ignored_outputs(self) -> int:
+        return sum(
+            count
+            for script_type, count in self.output_counts.items()
+            if script_type in STANDARD_SCRIPT_TYPES
+        )
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "inputs": {
+                script_type.value: count
+                for script_type, count in self.input_counts.items()
+                if count > 0
+            },
+            "outputs": {
+                script_type.value: count
+                for script_type, count in self.output_counts.items()
+                if count > 0
+            },
+        }
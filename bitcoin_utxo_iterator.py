@@ -5,12 +5,24 @@
 from pathlib import Path
 import plyvel
 from binascii import hexlify, unhexlify
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from bitcoin_block_reader import read_varint
 from database import BLOCKCHAIN, DATATYPE, Database
 
-
 NSPECIALSCRIPTS = 6
 
+# Chainstate key of the obfuscation key
+OBFUSCATE_KEY = b"\x0e\x00obfuscate_key"
+
+# Upper bound of the size of the code, amount and out_type varints in front of
+# the script of a coin
+UTXO_HEADER_SIZE = 32
+
+# Number of raw chainstate entries handed to a worker process at once
+UTXO_BATCH_SIZE = 10000
+
+RawUTXO = Tuple[bytes, bytes]
+
 # source: https://github.com/bitcoin/bitcoin/blob/v0.13.2/src/compressor.cpp#L98
 # man, this is disappointing, to say the least, it's so inefficient!
 out_type = {
@@ -37,10 +49,10 @@ def txout_decompress(x):
         return 0
     x -= 1
     e = x % 10
-    x /= 10
+    x //= 10
     if e < 9:
         d = (x % 9) + 1
-        x /= 9
+        x //= 9
         n = x * 10 + d
     else:
         n = x + 1
@@ -211,6 +223,120 @@ def deobfuscate_value(obfuscation_key, value):
     return r
 
 
+class UTXORecord(NamedTuple):
+    """Decoded unspent transaction output of the chainstate"""
+
+    txid: str  # in the usual byte reversed hex notation
+    index: int
+    height: int
+    coinbase: bool
+    amount: int  # in satoshi
+    out_type: int  # compressed script type, or the script length + NSPECIALSCRIPTS
+    script: bytes  # raw script, or the compressed script payload for out_type < 6
+
+
+class Deobfuscator:
+    """XORs chainstate values with the repeating obfuscation key as a single integer operation"""
+
+    def __init__(self, obfuscation_key: bytes, max_length: int = 4096):
+        """
+        :param obfuscation_key: Key used to obfuscate the values, without the length prefix.
+        :type obfuscation_key: bytes
+        :param max_length: Length of the precomputed key stream, longer values extend it.
+        :type max_length: int
+        """
+        self._key = obfuscation_key
+        self._set_key_stream(max_length)
+
+    def _set_key_stream(self, length: int) -> None:
+        self._key_stream = (self._key * (length // len(self._key) + 1))[:length]
+        self._key_stream_length = length
+
+    def __call__(self, value: bytes) -> bytes:
+        length = len(value)
+        if length > self._key_stream_length:
+            self._set_key_stream(length * 2)
+        return (
+            int.from_bytes(value, "little")
+            ^ int.from_bytes(self._key_stream[:length], "little")
+        ).to_bytes(length, "little")
+
+
+def decode_utxo_record(key: bytes, value: bytes) -> UTXORecord:
+    """Decodes a de-obfuscated chainstate UTXO on its raw bytes, see decode_utxo for the format.
+    :param key: The outpoint key, starting with the b'C' prefix.
+    :type key: bytes
+    :param value: The de-obfuscated coin.
+    :type value: bytes
+    :return: The decoded UTXO.
+    :rtype: UTXORecord
+    """
+
+    if len(key) < 34 or key[0] != 0x43:
+        raise BaseException("invalid utxo key")
+    index, _ = read_varint(key, 33)
+
+    code, offset = read_varint(value)
+    compressed_amount, offset = read_varint(value, offset)
+    out_type, offset = read_varint(value, offset)
+
+    if out_type < 2:
+        script_size = 20
+    elif out_type < NSPECIALSCRIPTS:
+        # The type byte is part of the compressed public key
+        offset -= 1
+        script_size = 33
+    else:
+        script_size = out_type - NSPECIALSCRIPTS
+    script = value[offset:]
+    if len(script) != script_size:
+        raise BaseException("invalid utxo script length")
+
+    return UTXORecord(
+        key[32:0:-1].hex(),
+        index,
+        code >> 1,
+        bool(code & 0x01),
+        txout_decompress(compressed_amount),
+        out_type,
+        script,
+    )
+
+
+def read_out_type(deobfuscate: Optional[Deobfuscator], value: bytes) -> int:
+    """Reads the out_type of a chainstate coin, only de-obfuscating its header.
+    :param deobfuscate: De-obfuscation of the chainstate, None if it is not obfuscated.
+    :type deobfuscate: Optional[Deobfuscator]
+    :param value: The still obfuscated coin.
+    :type value: bytes
+    :return: The compressed script type, or the script length + NSPECIALSCRIPTS.
+    :rtype: int
+    """
+
+    header = value[:UTXO_HEADER_SIZE]
+    if deobfuscate is not None:
+        header = deobfuscate(header)
+    _, offset = read_varint(header)  # code
+    _, offset = read_varint(header, offset)  # amount
+    out_type, _ = read_varint(header, offset)
+    return out_type
+
+
+def read_obfuscation_key(db: plyvel.DB) -> Optional[bytes]:
+    """Reads the obfuscation key of the chainstate.
+    :param db: The opened chainstate LevelDB.
+    :type db: plyvel.DB
+    :return: The key without its length prefix, None if the values are not obfuscated.
+    :rtype: Optional[bytes]
+    """
+
+    o_key = db.get(OBFUSCATE_KEY)
+    # The leading byte is the length of the key
+    if o_key is None or not any(o_key[1:]):
+        return None
+    return o_key[1:]
+
+
 def parse_ldb(
     database: Optional[Database],
     coin=BLOCKCHAIN.BITCOIN_MAINNET,
@@ -274,50 +400,100 @@ def parse_ldb(
 
 class UTXOIterator:
     def __init__(
-        self, path: Path = Path("/home/drgrid/.bitcoin"), fin_name: str = "chainstate",
+        self,
+        path: Path = Path("/home/drgrid/.bitcoin"),
+        fin_name: str = "chainstate",
+        skip_compressed: bool = False,
     ) -> None:
         """
-        Parsed data from the chainstate LevelDB and stores it in a output file.
-        :param btc_dir: Path of the bitcoin data directory
-        :type btc_dir: str
+        Iterates the UTXOs of the chainstate LevelDB.
+        :param path: Path of the bitcoin data directory
+        :type path: Path
         :param fin_name: Name of the LevelDB folder (chainstate by default)
         :type fin_name: str
-        :return: None
-        :rtype: None
+        :param skip_compressed: Only count the UTXOs with compressed scripts in compressed_counts instead of decoding them.
+        :type skip_compressed: bool
         """
 
         # The UTXOs in the database are prefixed with a 'C'
         prefix = b"C"
         # Open the LevelDB
-        db = plyvel.DB(
-            str(path.expanduser()) + "/" + fin_name, compression=None
-        )  # Change with path to chainstate
-
-        # Load obfuscation key (if it exists)
-        o_key = db.get((unhexlify("0e00") + b"obfuscate_key"))
-
-        # If the key exists, the leading byte indicates the length of the key (8 byte by default). If there is no key,
-        # 8-byte zeros are used (since the key will be XORed with the given values).
-        if o_key is not None:
-            o_key = hexlify(o_key)[2:]
-
-        # For every UTXO (identified with a leading 'c'), the key (tx_id) and the value (encoded utxo) is displayed.
-        # UTXOs are obfuscated using the obfuscation key (o_key), in order to get them non-obfuscated, a XOR between the
-        # value and the key (concatenated until the length of the value is reached) if performed).
-
-        self._o_key = o_key
+        db = plyvel.DB(str(path.expanduser()) + "/" + fin_name, compression=None)
+
+        # UTXOs are obfuscated using the obfuscation key, in order to get them
+        # non-obfuscated, a XOR between the value and the key (concatenated until
+        # the length of the value is reached) is performed.
+        o_key = read_obfuscation_key(db)
+        self._deobfuscate: Optional[Deobfuscator] = (
+            Deobfuscator(o_key) if o_key is not None else None
+        )
+        self._db = db
         self._prefix = prefix
+        self._skip_compressed = skip_compressed
+        self.bytes_read = 0
+        self.compressed_counts: Dict[int, int] = {
+            out_type: 0 for out_type in range(NSPECIALSCRIPTS)
+        }
         self._iterator = db.iterator(prefix=prefix)
 
     def __iter__(self):
         return self
 
-    def __next__(self) -> Dict[str, Any]:
-        key, o_value = self._iterator.__next__()
-        key = hexlify(key)
-        if self._o_key is not None:
-            value = deobfuscate_value(self._o_key, hexlify(o_value))
-        else:
-            value = hexlify(o_value)
+    def _next_entry(self) -> Tuple[bytes, bytes]:
+        try:
+            key, value = self._iterator.__next__()
+        except StopIteration:
+            # Release the LevelDB lock, so the chainstate can be opened again
+            self._db.close()
+            raise
+        self.bytes_read += len(key) + len(value)
+        return key, value
+
+    def __next__(self) -> UTXORecord:
+        key, value = self._next_entry()
+        while self._skip_compressed:
+            out_type = read_out_type(self._deobfuscate, value)
+            if out_type >= NSPECIALSCRIPTS:
+                break
+            self.compressed_counts[out_type] += 1
+            key, value = self._next_entry()
+        if self._deobfuscate is not None:
+            value = self._deobfuscate(value)
+        return decode_utxo_record(key, value)
+
+
+class RawUTXOBatchIterator:
+    def __init__(
+        self,
+        path: Path = Path("/home/drgrid/.bitcoin"),
+        fin_name: str = "chainstate",
+        batch_size: int = UTXO_BATCH_SIZE,
+    ) -> None:
+        """
+        Reads the still obfuscated UTXOs of the chainstate LevelDB in batches,
+        to be decoded by worker processes. LevelDB locks the database for a
+        single process, so the workers can not open it themselves. The reading
+        is a single sequential scan, only the decoding runs in parallel.
+        :param path: Path of the bitcoin data directory
+        :type path: Path
+        :param fin_name: Name of the LevelDB folder (chainstate by default)
+        :type fin_name: str
+        :param batch_size: Maximum number of UTXOs in a batch.
+        :type batch_size: int
+        """
 
-        return decode_utxo(value, key)
+        self._db = plyvel.DB(str(path.expanduser()) + "/" + fin_name, compression=None)
+        self.obfuscation_key = read_obfuscation_key(self._db)
+        self._batch_size = batch_size
+
+    def __iter__(self) -> Iterator[List[RawUTXO]]:
+        # The UTXOs in the database are prefixed with a 'C'
+        batch: List[RawUTXO] = []
+        for entry in self._db.iterator(prefix=b"C"):
+            batch.append(entry)
+            if len(batch) == self._batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+        self._db.close()
@@ -1,6 +1,24 @@
 import enum
+import functools
+import hashlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+import multiprocessing
 import sqlite3
-from typing import Any, Callable, Iterable, NamedTuple, List, Optional, Sequence
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    NamedTuple,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
 from eth_typing import BlockNumber
 
@@ -45,6 +63,14 @@ class DATATYPE(enum.Enum):
     TX_DATA = "tx_data"
 
 
+class PARSESTAGE(enum.Enum):
+    """Resumable stages of a parse run"""
+
+    BLOCKS = "blocks"  # block bodies, or the transactions of a block
+    HEADERS = "headers"  # block headers, only parsed separately by ethereum
+    UTXOS = "utxos"  # chainstate outputs, only set once the whole chainstate is parsed
+
+
 class DetectorPayload(NamedTuple):
     txid: str
     data_type: str
@@ -85,6 +111,46 @@ class FileTypeHistogram(NamedTuple):
     file_type_count: int
 
 
+class InsertResult(NamedTuple):
+    inserted: int
+    skipped: int  # records whose key is already stored
+    # payloads not stored before, every inserted record without deduplication
+    stored_payloads: int
+
+
+class SecondaryIndex(NamedTuple):
+    name: str
+    table: str
+    columns: str
+
+
+class RecordFilter(NamedTuple):
+    """Predicates of a scan over the records, None matches every record"""
+
+    coin: Optional[BLOCKCHAIN] = None
+    data_type: Optional[DATATYPE] = None
+    min_height: Optional[int] = None
+    max_height: Optional[int] = None
+
+    def predicates(self) -> Tuple[List[str], List[Any]]:
+        """Returns the WHERE conditions of the filter and their parameters"""
+        conditions: List[str] = []
+        parameters: List[Any] = []
+        if self.coin is not None:
+            conditions.append("COIN=?")
+            parameters.append(self.coin.value)
+        if self.data_type is not None:
+            conditions.append("DATA_TYPE=?")
+            parameters.append(self.data_type.value)
+        if self.min_height is not None:
+            conditions.append("BLOCK_HEIGHT>=?")
+            parameters.append(self.min_height)
+        if self.max_height is not None:
+            conditions.append("BLOCK_HEIGHT<=?")
+            parameters.append(self.max_height)
+        return conditions, parameters
+
+
 class RecordStatistics(NamedTuple):
     distinct_data_rows: int
     max_block_height: int
@@ -95,13 +161,397 @@ class RecordStatistics(NamedTuple):
 
 DetectorFunc = Callable[[DetectorPayload], Optional[NamedTuple]]
 
-DatabaseWriteFunc = Callable[[Sequence[Any], sqlite3.Connection], None]
+BatchDetectorFunc = Callable[[Sequence[DetectorPayload]], List[Optional[NamedTuple]]]
 
+DatabaseWriteFunc = Callable[[Sequence[Any]], None]
 
-class Database:
-    def __init__(self, name: str) -> None:
+
+class DetectionPage(NamedTuple):
+    """A page of records whose payloads are handed to the detector. A payload
+    is keyed by the rowid of its record, or by its hash if it is deduplicated."""
+
+    rows: List[Tuple[Any, ...]]
+    payloads: List[DetectorPayload]
+    keys: List[Union[int, bytes]]
+    # cached detection results of the deduplicated payloads that are not analyzed
+    known: Dict[Union[int, bytes], Optional[NamedTuple]]
+    # hashes of the payloads analyzed by an earlier page in flight
+    deferred: List[bytes]
+
+
+# Trade durability for insert throughput while parsing, a crash loses at most
+# the records after the last checkpoint, which are parsed again on resume
+BULK_LOAD_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA cache_size=-262144",  # 256 MiB
+    "PRAGMA mmap_size=1073741824",  # 1 GiB
+    "PRAGMA temp_store=MEMORY",
+)
+
+# Number of inserted batches committed in a single transaction in bulk load mode
+BULK_LOAD_COMMIT_INTERVAL = 64
+
+# Indexes besides the primary key of cryptoData. They slow down every insert,
+# so they are dropped for a bulk load and created once the data is loaded.
+SECONDARY_INDEXES = (
+    SecondaryIndex(
+        "cryptoDataCoinTypeHeight", "cryptoData", "COIN, DATA_TYPE, BLOCK_HEIGHT"
+    ),
+    SecondaryIndex("cryptoDataBlockHeight", "cryptoData", "BLOCK_HEIGHT"),
+    SecondaryIndex("asciiDataStringLength", "asciiData", "STRING_LENGTH"),
+    SecondaryIndex("magicFileDataFileType", "magicFileData", "FILE_TYPE"),
+    SecondaryIndex("imghdrFileDataFileType", "imghdrFileData", "FILE_TYPE"),
+)
+
+# Detections are keyed by their record like cryptoData, writing the detection
+# of an already analyzed record again is a no-op. The keys are unique indexes,
+# which are kept during a bulk load and also join the detections back to their
+# payload.
+DETECTION_KEYS = (
+    SecondaryIndex("asciiDataKey", "asciiData", "TXID, EXTRA_INDEX, DATA_TYPE"),
+    SecondaryIndex("magicFileDataKey", "magicFileData", "TXID, EXTRA_INDEX, DATA_TYPE"),
+    SecondaryIndex(
+        "imghdrFileDataKey", "imghdrFileData", "TXID, EXTRA_INDEX, DATA_TYPE"
+    ),
+)
+
+# Removes the duplicate detections a database created before the keys holds
+REMOVE_DUPLICATE_DETECTIONS = "DELETE FROM {table} WHERE rowid NOT IN (SELECT MIN(rowid) FROM {table} GROUP BY {columns})"
+
+# Indexes of earlier versions on the columns of the detection keys
+REPLACED_INDEXES = ("asciiDataPayload", "magicFileDataPayload", "imghdrFileDataPayload")
+
+# Summary tables holding the aggregates of the views and statistics. They are
+# updated in the transaction of every insert, so the views read a few summary
+# rows instead of aggregating the record and detection tables. Rows are only
+# ever added to the summarized tables, deleting rows requires a rebuild.
+SUMMARY_TABLES: Dict[str, str] = {
+    "recordSummary": """CREATE TABLE recordSummary(
+        COIN TEXT NOT NULL,
+        DATA_TYPE TEXT NOT NULL,
+        RECORD_COUNT BIGINT NOT NULL,
+        MAX_BLOCK_HEIGHT BIGINT NOT NULL,
+        MAX_DATA_LENGTH BIGINT NOT NULL,
+        PRIMARY KEY (COIN, DATA_TYPE)
+    );""",
+    "payloadSummary": """CREATE TABLE payloadSummary(
+        ID BIGINT NOT NULL PRIMARY KEY,
+        PAYLOAD_COUNT BIGINT NOT NULL
+    );""",
+    "asciiSummary": """CREATE TABLE asciiSummary(
+        STRING_LENGTH BIGINT NOT NULL PRIMARY KEY,
+        STRING_COUNT BIGINT NOT NULL
+    );""",
+    "fileTypeSummary": """CREATE TABLE fileTypeSummary(
+        DETECTION_TABLE TEXT NOT NULL,
+        FILE_TYPE TEXT NOT NULL,
+        FILE_COUNT BIGINT NOT NULL,
+        PRIMARY KEY (DETECTION_TABLE, FILE_TYPE)
+    );""",
+}
+
+# Recompute the summary tables from the summarized ones, {length} is the
+# function returning the length of a payload
+SUMMARY_REBUILDS = (
+    "INSERT INTO recordSummary(COIN,DATA_TYPE,RECORD_COUNT,MAX_BLOCK_HEIGHT,MAX_DATA_LENGTH) SELECT cryptoData.COIN, cryptoData.DATA_TYPE, COUNT(*), MAX(cryptoData.BLOCK_HEIGHT), MAX(COALESCE({length}(payloadBlobs.DATA), {length}(cryptoData.DATA))) FROM cryptoData LEFT JOIN payloadBlobs ON payloadBlobs.HASH=cryptoData.PAYLOAD_HASH GROUP BY cryptoData.COIN, cryptoData.DATA_TYPE",
+    "INSERT INTO payloadSummary(ID,PAYLOAD_COUNT) SELECT 0, COUNT(*) FROM payloadBlobs",
+    "INSERT INTO asciiSummary(STRING_LENGTH,STRING_COUNT) SELECT STRING_LENGTH, COUNT(*) FROM asciiData GROUP BY STRING_LENGTH",
+    "INSERT INTO fileTypeSummary(DETECTION_TABLE,FILE_TYPE,FILE_COUNT) SELECT 'magicFileData', FILE_TYPE, COUNT(*) FROM magicFileData GROUP BY FILE_TYPE",
+    "INSERT INTO fileTypeSummary(DETECTION_TABLE,FILE_TYPE,FILE_COUNT) SELECT 'imghdrFileData', FILE_TYPE, COUNT(*) FROM imghdrFileData GROUP BY FILE_TYPE",
+)
+
+# SQLite maintains the summaries with a trigger per inserted row
+SUMMARY_TRIGGERS: Dict[str, str] = {
+    "cryptoDataSummary": """CREATE TRIGGER cryptoDataSummary AFTER INSERT ON cryptoData BEGIN
+        INSERT INTO recordSummary(COIN,DATA_TYPE,RECORD_COUNT,MAX_BLOCK_HEIGHT,MAX_DATA_LENGTH)
+        VALUES(NEW.COIN, NEW.DATA_TYPE, 1, NEW.BLOCK_HEIGHT, IFNULL((SELECT LENGTH(DATA) FROM payloadBlobs WHERE HASH=NEW.PAYLOAD_HASH), LENGTH(NEW.DATA)))
+        ON CONFLICT(COIN, DATA_TYPE) DO UPDATE SET
+            RECORD_COUNT=RECORD_COUNT+1,
+            MAX_BLOCK_HEIGHT=MAX(MAX_BLOCK_HEIGHT, excluded.MAX_BLOCK_HEIGHT),
+            MAX_DATA_LENGTH=MAX(MAX_DATA_LENGTH, excluded.MAX_DATA_LENGTH);
+    END""",
+    "payloadBlobsSummary": """CREATE TRIGGER payloadBlobsSummary AFTER INSERT ON payloadBlobs BEGIN
+        INSERT INTO payloadSummary(ID,PAYLOAD_COUNT) VALUES(0, 1)
+        ON CONFLICT(ID) DO UPDATE SET PAYLOAD_COUNT=PAYLOAD_COUNT+1;
+    END""",
+    "asciiDataSummary": """CREATE TRIGGER asciiDataSummary AFTER INSERT ON asciiData BEGIN
+        INSERT INTO asciiSummary(STRING_LENGTH,STRING_COUNT) VALUES(NEW.STRING_LENGTH, 1)
+        ON CONFLICT(STRING_LENGTH) DO UPDATE SET STRING_COUNT=STRING_COUNT+1;
+    END""",
+    "magicFileDataSummary": """CREATE TRIGGER magicFileDataSummary AFTER INSERT ON magicFileData BEGIN
+        INSERT INTO fileTypeSummary(DETECTION_TABLE,FILE_TYPE,FILE_COUNT) VALUES('magicFileData', NEW.FILE_TYPE, 1)
+        ON CONFLICT(DETECTION_TABLE, FILE_TYPE) DO UPDATE SET FILE_COUNT=FILE_COUNT+1;
+    END""",
+    "imghdrFileDataSummary": """CREATE TRIGGER imghdrFileDataSummary AFTER INSERT ON imghdrFileData BEGIN
+        INSERT INTO fileTypeSummary(DETECTION_TABLE,FILE_TYPE,FILE_COUNT) VALUES('imghdrFileData', NEW.FILE_TYPE, 1)
+        ON CONFLICT(DETECTION_TABLE, FILE_TYPE) DO UPDATE SET FILE_COUNT=FILE_COUNT+1;
+    END""",
+}
+
+ASCII_HISTOGRAM_QUERY = (
+    "SELECT STRING_LENGTH, STRING_COUNT FROM asciiSummary ORDER BY STRING_LENGTH"
+)
+MAGIC_FILE_HISTOGRAM_QUERY = "SELECT FILE_TYPE, FILE_COUNT FROM fileTypeSummary WHERE DETECTION_TABLE='magicFileData' ORDER BY FILE_TYPE"
+IMGHDR_FILE_HISTOGRAM_QUERY = "SELECT FILE_TYPE, FILE_COUNT FROM fileTypeSummary WHERE DETECTION_TABLE='imghdrFileData' ORDER BY FILE_TYPE"
+RECORD_STATISTICS_QUERY = "SELECT COALESCE(SUM(RECORD_COUNT), 0), MAX(MAX_BLOCK_HEIGHT), COALESCE(MAX(MAX_DATA_LENGTH), 0) FROM recordSummary"
+RECORDS_PER_COIN_QUERY = (
+    "SELECT COIN, SUM(RECORD_COUNT) FROM recordSummary GROUP BY COIN ORDER BY COIN"
+)
+PAYLOAD_COUNT_QUERY = "SELECT COALESCE(SUM(PAYLOAD_COUNT), 0) FROM payloadSummary"
+DETECTION_COUNTS_QUERY = "SELECT (SELECT COALESCE(SUM(STRING_COUNT), 0) FROM asciiSummary), (SELECT COALESCE(SUM(FILE_COUNT), 0) FROM fileTypeSummary WHERE DETECTION_TABLE='magicFileData'), (SELECT COALESCE(SUM(FILE_COUNT), 0) FROM fileTypeSummary WHERE DETECTION_TABLE='imghdrFileData')"
+DATA_OF_TYPE_QUERY = "SELECT COALESCE(payloadBlobs.DATA, cryptoData.DATA) FROM cryptoData LEFT JOIN payloadBlobs ON payloadBlobs.HASH=cryptoData.PAYLOAD_HASH WHERE cryptoData.DATA_TYPE=?"
+
+# Queries whose plans are printed by explain_query_plans, with example parameters
+EXPLAINED_QUERIES = {
+    "ascii_histogram": (ASCII_HISTOGRAM_QUERY, ()),
+    "magic_file_histogram": (MAGIC_FILE_HISTOGRAM_QUERY, ()),
+    "imghdr_file_histogram": (IMGHDR_FILE_HISTOGRAM_QUERY, ()),
+    "record_statistics": (RECORD_STATISTICS_QUERY, ()),
+    "detection_counts": (DETECTION_COUNTS_QUERY, ()),
+    "data_of_type": (DATA_OF_TYPE_QUERY, (DATATYPE.SCRIPT_PUBKEY.value,)),
+    "payload_lookup": (
+        "SELECT HASH, DATA FROM payloadBlobs WHERE HASH IN (?,?)",
+        (b"", b""),
+    ),
+    "records_of_coin": (
+        "SELECT COUNT(*) FROM cryptoData WHERE COIN=? AND BLOCK_HEIGHT>=?",
+        (BLOCKCHAIN.BITCOIN_MAINNET.value, 0),
+    ),
+    "detected_ascii_payloads": (
+        "SELECT COALESCE(payloadBlobs.DATA, cryptoData.DATA) FROM asciiData JOIN cryptoData USING (TXID, EXTRA_INDEX, DATA_TYPE) LEFT JOIN payloadBlobs ON payloadBlobs.HASH=cryptoData.PAYLOAD_HASH WHERE asciiData.STRING_LENGTH>=?",
+        (100,),
+    ),
+}
+
+# Records are keyed by (TXID, EXTRA_INDEX, DATA_TYPE), inserting an already
+# stored record again is a no-op, which makes re-parsing a range idempotent
+INSERT_RECORD = "INSERT OR IGNORE INTO cryptoData(DATA,TXID,COIN,DATA_TYPE,BLOCK_HEIGHT,EXTRA_INDEX) values(?,?,?,?,?,?)"
+
+# With payload deduplication a record references its payload by hash and
+# stores an empty DATA, every distinct payload is stored once in payloadBlobs
+INSERT_PAYLOAD = "INSERT OR IGNORE INTO payloadBlobs(HASH,DATA) values(?,?)"
+INSERT_REFERENCING_RECORD = "INSERT OR IGNORE INTO cryptoData(DATA,TXID,COIN,DATA_TYPE,BLOCK_HEIGHT,EXTRA_INDEX,PAYLOAD_HASH) values(?,?,?,?,?,?,?)"
+
+# Payloads are keyed by a 128 bit BLAKE2b digest, which is faster to compute
+# than SHA-256 and short enough to keep the references small
+PAYLOAD_HASH_SIZE = 16
+
+# Number of records fetched by a single query of a keyset scan. The
+# detections of a page are written and committed together with the ledger.
+SCAN_PAGE_SIZE = 1000
+
+# Number of deduplicated payloads whose detection result is kept, so a payload
+# referenced by many records is usually analyzed once
+PAYLOAD_CACHE_SIZE = 65536
+
+# Number of pages of records a detection worker process has queued, so the
+# scan stays ahead of the workers without reading the whole table
+DETECTION_PAGES_PER_WORKER = 2
+
+# Maximum number of payloads fetched by a single query, below the SQLite
+# limit of 999 parameters
+PAYLOAD_LOOKUP_SIZE = 500
+
+# Ledger key of a detection run over the records of every coin
+ALL_COINS = "all"
+
+# Smaller than every rowid, where a keyset scan over the rowids starts
+MIN_ROWID = -(2**63)
+
+
+def detect_payloads(
+    detector: DetectorFunc, payloads: Sequence[DetectorPayload]
+) -> List[Optional[NamedTuple]]:
+    """Runs a detector over a chunk of payloads, e.g. in a detection worker process
+    :param detector: Detector run on every payload.
+    :type detector: DetectorFunc
+    :param payloads: Payloads to be examined.
+    :type payloads: Sequence[DetectorPayload]
+    :return: The detection result of every payload, None if nothing was detected.
+    :rtype: List[Optional[NamedTuple]]
+    """
+    return [detector(payload) for payload in payloads]
+
+
+def payload_hash(data: Union[bytes, str]) -> bytes:
+    """Returns the key of a payload in the payloadBlobs table"""
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.blake2b(data, digest_size=PAYLOAD_HASH_SIZE).digest()
+
+
+class BACKEND(enum.Enum):
+    """Storage backends of a Database"""
+
+    SQLITE = "sqlite"  # default, row store suited for parsing and point lookups
+    DUCKDB = "duckdb"  # embedded column store suited for analytical queries
+
+
+class StorageBackend(ABC):
+    """Executes the statements of a Database on a storage engine. The queries
+    are written in the SQL dialect shared by the backends, only the statements
+    that differ are implemented by each backend."""
+
+    # Function returning the length of a payload in the summary rebuild
+    length_function = "LENGTH"
+
+    @abstractmethod
+    def create_schema(self) -> None:
+        """Creates the missing tables"""
+        pass
+
+    @abstractmethod
+    def insert_records(
+        self,
+        records: Sequence[CryptoDataRecord],
+        payload_hashes: Optional[Sequence[bytes]],
+    ) -> InsertResult:
+        """Inserts a batch of records, skipping the records that are already
+        stored. With payload hashes, the payloads are stored in payloadBlobs
+        and the records reference them."""
+        pass
+
+    @abstractmethod
+    def insert_rows(
+        self, table: str, columns: Sequence[str], rows: Sequence[Sequence[Any]]
+    ) -> int:
+        """Inserts and commits rows of a table, skipping the rows whose key is
+        already stored, and returns the number of inserted rows"""
+        pass
+
+    @abstractmethod
+    def iter_batches(
+        self, query: str, batch_size: int, parameters: Sequence[Any] = ()
+    ) -> Iterator[List[Tuple[Any, ...]]]:
+        """Streams the rows of a query in batches. Other statements of the
+        calling thread may be executed while the batches are consumed."""
+        pass
+
+    @abstractmethod
+    def query(
+        self, query: str, parameters: Sequence[Any] = ()
+    ) -> List[Tuple[Any, ...]]:
+        """Returns all rows of a query"""
+        pass
+
+    @abstractmethod
+    def read_query(
+        self, query: str, parameters: Sequence[Any] = ()
+    ) -> List[Tuple[Any, ...]]:
+        """Returns all rows of a query, read on a connection of its own. It
+        only sees committed rows and leaves the pending transaction of the
+        calling thread alone."""
+        pass
+
+    @abstractmethod
+    def execute(self, statement: str, parameters: Sequence[Any] = ()) -> None:
+        """Executes a statement in the pending transaction of the calling thread"""
+        pass
+
+    @abstractmethod
+    def commit(self) -> None:
+        """Commits the pending transaction of the calling thread"""
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        """Commits and closes the connection of the calling thread"""
+        pass
+
+    @abstractmethod
+    def rebuild_summaries(self) -> None:
+        """Recomputes and commits the summary tables in a single transaction"""
+        pass
+
+    @abstractmethod
+    def create_indexes(self) -> int:
+        """Creates the missing secondary indexes and returns their number"""
+        pass
+
+    @abstractmethod
+    def drop_indexes(self) -> None:
+        """Drops the secondary indexes"""
+        pass
+
+    @abstractmethod
+    def reindex(self) -> None:
+        """Rebuilds the indexes and updates the statistics of the query planner"""
+        pass
+
+    @abstractmethod
+    def analyze(self) -> None:
+        """Updates the statistics of the query planner"""
+        pass
+
+    @abstractmethod
+    def explain(self, query: str, parameters: Sequence[Any] = ()) -> List[str]:
+        """Returns the plan of a query, one line per step"""
+        pass
+
+    def histogram(self, query: str) -> List[Tuple[Any, int]]:
+        """Returns the counts of a histogram query"""
+        return self.query(query)
+
+    def record_statistics(self) -> Tuple[int, Optional[int], int]:
+        """Returns the row count, maximum block height and maximum payload length"""
+        total_rows, max_block_height, max_length = self.query(RECORD_STATISTICS_QUERY)[
+            0
+        ]
+        return total_rows, max_block_height, max_length
+
+    def detection_key_statements(self, existing: Set[str]) -> List[str]:
+        """Returns the statements creating the missing detection keys, each
+        after removing the duplicates of its table
+        :param existing: Names of the indexes of the database.
+        :type existing: Set[str]
+        :return: The statements, none if every key exists.
+        :rtype: List[str]
+        """
+        statements = []
+        for key in DETECTION_KEYS:
+            if key.name in existing:
+                continue
+            statements.append(
+                REMOVE_DUPLICATE_DETECTIONS.format(table=key.table, columns=key.columns)
+            )
+            statements.append(
+                "CREATE UNIQUE INDEX %s ON %s(%s)" % (key.name, key.table, key.columns)
+            )
+        return statements
+
+    def summary_rebuild_statements(self) -> List[str]:
+        """Returns the statements emptying and recomputing the summary tables"""
+        return ["DELETE FROM %s" % table for table in SUMMARY_TABLES] + [
+            statement.format(length=self.length_function)
+            for statement in SUMMARY_REBUILDS
+        ]
+
+
+class SQLiteBackend(StorageBackend):
+    def __init__(
+        self,
+        name: str,
+        bulk_load: bool = False,
+        commit_interval: int = BULK_LOAD_COMMIT_INTERVAL,
+    ) -> None:
+        """
+        :param name: Path of the SQLite database file.
+        :type name: str
+        :param bulk_load: Open the connections in WAL mode without syncing and commit inserts in larger transactions.
+        :type bulk_load: bool
+        :param commit_interval: Number of inserted batches per transaction in bulk load mode.
+        :type commit_interval: int
+        """
         self.name = name
-        conn = sqlite3.connect(self.name)
+        self.bulk_load = bulk_load
+        self._commit_interval = commit_interval if bulk_load else 1
+        # Every thread keeps its own connection, sqlite3 connections can not be
+        # shared between threads
+        self._local = threading.local()
+
+    def create_schema(self) -> None:
+        conn = self._connection()
         c = conn.cursor()
         c.execute(
             """ SELECT count(name) FROM sqlite_master WHERE type='table' AND name='cryptoData' """
@@ -115,11 +565,30 @@ class Database:
                 DATA_TYPE TEXT NOT NULL,
                 BLOCK_HEIGHT INTEGER NOT NULL,
                 EXTRA_INDEX INTEGER NOT NULL,
+                PAYLOAD_HASH BLOB,
                 PRIMARY KEY (TXID, EXTRA_INDEX, DATA_TYPE),
                 UNIQUE(TXID, EXTRA_INDEX, DATA_TYPE)
             );"""
             )
             print("Crypto Data Table successfully created")
+        elif "PAYLOAD_HASH" not in {
+            row[1] for row in c.execute("PRAGMA table_info(cryptoData)")
+        }:
+            # Databases created before payload deduplication store every payload inline
+            c.execute("ALTER TABLE cryptoData ADD COLUMN PAYLOAD_HASH BLOB")
+            print("cryptoData PAYLOAD_HASH column successfully added")
+
+        c.execute(
+            """ SELECT count(name) FROM sqlite_master WHERE type='table' AND name='payloadBlobs' """
+        )
+        if not c.fetchone()[0] == 1:
+            c.execute(
+                """CREATE TABLE payloadBlobs(
+                    HASH BLOB NOT NULL PRIMARY KEY,
+                    DATA BLOB NOT NULL
+                );"""
+            )
+            print("payloadBlobs Table successfully created")
 
         c.execute(
             """ SELECT count(name) FROM sqlite_master WHERE type='table' AND name='asciiData' """
@@ -166,23 +635,284 @@ class Database:
             )
             print("imghdrFileData Table successfully created")
 
+        c.execute(
+            """ SELECT count(name) FROM sqlite_master WHERE type='table' AND name='parseCheckpoints' """
+        )
+        if not c.fetchone()[0] == 1:
+            c.execute(
+                """CREATE TABLE parseCheckpoints(
+                    COIN TEXT NOT NULL,
+                    STAGE TEXT NOT NULL,
+                    BLOCK_HEIGHT INTEGER NOT NULL,
+                    PRIMARY KEY (COIN, STAGE)
+                );"""
+            )
+            print("parseCheckpoints Table successfully created")
+
+        c.execute(
+            """ SELECT count(name) FROM sqlite_master WHERE type='table' AND name='detectionLedger' """
+        )
+        if not c.fetchone()[0] == 1:
+            c.execute(
+                """CREATE TABLE detectionLedger(
+                    DETECTOR TEXT NOT NULL,
+                    COIN TEXT NOT NULL,
+                    LAST_ROWID INTEGER NOT NULL,
+                    PRIMARY KEY (DETECTOR, COIN)
+                );"""
+            )
+            print("detectionLedger Table successfully created")
+
+        existing = {name for (name,) in c.execute("SELECT name FROM sqlite_master")}
+        created_summaries = False
+        for table, statement in SUMMARY_TABLES.items():
+            if table not in existing:
+                c.execute(statement)
+                print(table, "Table successfully created")
+                created_summaries = True
+        for trigger, statement in SUMMARY_TRIGGERS.items():
+            if trigger not in existing:
+                c.execute(statement)
+        key_statements = self.detection_key_statements(existing)
+        for statement in key_statements:
+            c.execute(statement)
+        if len(key_statements) > 0:
+            for index in REPLACED_INDEXES:
+                c.execute("DROP INDEX IF EXISTS %s" % index)
+            print("detection keys successfully created")
         conn.commit()
+        if created_summaries or len(key_statements) > 0:
+            # Summarize the rows a database created before the summaries or
+            # the detection keys holds
+            self.rebuild_summaries()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the connection of the calling thread, opening it on first use"""
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.name)
+            if self.bulk_load:
+                for pragma in BULK_LOAD_PRAGMAS:
+                    conn.execute(pragma)
+            self._local.conn = conn
+            self._local.pending_batches = 0
+        return conn
+
+    def commit(self) -> None:
+        conn = self._connection()
+        conn.commit()
+        self._local.pending_batches = 0
+
+    def close(self) -> None:
+        """Commits and closes the connection of the calling thread, folding the
+        write-ahead log back into the database file in bulk load mode. The
+        thread opens a new connection if it uses the database again."""
+        reader: Optional[sqlite3.Connection] = getattr(self._local, "reader", None)
+        if reader is not None:
+            reader.close()
+            self._local.reader = None
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        conn.commit()
+        if self.bulk_load:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
         conn.close()
+        self._local.conn = None
+
+    def insert_records(
+        self,
+        records: Sequence[CryptoDataRecord],
+        payload_hashes: Optional[Sequence[bytes]],
+    ) -> InsertResult:
+        conn = self._connection()
+        # The row counts of the statements, unlike total_changes, leave out the
+        # rows the summary triggers update
+        if payload_hashes is not None:
+            stored_payloads = conn.executemany(
+                INSERT_PAYLOAD,
+                [(hash, record.data) for hash, record in zip(payload_hashes, records)],
+            ).rowcount
+            inserted = conn.executemany(
+                INSERT_REFERENCING_RECORD,
+                [
+                    (b"",) + tuple(record[1:]) + (hash,)
+                    for hash, record in zip(payload_hashes, records)
+                ],
+            ).rowcount
+        else:
+            inserted = conn.executemany(INSERT_RECORD, records).rowcount
+            stored_payloads = inserted
+
+        self._local.pending_batches += 1
+        if self._local.pending_batches >= self._commit_interval:
+            self.commit()
+        return InsertResult(inserted, len(records) - inserted, stored_payloads)
+
+    def insert_rows(
+        self, table: str, columns: Sequence[str], rows: Sequence[Sequence[Any]]
+    ) -> int:
+        conn = self._connection()
+        inserted = conn.executemany(
+            "INSERT OR IGNORE INTO %s(%s) values(%s)"
+            % (table, ",".join(columns), ",".join("?" * len(columns))),
+            rows,
+        ).rowcount
+        self.commit()
+        return inserted
+
+    def iter_batches(
+        self, query: str, batch_size: int, parameters: Sequence[Any] = ()
+    ) -> Iterator[List[Tuple[Any, ...]]]:
+        c = self._connection().cursor()
+        c.execute(query, parameters)
+        while True:
+            rows = c.fetchmany(batch_size)
+            if len(rows) == 0:
+                break
+            yield rows
+        c.close()
+
+    def query(
+        self, query: str, parameters: Sequence[Any] = ()
+    ) -> List[Tuple[Any, ...]]:
+        return self._connection().execute(query, parameters).fetchall()
+
+    def _reader(self) -> sqlite3.Connection:
+        """Returns the read connection of the calling thread, opening it on first use"""
+        reader: Optional[sqlite3.Connection] = getattr(self._local, "reader", None)
+        if reader is None:
+            reader = sqlite3.connect(self.name)
+            self._local.reader = reader
+        return reader
 
-    def insert_records(self, records: Iterable[CryptoDataRecord],) -> None:
-        conn = sqlite3.connect(self.name)
-        try:
-            conn.executemany(
-                "INSERT INTO cryptoData(DATA,TXID,COIN,DATA_TYPE,BLOCK_HEIGHT,EXTRA_INDEX) values(?,?,?,?,?,?)",
-                records,
+    def read_query(
+        self, query: str, parameters: Sequence[Any] = ()
+    ) -> List[Tuple[Any, ...]]:
+        # Outside of a transaction every read holds its lock only until the
+        # rows are fetched
+        return self._reader().execute(query, parameters).fetchall()
+
+    def execute(self, statement: str, parameters: Sequence[Any] = ()) -> None:
+        self._connection().execute(statement, parameters)
+
+    def rebuild_summaries(self) -> None:
+        conn = self._connection()
+        for statement in self.summary_rebuild_statements():
+            conn.execute(statement)
+        self.commit()
+
+    def create_indexes(self) -> int:
+        conn = self._connection()
+        existing = {
+            name
+            for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='index'"
             )
-        except sqlite3.IntegrityError:
-            return
-        except BaseException:
-            raise
+        }
+        created = 0
+        for index in SECONDARY_INDEXES:
+            if index.name in existing:
+                continue
+            conn.execute(
+                "CREATE INDEX %s ON %s(%s)" % (index.name, index.table, index.columns)
+            )
+            print("index", index.name, "successfully created")
+            created += 1
+        conn.commit()
+        if created > 0:
+            self.analyze()
+        return created
 
+    def drop_indexes(self) -> None:
+        conn = self._connection()
+        for index in SECONDARY_INDEXES:
+            conn.execute("DROP INDEX IF EXISTS %s" % index.name)
         conn.commit()
-        conn.close()
+
+    def reindex(self) -> None:
+        conn = self._connection()
+        conn.execute("REINDEX")
+        conn.commit()
+        self.analyze()
+
+    def analyze(self) -> None:
+        conn = self._connection()
+        conn.execute("ANALYZE")
+        conn.commit()
+
+    def explain(self, query: str, parameters: Sequence[Any] = ()) -> List[str]:
+        return [
+            row[-1]
+            for row in self._connection().execute(
+                "EXPLAIN QUERY PLAN " + query, parameters
+            )
+        ]
+
+
+def open_backend(
+    backend: BACKEND, name: str, bulk_load: bool, commit_interval: int
+) -> StorageBackend:
+    """Returns the storage backend of a database file"""
+    if backend == BACKEND.SQLITE:
+        return SQLiteBackend(name, bulk_load, commit_interval)
+    elif backend == BACKEND.DUCKDB:
+        # duckdb_backend builds on this module, so it can only be imported here
+        from duckdb_backend import DuckDBBackend
+
+        return DuckDBBackend(name)
+    else:
+        raise BaseException("invalid storage backend")
+
+
+class Database:
+    def __init__(
+        self,
+        name: str,
+        bulk_load: bool = False,
+        commit_interval: int = BULK_LOAD_COMMIT_INTERVAL,
+        deduplicate: bool = False,
+        backend: BACKEND = BACKEND.SQLITE,
+    ) -> None:
+        """
+        :param name: Path of the database file.
+        :type name: str
+        :param bulk_load: Open the connections in WAL mode without syncing and commit inserts in larger transactions, only used by the SQLite backend.
+        :type bulk_load: bool
+        :param commit_interval: Number of inserted batches per transaction in bulk load mode.
+        :type commit_interval: int
+        :param deduplicate: Store every distinct payload once in payloadBlobs and insert records referencing it.
+        :type deduplicate: bool
+        :param backend: Storage engine of the database file.
+        :type backend: BACKEND
+        """
+        self.name = name
+        self.bulk_load = bulk_load
+        self.deduplicate = deduplicate
+        self.backend = backend
+        self._backend = open_backend(backend, name, bulk_load, commit_interval)
+        self._backend.create_schema()
+
+    def commit(self) -> None:
+        """Commits the records inserted by the calling thread"""
+        self._backend.commit()
+
+    def close(self) -> None:
+        """Commits and closes the connection of the calling thread. The thread
+        opens a new connection if it uses the database again."""
+        self._backend.close()
+
+    def insert_records(self, records: Sequence[CryptoDataRecord]) -> InsertResult:
+        """Inserts a batch of records, skipping the records that are already stored.
+        :param records: Records to be inserted.
+        :type records: Sequence[CryptoDataRecord]
+        :return: The number of inserted and skipped records and of the newly stored payloads.
+        :rtype: InsertResult
+        """
+        payload_hashes = None
+        if self.deduplicate:
+            payload_hashes = [payload_hash(record.data) for record in records]
+        return self._backend.insert_records(records, payload_hashes)
 
     def insert_record(
         self,
@@ -193,87 +923,136 @@ class Database:
         block_height: int,
         extra_index: int,
     ) -> None:
-        conn = sqlite3.connect(self.name)
         """Insert a new record into the database."""
-        try:
-            conn.execute(
-                "INSERT INTO cryptoData(DATA,TXID,COIN,DATA_TYPE,BLOCK_HEIGHT,EXTRA_INDEX) values(?,?,?,?,?,?)",
-                (data, txid, coin.value, data_type.value, block_height, extra_index),
-            )
-            conn.commit()
-            conn.close()
-        except sqlite3.IntegrityError:
-            return
-        except BaseException:
-            raise
+        self.insert_records(
+            [
+                CryptoDataRecord(
+                    data, txid, coin.value, data_type.value, block_height, extra_index
+                )
+            ]
+        )
+
+    def iter_batches(
+        self, query: str, batch_size: int, parameters: Sequence[Any] = ()
+    ) -> Iterator[List[Tuple[Any, ...]]]:
+        """Streams the rows of a query in batches, without fetching all of them at once.
+        :param query: Query whose rows are fetched.
+        :type query: str
+        :param batch_size: Maximum number of rows of a batch.
+        :type batch_size: int
+        :param parameters: Parameters of the query.
+        :type parameters: Sequence[Any]
+        :return: Batches of rows, only the last one may hold less than batch_size rows.
+        :rtype: Iterator[List[Tuple[Any, ...]]]
+        """
+        return self._backend.iter_batches(query, batch_size, parameters)
+
+    def insert_rows(
+        self, table: str, columns: Sequence[str], rows: Sequence[Sequence[Any]]
+    ) -> int:
+        """Inserts and commits rows of a table, skipping the rows whose key is already stored.
+        :param table: Name of the table.
+        :type table: str
+        :param columns: Names of the columns, in the order of the row values.
+        :type columns: Sequence[str]
+        :param rows: Rows to be inserted.
+        :type rows: Sequence[Sequence[Any]]
+        :return: The number of inserted rows.
+        :rtype: int
+        """
+        return self._backend.insert_rows(table, columns, rows)
+
+    def create_indexes(self) -> int:
+        """Creates the missing secondary indexes and updates the statistics of
+        the query planner if any was created.
+        :return: The number of created indexes.
+        :rtype: int
+        """
+        return self._backend.create_indexes()
+
+    def drop_indexes(self) -> None:
+        """Drops the secondary indexes, e.g. before a bulk load"""
+        self._backend.drop_indexes()
+
+    def reindex(self) -> None:
+        """Rebuilds all indexes and updates the statistics of the query planner"""
+        self._backend.reindex()
+
+    def analyze(self) -> None:
+        """Updates the statistics the query planner uses to choose an index"""
+        self._backend.analyze()
+
+    def rebuild_summaries(self) -> None:
+        """Recomputes the summary tables from the records and detections, e.g.
+        after rows were deleted"""
+        self._backend.rebuild_summaries()
+        print("summary tables successfully rebuilt")
+
+    def explain_query_plans(self) -> Dict[str, List[str]]:
+        """Returns the query plans of the EXPLAINED_QUERIES, one line per step"""
+        return {
+            name: self._backend.explain(query, parameters)
+            for name, (query, parameters) in EXPLAINED_QUERIES.items()
+        }
+
+    def get_checkpoint(self, coin: BLOCKCHAIN, stage: PARSESTAGE) -> Optional[int]:
+        """Returns the last height whose records are fully committed, None if there is none."""
+        result = self._backend.query(
+            "SELECT BLOCK_HEIGHT FROM parseCheckpoints WHERE COIN=? AND STAGE=?",
+            (coin.value, stage.value),
+        )
+        if len(result) == 0:
+            return None
+        return result[0][0]
+
+    def set_checkpoint(self, coin: BLOCKCHAIN, stage: PARSESTAGE, height: int) -> None:
+        """Records that all records up to and including the height are committed.
+        The checkpoint is committed together with the pending records of the calling thread.
+        """
+        self._backend.execute(
+            "INSERT OR REPLACE INTO parseCheckpoints(COIN,STAGE,BLOCK_HEIGHT) values(?,?,?)",
+            (coin.value, stage.value, height),
+        )
+        self.commit()
 
     def get_records(self, txid: str, extra_index: int) -> None:
-        conn = sqlite3.connect(self.name)
         """Print all the records in the database."""
-        c = conn.cursor()
-        c.execute(
+        result = self._backend.query(
             "SELECT * FROM  cryptoData WHERE txid=? AND extra_index=?",
             (txid, extra_index),
         )
-        result = c.fetchall()
-        conn.commit()
-        conn.close()
         print(result)
 
     def get_data(self, data_type: DATATYPE) -> List[bytes]:
-        conn = sqlite3.connect(self.name)
-        c = conn.cursor()
-        c.execute("SELECT data FROM cryptoData WHERE data_type=?", (data_type.value,))
-        results = c.fetchall()
-        return results
+        return self._backend.query(DATA_OF_TYPE_QUERY, (data_type.value,))
 
     def ascii_histogram(self, blockchain: Optional[BLOCKCHAIN]) -> List[ASCIIHistogram]:
-        conn = sqlite3.connect(self.name)
-        c = conn.cursor()
-        c.execute(
-            "SELECT STRING_LENGTH, COUNT(STRING_LENGTH) FROM asciiData GROUP BY STRING_LENGTH ORDER BY STRING_LENGTH"
-        )
-        results = c.fetchall()
-        return results
+        return self._backend.histogram(ASCII_HISTOGRAM_QUERY)
 
     def magic_file_histogram(
         self, blockchain: Optional[BLOCKCHAIN]
     ) -> List[FileTypeHistogram]:
-        conn = sqlite3.connect(self.name)
-        c = conn.cursor()
-        c.execute(
-            "SELECT FILE_TYPE, COUNT(FILE_TYPE) FROM magicFileData GROUP BY FILE_TYPE ORDER BY FILE_TYPE"
-        )
-        results = c.fetchall()
-        return results
+        return self._backend.histogram(MAGIC_FILE_HISTOGRAM_QUERY)
 
     def imghdr_file_histogram(
         self, blockchain: Optional[BLOCKCHAIN]
     ) -> List[FileTypeHistogram]:
-        conn = sqlite3.connect(self.name)
-        c = conn.cursor()
-        c.execute(
-            "SELECT FILE_TYPE, COUNT(FILE_TYPE) FROM imghdrFileData GROUP BY FILE_TYPE ORDER BY FILE_TYPE"
-        )
-        results = c.fetchall()
-        return results
+        return self._backend.histogram(IMGHDR_FILE_HISTOGRAM_QUERY)
 
     def get_record_statistics(
         self, blockchain: Optional[BLOCKCHAIN]
     ) -> RecordStatistics:
-        conn = sqlite3.connect(self.name)
-        c = conn.cursor()
-        c.execute(
-            "SELECT COUNT(*), MAX(BLOCK_HEIGHT), MAX(LENGTH(DATA)) FROM cryptoData"
-        )
-        total_rows, max_block_height, max_length = c.fetchall()[0]
+        total_rows, max_block_height, max_length = self._backend.record_statistics()
         print("Maximum data record size:", max_length)
-        c.execute("SELECT COUNT(*) FROM asciiData")
-        total_strings = c.fetchall()[0][0]
-        c.execute("SELECT COUNT(*) FROM magicFileData")
-        total_magic_files = c.fetchall()[0][0]
-        c.execute("SELECT COUNT(*) FROM imghdrFileData")
-        total_imghdr_files = c.fetchall()[0][0]
+        for coin, coin_rows in self._backend.query(RECORDS_PER_COIN_QUERY):
+            print("Records of", coin + ":", coin_rows)
+        print(
+            "Deduplicated payloads stored:",
+            self._backend.query(PAYLOAD_COUNT_QUERY)[0][0],
+        )
+        total_strings, total_magic_files, total_imghdr_files = self._backend.query(
+            DETECTION_COUNTS_QUERY
+        )[0]
         return RecordStatistics(
             total_rows,
             max_block_height,
@@ -283,109 +1062,349 @@ class Database:
         )
 
     def insert_detected_ascii_records(
-        self, records: Sequence[DetectedAsciiPayload], conn: sqlite3.Connection
+        self, records: Sequence[DetectedAsciiPayload]
     ) -> None:
-        c = conn.cursor()
-        try:
-            c.executemany(
-                "INSERT INTO asciiData(TXID,DATA_TYPE,EXTRA_INDEX,STRING_LENGTH) values (?,?,?,?)",
-                records,
-            )
-
-        except sqlite3.IntegrityError:
-            print("integrity error")
-            return
-        except BaseException:
-            print("base exception")
-            raise
-        c.close()
+        self._backend.insert_rows(
+            "asciiData", ("TXID", "DATA_TYPE", "EXTRA_INDEX", "STRING_LENGTH"), records
+        )
 
     def insert_detected_magic_file_records(
-        self, records: Sequence[DetectedAsciiPayload], conn: sqlite3.Connection
+        self, records: Sequence[DetectedFilePayload]
     ) -> None:
-        c = conn.cursor()
-        try:
-            c.executemany(
-                "INSERT INTO magicFileData(TXID,DATA_TYPE,EXTRA_INDEX,FILE_TYPE) values (?,?,?,?)",
-                records,
-            )
-        except sqlite3.InterfaceError:
-            print("integrity error")
-            return
-        except BaseException:
-            print("base exception")
-            raise
-        c.close()
+        self._backend.insert_rows(
+            "magicFileData", ("TXID", "DATA_TYPE", "EXTRA_INDEX", "FILE_TYPE"), records
+        )
 
     def insert_detected_imghdr_file_records(
-        self, records: Sequence[DetectedAsciiPayload], conn: sqlite3.Connection
+        self, records: Sequence[DetectedFilePayload]
     ) -> None:
-        c = conn.cursor()
-        try:
-            c.executemany(
-                "INSERT INTO imghdrFileData(TXID,DATA_TYPE,EXTRA_INDEX,FILE_TYPE) values (?,?,?,?)",
-                records,
+        self._backend.insert_rows(
+            "imghdrFileData", ("TXID", "DATA_TYPE", "EXTRA_INDEX", "FILE_TYPE"), records
+        )
+
+    def rowid_bounds(self) -> Tuple[Optional[int], Optional[int]]:
+        """Returns the smallest and largest rowid of the records, None if there
+        are none. Unlike a COUNT, SQLite reads them from the ends of the table
+        b-tree without scanning it."""
+        lowest, highest = self._backend.read_query(
+            "SELECT MIN(rowid), MAX(rowid) FROM cryptoData"
+        )[0]
+        return lowest, highest
+
+    def get_detection_ledger(
+        self, detector: str, coin: Optional[BLOCKCHAIN]
+    ) -> Optional[int]:
+        """Returns the last rowid whose detections are committed, None if the detector never ran on the coin."""
+        result = self._backend.query(
+            "SELECT LAST_ROWID FROM detectionLedger WHERE DETECTOR=? AND COIN=?",
+            (detector, ALL_COINS if coin is None else coin.value),
+        )
+        if len(result) == 0:
+            return None
+        return result[0][0]
+
+    def set_detection_ledger(
+        self, detector: str, coin: Optional[BLOCKCHAIN], rowid: int
+    ) -> None:
+        """Records that the detector analyzed the records of the coin up to and including the rowid.
+        The ledger is committed together with the pending detections of the calling thread.
+        """
+        self._backend.execute(
+            "INSERT OR REPLACE INTO detectionLedger(DETECTOR,COIN,LAST_ROWID) values(?,?,?)",
+            (detector, ALL_COINS if coin is None else coin.value, rowid),
+        )
+
+    def scan_records(
+        self,
+        columns: Sequence[str],
+        record_filter: RecordFilter = RecordFilter(),
+        conditions: Sequence[str] = (),
+        page_size: int = SCAN_PAGE_SIZE,
+        start_rowid: int = MIN_ROWID,
+    ) -> Iterator[List[Tuple[Any, ...]]]:
+        """Streams the records matching a filter in pages ordered by rowid.
+        Every page is a query of its own on the read connection, continuing
+        after the last rowid of the previous page, so no cursor is kept open
+        while the caller writes and commits in between.
+        :param columns: Columns of the records to be fetched.
+        :type columns: Sequence[str]
+        :param record_filter: Predicates the records have to match.
+        :type record_filter: RecordFilter
+        :param conditions: Further WHERE conditions without parameters.
+        :type conditions: Sequence[str]
+        :param page_size: Maximum number of records per page.
+        :type page_size: int
+        :param start_rowid: Only stream the records after this rowid.
+        :type start_rowid: int
+        :return: Pages of records, every row starts with the rowid followed by the columns.
+        :rtype: Iterator[List[Tuple[Any, ...]]]
+        """
+        predicates, parameters = record_filter.predicates()
+        query = "SELECT rowid, %s FROM cryptoData WHERE %s ORDER BY rowid LIMIT ?" % (
+            ", ".join(columns),
+            " AND ".join(["rowid>?"] + predicates + list(conditions)),
+        )
+        last_rowid = start_rowid
+        while True:
+            rows = self._backend.read_query(
+                query, [last_rowid] + parameters + [page_size]
+            )
+            if len(rows) == 0:
+                break
+            yield rows
+            last_rowid = rows[-1][0]
+
+    def _lookup_payloads(self, hashes: Sequence[bytes]) -> Dict[bytes, Any]:
+        """Returns the deduplicated payloads of the hashes"""
+        payloads: Dict[bytes, Any] = {}
+        for start in range(0, len(hashes), PAYLOAD_LOOKUP_SIZE):
+            chunk = hashes[start : start + PAYLOAD_LOOKUP_SIZE]
+            payloads.update(
+                self._backend.read_query(
+                    "SELECT HASH, DATA FROM payloadBlobs WHERE HASH IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    chunk,
+                )
             )
-        except sqlite3.InterfaceError:
-            print("integrity error")
+        return payloads
+
+    def _plan_detection_page(
+        self,
+        rows: List[Tuple[Any, ...]],
+        cached: "OrderedDict[bytes, Optional[NamedTuple]]",
+        in_flight: Dict[bytes, List[Any]],
+    ) -> DetectionPage:
+        """Selects the payloads of a page of records that have to be analyzed.
+        A deduplicated payload is analyzed once, unless its result is cached or
+        an earlier page in flight analyzes it.
+        :param rows: Records of the page, as returned by scan_records.
+        :type rows: List[Tuple[Any, ...]]
+        :param cached: Detection results of the recently analyzed payloads.
+        :type cached: OrderedDict[bytes, Optional[NamedTuple]]
+        :param in_flight: Number of pages in flight referencing a payload analyzed by one of them, and its result once collected, by payload hash.
+        :type in_flight: Dict[bytes, List[Any]]
+        :return: The page with the payloads to be analyzed.
+        :rtype: DetectionPage
+        """
+        known: Dict[Union[int, bytes], Optional[NamedTuple]] = {}
+        deferred: List[bytes] = []
+        missing = set()
+        for hash in {row[5] for row in rows if row[5] is not None}:
+            if hash in in_flight:
+                in_flight[hash][0] += 1
+                deferred.append(hash)
+            elif hash in cached:
+                known[hash] = cached[hash]
+                cached.move_to_end(hash)
+            else:
+                in_flight[hash] = [1, None]
+                missing.add(hash)
+        payloads = self._lookup_payloads(list(missing))
+        analyzed: List[DetectorPayload] = []
+        keys: List[Union[int, bytes]] = []
+        for rowid, data, txid, data_type, extra_index, hash in rows:
+            if hash is None:
+                keys.append(rowid)
+            elif hash in missing:
+                keys.append(hash)
+                missing.discard(hash)
+                data = payloads[hash]
+            else:
+                continue
+            analyzed.append(DetectorPayload(txid, data_type, extra_index, data))
+        return DetectionPage(rows, analyzed, keys, known, deferred)
+
+    def _collect_detection_page(
+        self,
+        page: DetectionPage,
+        results: List[Optional[NamedTuple]],
+        in_flight: Dict[bytes, List[Any]],
+    ) -> Dict[Union[int, bytes], Optional[NamedTuple]]:
+        """Returns the detection results of the keys of a page, the pages have
+        to be collected in the order they were planned"""
+        detections = page.known
+        hashes = list(page.deferred)
+        for key, result in zip(page.keys, results):
+            detections[key] = result
+            if isinstance(key, bytes):
+                in_flight[key][1] = result
+                hashes.append(key)
+        for hash in page.deferred:
+            detections[hash] = in_flight[hash][1]
+        for hash in hashes:
+            in_flight[hash][0] -= 1
+            if in_flight[hash][0] == 0:
+                del in_flight[hash]
+        return detections
+
+    def _detect_pages(
+        self,
+        batch_detector: BatchDetectorFunc,
+        record_filter: RecordFilter,
+        start_rowid: int,
+        cached: "OrderedDict[bytes, Optional[NamedTuple]]",
+        workers: int,
+        worker_initializer: Optional[Callable[[], None]],
+    ) -> Iterator[
+        Tuple[List[Tuple[Any, ...]], Dict[Union[int, bytes], Optional[NamedTuple]], int]
+    ]:
+        """Yields the pages of records in rowid order, with the detection
+        results of their keys and the number of analyzed payloads"""
+        pages = self.scan_records(
+            ("DATA", "TXID", "DATA_TYPE", "EXTRA_INDEX", "PAYLOAD_HASH"),
+            record_filter,
+            start_rowid=start_rowid,
+        )
+        in_flight: Dict[bytes, List[Any]] = {}
+        if workers <= 1:
+            for rows in pages:
+                page = self._plan_detection_page(rows, cached, in_flight)
+                results = batch_detector(page.payloads)
+                detections = self._collect_detection_page(page, results, in_flight)
+                yield rows, detections, len(page.payloads)
             return
-        except BaseException:
-            print("base exception")
-            raise
-        c.close()
+
+        # The pages are read and written by this process, the workers only run
+        # the detector over their payloads. The results are collected in the
+        # order the pages were handed out, so they are written in rowid order.
+        pending: deque = deque()
+        with multiprocessing.Pool(workers, initializer=worker_initializer) as pool:
+            for rows in pages:
+                page = self._plan_detection_page(rows, cached, in_flight)
+                pending.append(
+                    (page, pool.apply_async(batch_detector, (page.payloads,)))
+                )
+                if len(pending) < workers * DETECTION_PAGES_PER_WORKER:
+                    continue
+                page, result = pending.popleft()
+                detections = self._collect_detection_page(page, result.get(), in_flight)
+                yield page.rows, detections, len(page.payloads)
+            while len(pending) > 0:
+                page, result = pending.popleft()
+                detections = self._collect_detection_page(page, result.get(), in_flight)
+                yield page.rows, detections, len(page.payloads)
 
     def run_detection(
         self,
         detector: DetectorFunc,
         database_write_func: DatabaseWriteFunc,
         blockchain: Optional[BLOCKCHAIN],
+        record_filter: RecordFilter = RecordFilter(),
+        ledger_name: Optional[str] = None,
+        workers: int = 1,
+        worker_initializer: Optional[Callable[[], None]] = None,
+        batch_detector: Optional[BatchDetectorFunc] = None,
     ) -> None:
-        conn = sqlite3.connect(self.name)
+        """Runs a detector over the records in rowid order and writes what it
+        detects. The detections of every page of records are written in a
+        single transaction. The payload of a record referencing a deduplicated
+        payload is analyzed once while its result is cached.
+        :param detector: Detector run on the payload of every record, has to be picklable with more than one worker.
+        :type detector: DetectorFunc
+        :param database_write_func: Writes and commits a batch of detections.
+        :type database_write_func: DatabaseWriteFunc
+        :param blockchain: Only analyze the records of this blockchain, all if None.
+        :type blockchain: Optional[BLOCKCHAIN]
+        :param record_filter: Further predicates the analyzed records have to match.
+        :type record_filter: RecordFilter
+        :param ledger_name: Name of the detector in the detection ledger. The run skips the records the detector already analyzed, and records its progress in the transaction of every page, so an interrupted run resumes after the last written page. Not used if the filter restricts the data type or height, the records are then analyzed again and their stored detections are skipped by key.
+        :type ledger_name: Optional[str]
+        :param workers: Number of worker processes running the detector over the pages, a single one runs it in this process.
+        :type workers: int
+        :param worker_initializer: Called once in every worker process before it runs the detector, e.g. to open a handle of its own.
+        :type worker_initializer: Optional[Callable[[], None]]
+        :param batch_detector: Runs the detector over all payloads of a page at once, e.g. with a single scan, instead of calling it for every payload.
+        :type batch_detector: Optional[BatchDetectorFunc]
+        """
+        if batch_detector is None:
+            batch_detector = functools.partial(detect_payloads, detector)
+        if blockchain is not None:
+            record_filter = record_filter._replace(coin=blockchain)
+        if (
+            ledger_name is not None
+            and record_filter._replace(coin=None) != RecordFilter()
+        ):
+            # Records outside of the filter would be marked as analyzed
+            print(
+                "detection ledger not used for a run filtering by data type or height"
+            )
+            ledger_name = None
+        start_rowid = MIN_ROWID
+        if ledger_name is not None:
+            analyzed_rowid = self.get_detection_ledger(ledger_name, record_filter.coin)
+            if analyzed_rowid is not None:
+                start_rowid = analyzed_rowid
+                print("resuming", ledger_name, "after rowid", start_rowid)
         counter = 0
         detected_count = 0
-        total_rows= conn.execute("SELECT COUNT(TXID) FROM cryptoData")
-        for i in total_rows:
-            total_rows = i[0]
-        prepared_query = "SELECT * FROM cryptoData"
-        if blockchain is not None:
-            prepared_query += "WHERE COIN=blockchain.value"
-        results = []
-        for (data, txid, _, data_type, _, extra_index) in conn.cursor().execute(
-            "SELECT * FROM cryptoData"
+        # The rowid range bounds the number of records without counting them,
+        # it is exact unless records were deleted or a filter is set
+        lowest, highest = self.rowid_bounds()
+        total_rows = 0
+        if lowest is not None and highest > start_rowid:
+            total_rows = highest - max(lowest - 1, start_rowid)
+        analyzed_count = 0
+        # detection results of the recently analyzed deduplicated payloads
+        cached: "OrderedDict[bytes, Optional[NamedTuple]]" = OrderedDict()
+        for rows, detections, analyzed in self._detect_pages(
+            batch_detector,
+            record_filter,
+            start_rowid,
+            cached,
+            workers,
+            worker_initializer,
         ):
-            counter += 1
-            detected = detector(DetectorPayload(txid, data_type, extra_index, data))
-            if detected is None:
-                continue
-            # cache results for future batched write
-            results.append(detected)
-            detected_count += 1
-            if len(results) > 100:
-                database_write_func(results, conn)
-                print(
-                    "counter: ",
-                    counter,
-                    "number detected: ",
-                    detected_count,
-                    "total raw data rows: ",
-                    total_rows,
-                    "percentage completed: ",
-                    counter/total_rows,
-                    "last written:",
-                    results[0],
+            counter += len(rows)
+            analyzed_count += analyzed
+            results = []
+            for rowid, _, txid, data_type, extra_index, hash in rows:
+                if hash is None:
+                    detected = detections[rowid]
+                else:
+                    detected = detections[hash]
+                    if hash not in cached:
+                        cached[hash] = detected
+                if detected is None:
+                    continue
+                # a detection in a shared payload is recorded for every record
+                # referencing it
+                results.append(
+                    detected._replace(  # type: ignore
+                        txid=txid, data_type=data_type, extra_index=extra_index
+                    )
                 )
-                conn.commit()
-                results = []
+            detected_count += len(results)
+            while len(cached) > PAYLOAD_CACHE_SIZE:
+                cached.popitem(last=False)
+
+            if ledger_name is not None:
+                self.set_detection_ledger(ledger_name, record_filter.coin, rows[-1][0])
+            if len(results) > 0:
+                database_write_func(results)
+            self.commit()
+            print(
+                "counter: ",
+                counter,
+                "unique payloads analyzed: ",
+                analyzed_count,
+                "number detected: ",
+                detected_count,
+                "estimated total rows: ",
+                total_rows,
+                "percentage completed: ",
+                counter / total_rows,
+                "last written:",
+                results[0] if len(results) > 0 else None,
+            )
 
-        # write and commit left-over results
-        database_write_func(results, conn)
-        conn.commit()
         print("\n\n\nCompleted detection!\n\n\n")
         print(
             "counter: ",
             counter,
+            "unique payloads analyzed: ",
+            analyzed_count,
             "number detected: ",
             detected_count,
-            "total rows: ",
+            "estimated total rows: ",
             total_rows,
         )
@@ -0,0 +1,214 @@
+# Batched transport between the parsers and their DatabaseWriter threads.
+# Records are collected into a single length-prefixed binary frame:
+#
+#   frame:  kind (u8) | record count (u32) | records
+#   record: data length (u32) | txid length (u16) | txid is str (u8) |
+#           data type (u8) | block height (i64) | extra index (u32) | data | txid
+#
+# and sent without copying through zmq, instead of pickling every record.
+# Checkpoint frames mark that all records up to a height have been sent:
+#
+#   frame:  kind (u8) | stage (u8) | block height (i64)
+#
+# and an end frame, consisting only of its kind, marks that a sender is done.
+# A frame is sent once it holds frame_size records or flush_interval seconds
+# after the previous one, so a slow parser still writes its records steadily.
+
+import struct
+import time
+from typing import List, Optional, Union
+import zmq
+from database import BLOCKCHAIN, DATATYPE, PARSESTAGE, CryptoDataRecord, Database
+from metrics import ParseMetrics
+
+FRAME_RECORDS = 0
+FRAME_CHECKPOINT = 1
+FRAME_END = 2
+
+FRAME_HEADER = struct.Struct("<BI")
+RECORD_HEADER = struct.Struct("<IHBBqI")
+CHECKPOINT_FRAME = struct.Struct("<BBq")
+END_FRAME = struct.Struct("<B")
+
+# Default number of records collected into a single frame
+FRAME_SIZE = 4096
+
+# Default number of seconds after which the collected records are sent
+FLUSH_INTERVAL = 1.0
+
+DATATYPE_CODES = {data_type: code for code, data_type in enumerate(DATATYPE)}
+DATATYPE_VALUES = [data_type.value for data_type in DATATYPE]
+PARSESTAGE_CODES = {stage: code for code, stage in enumerate(PARSESTAGE)}
+PARSESTAGES = list(PARSESTAGE)
+
+
+class RecordBatchSender:
+    """Collects records into binary frames and sends them over a zmq socket"""
+
+    def __init__(
+        self,
+        sender: zmq.Socket,
+        frame_size: int = FRAME_SIZE,
+        metrics: Optional[ParseMetrics] = None,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        """
+        :param sender: Socket connected to a DatabaseWriter thread.
+        :type sender: zmq.Socket
+        :param frame_size: Number of records sent in a single frame.
+        :type frame_size: int
+        :param metrics: Counts the sent frames and payloads.
+        :type metrics: Optional[ParseMetrics]
+        :param flush_interval: Number of seconds after which a frame is sent, even if it holds less than frame_size records.
+        :type flush_interval: float
+        """
+        self._sender = sender
+        self._frame_size = frame_size
+        self._metrics = metrics
+        self._flush_interval = flush_interval
+        self._parts: List[bytes] = []
+        self._count = 0
+        self._last_flush = time.monotonic()
+
+    def send(
+        self,
+        data: bytes,
+        txid: Union[str, bytes],
+        data_type: DATATYPE,
+        block_height: int,
+        extra_index: int,
+    ) -> None:
+        """Queues a record, a frame is sent once enough records are collected
+        or the flush interval passed"""
+        txid_is_str = isinstance(txid, str)
+        txid_bytes = txid.encode("ascii") if isinstance(txid, str) else txid
+        self._parts.append(
+            RECORD_HEADER.pack(
+                len(data),
+                len(txid_bytes),
+                txid_is_str,
+                DATATYPE_CODES[data_type],
+                block_height,
+                extra_index,
+            )
+        )
+        self._parts.append(data)
+        self._parts.append(txid_bytes)
+        self._count += 1
+        if (
+            self._count >= self._frame_size
+            or time.monotonic() - self._last_flush >= self._flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Sends the queued records, if any. Blocks while the queue to the
+        DatabaseWriter is full."""
+        self._last_flush = time.monotonic()
+        if self._count == 0:
+            return
+        frame = FRAME_HEADER.pack(FRAME_RECORDS, self._count) + b"".join(self._parts)
+        self._sender.send(frame, copy=False)
+        if self._metrics is not None:
+            self._metrics.add("frames_sent")
+            self._metrics.add("payloads", self._count)
+        self._parts = []
+        self._count = 0
+
+    def send_checkpoint(self, stage: PARSESTAGE, height: int) -> None:
+        """Sends the queued records followed by a checkpoint for the height"""
+        self.flush()
+        self._sender.send(
+            CHECKPOINT_FRAME.pack(FRAME_CHECKPOINT, PARSESTAGE_CODES[stage], height)
+        )
+        if self._metrics is not None:
+            self._metrics.add("frames_sent")
+
+    def close(self) -> None:
+        """Sends the queued records followed by an end frame and closes the
+        socket once they are queued at the DatabaseWriter"""
+        self.flush()
+        self._sender.send(END_FRAME.pack(FRAME_END))
+        if self._metrics is not None:
+            self._metrics.add("frames_sent")
+        self._sender.close()
+
+
+def decode_record_frame(
+    frame: memoryview, blockchain: BLOCKCHAIN
+) -> List[CryptoDataRecord]:
+    """Decodes a frame into parameters for an executemany insert
+    :param frame: Frame as sent by a RecordBatchSender.
+    :type frame: memoryview
+    :param blockchain: Blockchain the records are extracted from.
+    :type blockchain: BLOCKCHAIN
+    :return: The records of the frame.
+    :rtype: List[CryptoDataRecord]
+    """
+
+    kind, count = FRAME_HEADER.unpack_from(frame, 0)
+    if kind != FRAME_RECORDS:
+        raise BaseException("unexpected frame kind: " + str(kind))
+    coin = blockchain.value
+    offset = FRAME_HEADER.size
+    records: List[CryptoDataRecord] = []
+    for _ in range(count):
+        (
+            data_length,
+            txid_length,
+            txid_is_str,
+            data_type,
+            block_height,
+            extra_index,
+        ) = RECORD_HEADER.unpack_from(frame, offset)
+        offset += RECORD_HEADER.size
+        data = bytes(frame[offset : offset + data_length])
+        offset += data_length
+        txid: Union[str, bytes] = bytes(frame[offset : offset + txid_length])
+        offset += txid_length
+        if txid_is_str:
+            txid = txid.decode("ascii")  # type: ignore
+        records.append(
+            CryptoDataRecord(
+                data, txid, coin, DATATYPE_VALUES[data_type], block_height, extra_index
+            )
+        )
+    return records
+
+
+def write_frame(
+    database: Database,
+    blockchain: BLOCKCHAIN,
+    frame: memoryview,
+    metrics: Optional[ParseMetrics] = None,
+) -> int:
+    """Writes the contents of a received frame to the database
+    :param database: Database to be written into.
+    :type database: Database
+    :param blockchain: Blockchain the records are extracted from.
+    :type blockchain: BLOCKCHAIN
+    :param frame: Frame as sent by a RecordBatchSender.
+    :type frame: memoryview
+    :param metrics: Counts the written frames, the inserted and skipped records, the stored payloads and the time spent writing.
+    :type metrics: Optional[ParseMetrics]
+    :return: The number of inserted records.
+    :rtype: int
+    """
+
+    if frame[0] == FRAME_CHECKPOINT:
+        # Frames are written in order, so every record up to the height is
+        # already committed at this point.
+        _, stage, height = CHECKPOINT_FRAME.unpack_from(frame, 0)
+        database.set_checkpoint(blockchain, PARSESTAGES[stage], height)
+        if metrics is not None:
+            metrics.add("frames_written")
+        return 0
+    if metrics is None:
+        return database.insert_records(decode_record_frame(frame, blockchain)).inserted
+    with metrics.measure("write"):
+        result = database.insert_records(decode_record_frame(frame, blockchain))
+    metrics.add("frames_written")
+    metrics.add("records_written", result.inserted)
+    metrics.add("records_skipped", result.skipped)
+    metrics.add("payloads_stored", result.stored_payloads)
+    return result.inserted
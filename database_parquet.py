@@ -0,0 +1,182 @@
+# Columnar export and import of the extracted records and detections. Every
+# table is streamed into its own Parquet file, <directory>/<table>.parquet,
+# one row group per batch of rows, so neither side holds more than a row group
+# in memory. The files can be loaded by columnar engines directly, or imported
+# into the database of another machine.
+#
+# SQLite columns may hold TEXT and BLOB values alike, e.g. the TXID is text for
+# Bitcoin and Monero records and a blob for Ethereum records. Such columns are
+# exported as binary with an additional boolean <column>_IS_TEXT column, which
+# restores the original type on import.
+
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+import pyarrow as pa
+import pyarrow.parquet as pq
+from database import Database
+
+# Rows per row group on export and per inserted batch on import
+ROW_GROUP_SIZE = 65536
+
+TEXT_FLAG_SUFFIX = "_IS_TEXT"
+
+
+class ExportedColumn(NamedTuple):
+    name: str
+    type: pa.DataType
+    mixed: bool = False  # holds TEXT and BLOB values
+
+
+DETECTION_KEY_COLUMNS = [
+    ExportedColumn("TXID", pa.binary(), True),
+    ExportedColumn("DATA_TYPE", pa.string()),
+    ExportedColumn("EXTRA_INDEX", pa.int64()),
+]
+
+# Tables in the order they are imported. The payloads precede the records
+# referencing them, whose summary takes the payload length from payloadBlobs.
+EXPORTED_TABLES: Dict[str, List[ExportedColumn]] = {
+    "payloadBlobs": [
+        ExportedColumn("HASH", pa.binary()),
+        ExportedColumn("DATA", pa.binary(), True),
+    ],
+    "cryptoData": [
+        ExportedColumn("DATA", pa.binary(), True),
+        ExportedColumn("TXID", pa.binary(), True),
+        ExportedColumn("COIN", pa.string()),
+        ExportedColumn("DATA_TYPE", pa.string()),
+        ExportedColumn("BLOCK_HEIGHT", pa.int64()),
+        ExportedColumn("EXTRA_INDEX", pa.int64()),
+        ExportedColumn("PAYLOAD_HASH", pa.binary()),
+    ],
+    "asciiData": DETECTION_KEY_COLUMNS + [ExportedColumn("STRING_LENGTH", pa.int64())],
+    "magicFileData": DETECTION_KEY_COLUMNS + [ExportedColumn("FILE_TYPE", pa.string())],
+    "imghdrFileData": DETECTION_KEY_COLUMNS
+    + [ExportedColumn("FILE_TYPE", pa.string())],
+    "parseCheckpoints": [
+        ExportedColumn("COIN", pa.string()),
+        ExportedColumn("STAGE", pa.string()),
+        ExportedColumn("BLOCK_HEIGHT", pa.int64()),
+    ],
+}
+
+
+def table_schema(columns: Sequence[ExportedColumn]) -> pa.Schema:
+    """Returns the Parquet schema of a table, with the type flags of its mixed columns"""
+    fields = []
+    for column in columns:
+        fields.append(pa.field(column.name, column.type))
+        if column.mixed:
+            fields.append(pa.field(column.name + TEXT_FLAG_SUFFIX, pa.bool_()))
+    return pa.schema(fields)
+
+
+def export_query(table: str, columns: Sequence[ExportedColumn]) -> str:
+    """Returns the query selecting the rows of a table in the column order of its schema"""
+    expressions = []
+    for column in columns:
+        if column.mixed:
+            expressions.append("CAST(%s AS BLOB)" % column.name)
+            # SQLite names the type text, DuckDB VARCHAR
+            expressions.append("typeof(%s) IN ('text', 'VARCHAR')" % column.name)
+        else:
+            expressions.append(column.name)
+    return "SELECT %s FROM %s" % (",".join(expressions), table)
+
+
+def column_array(values: Sequence[Any], field: pa.Field) -> pa.Array:
+    """Returns the values of a column fetched from SQLite as an array of the field type"""
+    if field.type == pa.bool_():
+        # SQLite returns the type flags as the integers 0 and 1, DuckDB as booleans
+        return pa.array(values).cast(pa.bool_())
+    return pa.array(values, type=field.type)
+
+
+def restore_row(
+    columns: Sequence[ExportedColumn], values: Tuple[Any, ...]
+) -> Tuple[Any, ...]:
+    """Turns a row of the exported schema back into the values of the table"""
+    row = []
+    position = 0
+    for column in columns:
+        value = values[position]
+        position += 1
+        if column.mixed:
+            if values[position] and value is not None:
+                value = value.decode()
+            position += 1
+        row.append(value)
+    return tuple(row)
+
+
+def export_tables(
+    database: Database, directory: Path, row_group_size: int = ROW_GROUP_SIZE
+) -> Dict[str, int]:
+    """Exports the records, detections and checkpoints into Parquet files
+    :param database: Database to be exported.
+    :type database: Database
+    :param directory: Directory of the Parquet files, created if missing.
+    :type directory: Path
+    :param row_group_size: Number of rows per row group.
+    :type row_group_size: int
+    :return: The number of exported rows per table.
+    :rtype: Dict[str, int]
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    exported: Dict[str, int] = {}
+    for table, columns in EXPORTED_TABLES.items():
+        schema = table_schema(columns)
+        count = 0
+        with pq.ParquetWriter(str(directory / (table + ".parquet")), schema) as writer:
+            for rows in database.iter_batches(
+                export_query(table, columns), row_group_size
+            ):
+                writer.write_table(
+                    pa.Table.from_arrays(
+                        [
+                            column_array(values, field)
+                            for values, field in zip(zip(*rows), schema)
+                        ],
+                        schema=schema,
+                    ),
+                    row_group_size=row_group_size,
+                )
+                count += len(rows)
+        print("exported", count, "rows of", table)
+        exported[table] = count
+    return exported
+
+
+def import_tables(
+    database: Database, directory: Path, batch_size: int = ROW_GROUP_SIZE
+) -> Dict[str, int]:
+    """Imports the Parquet files written by export_tables. Rows already
+    stored are kept and their imported copies skipped, so importing the same
+    files again is a no-op.
+    :param database: Database to be imported into.
+    :type database: Database
+    :param directory: Directory of the Parquet files, missing tables are skipped.
+    :type directory: Path
+    :param batch_size: Number of rows read and inserted at once.
+    :type batch_size: int
+    :return: The number of inserted rows per table.
+    :rtype: Dict[str, int]
+    """
+    imported: Dict[str, int] = {}
+    for table, columns in EXPORTED_TABLES.items():
+        path = directory / (table + ".parquet")
+        if not path.exists():
+            continue
+        names = [column.name for column in columns]
+        count = 0
+        for batch in pq.ParquetFile(str(path)).iter_batches(
+            batch_size, columns=table_schema(columns).names
+        ):
+            rows = [
+                restore_row(columns, values)
+                for values in zip(*(array.to_pylist() for array in batch.columns))
+            ]
+            count += database.insert_rows(table, names, rows)
+        print("imported", count, "rows of", table)
+        imported[table] = count
+    return imported
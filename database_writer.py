@@ -0,0 +1,150 @@
+# DatabaseWriter thread shared by the parsers. One or more sender threads
+# collect records into frames (see database_bridge) and push them over zmq to
+# the writer, which inserts them in the order they were received.
+#
+# Both ends of the connection are bounded by a high-water mark. Once
+# WRITER_QUEUE_SIZE frames wait on each side, a sender blocks until the writer
+# caught up, instead of buffering without limit while the database falls
+# behind. The writer returns after the end frame of every sender, having
+# committed and closed the database, so the parser can join it.
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import zmq
+from database import BLOCKCHAIN, Database
+from database_bridge import FRAME_END, RecordBatchSender, write_frame
+from metrics import ParseMetrics
+
+# Number of frames queued on the sending and on the receiving side
+WRITER_QUEUE_SIZE = 8
+
+# Seconds after which the written records are committed, even if the database
+# is in bulk load mode and waits for more batches
+COMMIT_INTERVAL = 10.0
+
+# Milliseconds the writer waits for a frame before checking whether it should stop
+POLL_TIMEOUT = 100
+
+
+class DatabaseWriter(threading.Thread):
+    """DatabaseWriter acts as a worker thread for writing to the database
+    and receives record frames from a zmq socket"""
+
+    def __init__(
+        self,
+        database: Database,
+        context: zmq.Context,
+        address: str,
+        blockchain: BLOCKCHAIN,
+        metrics: ParseMetrics,
+        senders: int = 1,
+        queue_size: int = WRITER_QUEUE_SIZE,
+        commit_interval: float = COMMIT_INTERVAL,
+    ):
+        """
+        :param database: Database to be written into.
+        :type database: Database
+        :param context: Context of the sockets of the writer and its senders.
+        :type context: zmq.Context
+        :param address: Address the writer receives frames on, e.g. inproc://bitcoin_dbbridge.
+        :type address: str
+        :param blockchain: Blockchain the records are extracted from.
+        :type blockchain: BLOCKCHAIN
+        :param metrics: Metrics of the parse run.
+        :type metrics: ParseMetrics
+        :param senders: Number of senders, the writer returns after an end frame of each.
+        :type senders: int
+        :param queue_size: Number of frames queued on each side before a sender blocks.
+        :type queue_size: int
+        :param commit_interval: Maximum number of seconds between two commits.
+        :type commit_interval: float
+        """
+        threading.Thread.__init__(self)
+        self._db = database
+        self._address = address
+        self._blockchain = blockchain
+        self._metrics = metrics
+        self._senders = senders
+        self._queue_size = queue_size
+        self._commit_interval = commit_interval
+        self._stopped = threading.Event()
+        # The high-water mark has to be set before the socket is bound
+        self._receiver = context.socket(zmq.PULL)
+        self._receiver.setsockopt(zmq.RCVHWM, queue_size)
+        self._receiver.bind(address)
+        # The error a frame could not be written with, raised by running
+        self.error: Optional[BaseException] = None
+
+    def connect(self, context: zmq.Context) -> RecordBatchSender:
+        """Returns a sender of frames to the writer. The sender may only be
+        used by the calling thread and has to be closed once it is done.
+        :param context: Context the writer was created with.
+        :type context: zmq.Context
+        :return: A sender blocking while the queue to the writer is full.
+        :rtype: RecordBatchSender
+        """
+        sender = context.socket(zmq.PUSH)
+        sender.setsockopt(zmq.SNDHWM, self._queue_size)
+        sender.connect(self._address)
+        return RecordBatchSender(sender, metrics=self._metrics)
+
+    def stop(self) -> None:
+        """Makes the writer return after the frame it is writing, e.g. when
+        the parse run is interrupted. The frames not written yet are dropped,
+        the records up to the last written checkpoint are all committed."""
+        self._stopped.set()
+
+    @contextmanager
+    def running(self) -> Iterator[None]:
+        """Runs the writer while the senders are parsing in the with block,
+        and waits for it to write everything they sent. If the block raises,
+        e.g. on Ctrl-C, the writer is stopped instead and the exception is
+        raised once the written records are committed."""
+        self.start()
+        try:
+            yield
+        except BaseException:
+            print("parsing interrupted, committing the records written so far")
+            self.stop()
+            self.join()
+            raise
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self) -> None:
+        ended = 0
+        last_commit = time.monotonic()
+        try:
+            while ended < self._senders and not self._stopped.is_set():
+                if self._receiver.poll(POLL_TIMEOUT) != 0:
+                    frame = self._receiver.recv(copy=False)
+                    if frame.buffer[0] == FRAME_END:
+                        ended += 1
+                        self._metrics.add("frames_written")
+                    elif self.error is None:
+                        self._write(frame.buffer)
+                    else:
+                        # Keep receiving, so the senders are not blocked forever
+                        self._metrics.add("frames_written")
+                if (
+                    self.error is None
+                    and time.monotonic() - last_commit >= self._commit_interval
+                ):
+                    self._db.commit()
+                    last_commit = time.monotonic()
+        finally:
+            # Commits the written records and checkpoints the write-ahead log
+            with self._metrics.measure("write"):
+                self._db.close()
+            self._receiver.close(linger=0)
+
+    def _write(self, frame: memoryview) -> None:
+        """Writes a frame, an error is kept and stops further writes"""
+        try:
+            write_frame(self._db, self._blockchain, frame, self._metrics)
+        except Exception as e:
+            print("database writer failed, dropping the remaining frames:", e)
+            self.error = e
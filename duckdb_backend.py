@@ -0,0 +1,365 @@
+# Embedded DuckDB storage for analytical workloads. DuckDB stores the tables
+# column by column and scans them vectorized, which makes the aggregations of
+# the views and the statistics much faster than on SQLite over large tables,
+# while single row lookups and many small transactions are slower.
+#
+# Unlike SQLite, every DuckDB column has a single type. Transaction ids that
+# the parsers extract as bytes, e.g. the Ethereum tx hashes, are therefore
+# stored as hex strings like the Bitcoin and Monero ones, and text payloads
+# are stored as their UTF-8 bytes.
+
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import duckdb
+import pyarrow as pa
+from database import (
+    SUMMARY_TABLES,
+    CryptoDataRecord,
+    InsertResult,
+    StorageBackend,
+)
+
+DUCKDB_TABLES: Dict[str, str] = {
+    "cryptoData": """CREATE TABLE cryptoData(
+        DATA BLOB NOT NULL,
+        TXID VARCHAR NOT NULL,
+        COIN VARCHAR NOT NULL,
+        DATA_TYPE VARCHAR NOT NULL,
+        BLOCK_HEIGHT BIGINT NOT NULL,
+        EXTRA_INDEX BIGINT NOT NULL,
+        PAYLOAD_HASH BLOB,
+        PRIMARY KEY (TXID, EXTRA_INDEX, DATA_TYPE)
+    );""",
+    "payloadBlobs": """CREATE TABLE payloadBlobs(
+        HASH BLOB NOT NULL PRIMARY KEY,
+        DATA BLOB NOT NULL
+    );""",
+    "asciiData": """CREATE TABLE asciiData(
+        TXID VARCHAR NOT NULL,
+        DATA_TYPE VARCHAR NOT NULL,
+        EXTRA_INDEX BIGINT,
+        STRING_LENGTH BIGINT NOT NULL
+    );""",
+    "magicFileData": """CREATE TABLE magicFileData(
+        TXID VARCHAR NOT NULL,
+        DATA_TYPE VARCHAR NOT NULL,
+        EXTRA_INDEX BIGINT,
+        FILE_TYPE VARCHAR NOT NULL
+    );""",
+    "imghdrFileData": """CREATE TABLE imghdrFileData(
+        TXID VARCHAR NOT NULL,
+        DATA_TYPE VARCHAR NOT NULL,
+        EXTRA_INDEX BIGINT,
+        FILE_TYPE VARCHAR NOT NULL
+    );""",
+    "detectionLedger": """CREATE TABLE detectionLedger(
+        DETECTOR VARCHAR NOT NULL,
+        COIN VARCHAR NOT NULL,
+        LAST_ROWID BIGINT NOT NULL,
+        PRIMARY KEY (DETECTOR, COIN)
+    );""",
+    "parseCheckpoints": """CREATE TABLE parseCheckpoints(
+        COIN VARCHAR NOT NULL,
+        STAGE VARCHAR NOT NULL,
+        BLOCK_HEIGHT BIGINT NOT NULL,
+        PRIMARY KEY (COIN, STAGE)
+    );""",
+}
+
+# Tables with a key, rows of the others are never skipped. DuckDB rejects an
+# INSERT OR IGNORE into a table without one.
+KEYED_TABLES = (
+    "cryptoData",
+    "payloadBlobs",
+    "asciiData",
+    "magicFileData",
+    "imghdrFileData",
+    "detectionLedger",
+    "parseCheckpoints",
+)
+
+# DuckDB has no triggers. The rows inserted into a summarized table are
+# aggregated into its summary in the transaction of the insert. An insert into
+# a keyed table returns the columns of the rows it did not skip.
+RETURNED_SUMMARY_COLUMNS: Dict[str, str] = {
+    "cryptoData": "COIN, DATA_TYPE, BLOCK_HEIGHT, OCTET_LENGTH(DATA) AS DATA_LENGTH, PAYLOAD_HASH",
+    "payloadBlobs": "HASH",
+    "asciiData": "STRING_LENGTH",
+    "magicFileData": "FILE_TYPE",
+    "imghdrFileData": "FILE_TYPE",
+}
+
+SUMMARY_UPDATES: Dict[str, str] = {
+    "cryptoData": """INSERT INTO recordSummary(COIN,DATA_TYPE,RECORD_COUNT,MAX_BLOCK_HEIGHT,MAX_DATA_LENGTH)
+        SELECT inserted_rows.COIN, inserted_rows.DATA_TYPE, COUNT(*), MAX(inserted_rows.BLOCK_HEIGHT), MAX(COALESCE(OCTET_LENGTH(payloadBlobs.DATA), inserted_rows.DATA_LENGTH))
+        FROM inserted_rows LEFT JOIN payloadBlobs ON payloadBlobs.HASH=inserted_rows.PAYLOAD_HASH
+        GROUP BY inserted_rows.COIN, inserted_rows.DATA_TYPE
+        ON CONFLICT (COIN, DATA_TYPE) DO UPDATE SET
+            RECORD_COUNT=RECORD_COUNT+excluded.RECORD_COUNT,
+            MAX_BLOCK_HEIGHT=GREATEST(MAX_BLOCK_HEIGHT, excluded.MAX_BLOCK_HEIGHT),
+            MAX_DATA_LENGTH=GREATEST(MAX_DATA_LENGTH, excluded.MAX_DATA_LENGTH)""",
+    "payloadBlobs": """INSERT INTO payloadSummary(ID,PAYLOAD_COUNT)
+        SELECT 0, COUNT(*) FROM inserted_rows
+        ON CONFLICT (ID) DO UPDATE SET PAYLOAD_COUNT=PAYLOAD_COUNT+excluded.PAYLOAD_COUNT""",
+    "asciiData": """INSERT INTO asciiSummary(STRING_LENGTH,STRING_COUNT)
+        SELECT STRING_LENGTH, COUNT(*) FROM inserted_rows GROUP BY STRING_LENGTH
+        ON CONFLICT (STRING_LENGTH) DO UPDATE SET STRING_COUNT=STRING_COUNT+excluded.STRING_COUNT""",
+    "magicFileData": """INSERT INTO fileTypeSummary(DETECTION_TABLE,FILE_TYPE,FILE_COUNT)
+        SELECT 'magicFileData', FILE_TYPE, COUNT(*) FROM inserted_rows GROUP BY FILE_TYPE
+        ON CONFLICT (DETECTION_TABLE, FILE_TYPE) DO UPDATE SET FILE_COUNT=FILE_COUNT+excluded.FILE_COUNT""",
+    "imghdrFileData": """INSERT INTO fileTypeSummary(DETECTION_TABLE,FILE_TYPE,FILE_COUNT)
+        SELECT 'imghdrFileData', FILE_TYPE, COUNT(*) FROM inserted_rows GROUP BY FILE_TYPE
+        ON CONFLICT (DETECTION_TABLE, FILE_TYPE) DO UPDATE SET FILE_COUNT=FILE_COUNT+excluded.FILE_COUNT""",
+}
+
+
+def column_values(column: str, values: Sequence[Any]) -> pa.Array:
+    """Returns the values of a column as an array of its DuckDB type"""
+    if column == "TXID":
+        return pa.array(
+            [value.hex() if isinstance(value, bytes) else value for value in values],
+            type=pa.string(),
+        )
+    if column in ("DATA", "HASH", "PAYLOAD_HASH"):
+        return pa.array(
+            [value.encode() if isinstance(value, str) else value for value in values],
+            type=pa.binary(),
+        )
+    return pa.array(values)
+
+
+class DuckDBBackend(StorageBackend):
+    """Stores a Database in a DuckDB file. Rows are inserted as Arrow tables,
+    which DuckDB scans without converting every value on its own."""
+
+    # LENGTH is only defined for strings in DuckDB
+    length_function = "OCTET_LENGTH"
+
+    def __init__(self, name: str) -> None:
+        """
+        :param name: Path of the DuckDB database file.
+        :type name: str
+        """
+        self.name = name
+        self._database = duckdb.connect(name)
+        # Every thread uses its own cursor, a DuckDB connection runs one query at a time
+        self._local = threading.local()
+
+    def create_schema(self) -> None:
+        conn = self._connection()
+        existing = {
+            name
+            for (name,) in conn.execute(
+                "SELECT table_name FROM information_schema.tables"
+            ).fetchall()
+        }
+        for table, statement in DUCKDB_TABLES.items():
+            if table not in existing:
+                conn.execute(statement)
+                print(table, "Table successfully created")
+        created_summaries = False
+        for table, statement in SUMMARY_TABLES.items():
+            if table not in existing:
+                conn.execute(statement)
+                print(table, "Table successfully created")
+                created_summaries = True
+        key_statements = self.detection_key_statements(
+            {
+                name
+                for (name,) in conn.execute(
+                    "SELECT index_name FROM duckdb_indexes()"
+                ).fetchall()
+            }
+        )
+        for statement in key_statements:
+            conn.execute(statement)
+        if len(key_statements) > 0:
+            print("detection keys successfully created")
+        if created_summaries or len(key_statements) > 0:
+            # Summarize the rows a database created before the summaries or
+            # the detection keys holds
+            self.rebuild_summaries()
+
+    def _connection(self) -> duckdb.DuckDBPyConnection:
+        """Returns the cursor of the calling thread, opening it on first use"""
+        conn: Optional[duckdb.DuckDBPyConnection] = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._database.cursor()
+            self._local.conn = conn
+        return conn
+
+    def _begin(self) -> duckdb.DuckDBPyConnection:
+        """Returns the cursor of the calling thread in an open transaction.
+        Like a sqlite3 connection, the statements of a thread are committed
+        together by its next commit."""
+        conn = self._connection()
+        if not getattr(self._local, "in_transaction", False):
+            conn.begin()
+            self._local.in_transaction = True
+        return conn
+
+    def commit(self) -> None:
+        if getattr(self._local, "in_transaction", False):
+            self._connection().commit()
+            self._local.in_transaction = False
+
+    def close(self) -> None:
+        """Closes the cursors of the calling thread and writes the write-ahead log into the database file"""
+        reader: Optional[duckdb.DuckDBPyConnection] = getattr(
+            self._local, "reader", None
+        )
+        if reader is not None:
+            reader.close()
+            self._local.reader = None
+        conn: Optional[duckdb.DuckDBPyConnection] = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self.commit()
+        conn.execute("CHECKPOINT")
+        conn.close()
+        self._local.conn = None
+
+    @contextmanager
+    def _transaction(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Runs the statements of the block in the transaction of the calling
+        thread and commits it, rolling it back on an error"""
+        conn = self._begin()
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            self._local.in_transaction = False
+            raise
+        self.commit()
+
+    def _insert_table(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table: str,
+        columns: Sequence[str],
+        rows: Sequence[Sequence[Any]],
+    ) -> int:
+        """Inserts rows through an Arrow table and adds them to the summary of
+        the table, returns the number of inserted rows"""
+        if len(rows) == 0:
+            return 0
+        arrow_rows = pa.Table.from_arrays(
+            [
+                column_values(column, values)
+                for column, values in zip(columns, zip(*rows))
+            ],
+            names=list(columns),
+        )
+        insert = "%s INTO %s(%s) SELECT * FROM arrow_rows" % (
+            "INSERT OR IGNORE" if table in KEYED_TABLES else "INSERT",
+            table,
+            ",".join(columns),
+        )
+        conn.register("arrow_rows", arrow_rows)
+        try:
+            if table in RETURNED_SUMMARY_COLUMNS:
+                inserted_rows = conn.execute(
+                    insert + " RETURNING " + RETURNED_SUMMARY_COLUMNS[table]
+                ).to_arrow_table()
+            else:
+                # The table is not summarized
+                return conn.execute(insert).fetchone()[0]
+        finally:
+            conn.unregister("arrow_rows")
+        conn.register("inserted_rows", inserted_rows)
+        try:
+            conn.execute(SUMMARY_UPDATES[table])
+        finally:
+            conn.unregister("inserted_rows")
+        return inserted_rows.num_rows
+
+    def insert_records(
+        self,
+        records: Sequence[CryptoDataRecord],
+        payload_hashes: Optional[Sequence[bytes]],
+    ) -> InsertResult:
+        columns = ["DATA", "TXID", "COIN", "DATA_TYPE", "BLOCK_HEIGHT", "EXTRA_INDEX"]
+        with self._transaction() as conn:
+            if payload_hashes is None:
+                inserted = self._insert_table(conn, "cryptoData", columns, records)
+                return InsertResult(inserted, len(records) - inserted, inserted)
+
+            stored_payloads = self._insert_table(
+                conn,
+                "payloadBlobs",
+                ["HASH", "DATA"],
+                [(hash, record.data) for hash, record in zip(payload_hashes, records)],
+            )
+            inserted = self._insert_table(
+                conn,
+                "cryptoData",
+                columns + ["PAYLOAD_HASH"],
+                [
+                    (b"",) + tuple(record[1:]) + (hash,)
+                    for hash, record in zip(payload_hashes, records)
+                ],
+            )
+        return InsertResult(inserted, len(records) - inserted, stored_payloads)
+
+    def insert_rows(
+        self, table: str, columns: Sequence[str], rows: Sequence[Sequence[Any]]
+    ) -> int:
+        with self._transaction() as conn:
+            return self._insert_table(conn, table, columns, rows)
+
+    def iter_batches(
+        self, query: str, batch_size: int, parameters: Sequence[Any] = ()
+    ) -> Iterator[List[Tuple[Any, ...]]]:
+        # A cursor of its own, the statements executed by the consumer of the
+        # batches would otherwise discard the pending result
+        c = self._database.cursor()
+        c.execute(query, parameters)
+        while True:
+            rows = c.fetchmany(batch_size)
+            if len(rows) == 0:
+                break
+            yield rows
+        c.close()
+
+    def query(
+        self, query: str, parameters: Sequence[Any] = ()
+    ) -> List[Tuple[Any, ...]]:
+        return self._connection().execute(query, parameters).fetchall()
+
+    def read_query(
+        self, query: str, parameters: Sequence[Any] = ()
+    ) -> List[Tuple[Any, ...]]:
+        reader: Optional[duckdb.DuckDBPyConnection] = getattr(
+            self._local, "reader", None
+        )
+        if reader is None:
+            reader = self._database.cursor()
+            self._local.reader = reader
+        return reader.execute(query, parameters).fetchall()
+
+    def execute(self, statement: str, parameters: Sequence[Any] = ()) -> None:
+        self._begin().execute(statement, parameters)
+
+    def rebuild_summaries(self) -> None:
+        with self._transaction() as conn:
+            for statement in self.summary_rebuild_statements():
+                conn.execute(statement)
+
+    def create_indexes(self) -> int:
+        """DuckDB answers the aggregations with full scans pruned by the min/max
+        statistics of its row groups, secondary indexes are not created"""
+        return 0
+
+    def drop_indexes(self) -> None:
+        pass
+
+    def reindex(self) -> None:
+        self.analyze()
+
+    def analyze(self) -> None:
+        self._connection().execute("ANALYZE")
+
+    def explain(self, query: str, parameters: Sequence[Any] = ()) -> List[str]:
+        plan = self._connection().execute("EXPLAIN " + query, parameters).fetchall()
+        return [line for _, text in plan for line in text.splitlines()]
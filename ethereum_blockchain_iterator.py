@@ -6,10 +6,13 @@ from ethereum_rlp import Body, Header
 
 
 class ParseEthereumBlockHeaders:
-    def __init__(self, ancient_chaindata_path: str, chaindata_path: str):
+    def __init__(
+        self, ancient_chaindata_path: str, chaindata_path: str, start_height: int = 0
+    ):
         self.eth_freezer_table = FreezerHeadersTable(ancient_chaindata_path)
         self.eth_leveldb = EthLevelDB(chaindata_path)
-        self.value = 0
+        # height of the last returned header, iteration continues after it
+        self.value = start_height
 
     def get_header(self, number: int) -> Header:
         try:
@@ -35,10 +38,13 @@ class ParseEthereumBlockHeaders:
 
 
 class ParseEthereumBlockBodies:
-    def __init__(self, ancient_chaindata_path: str, chaindata_path: str):
+    def __init__(
+        self, ancient_chaindata_path: str, chaindata_path: str, start_height: int = 0
+    ):
         self.eth_freezer_table = FreezerBodiesTable(ancient_chaindata_path)
         self.eth_leveldb = EthLevelDB(chaindata_path)
-        self.value = 0
+        # height of the last returned body, iteration continues after it
+        self.value = start_height
 
     def get_body(self, number: int) -> Body:
         try:
@@ -1,8 +1,9 @@
-import threading
-from typing import NamedTuple
+import time
 
 import zmq
-from database import BLOCKCHAIN, DATATYPE, Database
+from database import BLOCKCHAIN, DATATYPE, PARSESTAGE, Database
+from database_writer import DatabaseWriter
+from metrics import ParseMetrics
 from ethereum_blockchain_iterator import (
     ParseEthereumBlockBodies,
     ParseEthereumBlockHeaders,
@@ -51,67 +52,32 @@ def check_if_template_contract_call(tx_data: bytes) -> bool:
     return False
 
 
-class EthereumDataMessage(NamedTuple):
-    """Named Tuple for the zmq message for writing prased and extracted data to the database"""
-
-    data: bytes
-    txid: bytes
-    data_type: DATATYPE
-    block_height: int
-
-
-class DatabaseWriter(threading.Thread):
-    """DatabaseWriter acts as a worker thread for writing to the sql database
-    and receives from a zmq socket"""
-
+class EthereumParser(DataExtractor):
     def __init__(
-        self, database: Database, receiver: zmq.Socket, blockchain: BLOCKCHAIN
+        self, chaindata_path: Path, blockchain: BLOCKCHAIN, resume: bool = False
     ):
-        """
-        :param database: Database to be written into
-        :type database: Database
-        :param receiver: Receives parsed extra bytes and monero transaction indices
-        :type receiver: zmq.Socket
-        :param blockchain: Some Ethereum-compatible blockchain
-        :type blockchain: BLOCKCHAIN"""
-        self._db = database
-        self._receiver = receiver
-        self._blockchain = blockchain
-        threading.Thread.__init__(self)
-
-    def run(self) -> None:
-        records = []
-        while True:
-            message: EthereumDataMessage = self._receiver.recv_pyobj()
-
-            records.append(
-                (
-                    message.data,
-                    message.txid,
-                    self._blockchain.value,
-                    message.data_type.value,
-                    message.block_height,
-                    0,
-                )
-            )
-
-            if len(records) > 500:
-                print("ethereum writing to DB...", records[0])
-                self._db.insert_records(records)
-                records = []
-
-
-class EthereumParser(DataExtractor):
-    def __init__(self, chaindata_path: Path, blockchain: BLOCKCHAIN):
         """
         :param blockchain_path: Path to the Ethereum blockchain (e.g. /home/user/.ethereum/geth/chaindata).
         :type blockchain_path: str
         :param blockchain: One of the Ethereum compatible blockchains.
         :type blockchain: BLOCKCHAIN
+        :param resume: Continue after the last checkpoints stored in the database.
+        :type resume: bool
         """
         self._chaindata_path = str(chaindata_path.expanduser()) + "/geth/chaindata"
         self._ancient_chaindata_path = self._chaindata_path + "/ancient"
         self._blockchain = blockchain
+        self._resume = resume
+        self._metrics = ParseMetrics(blockchain.value)
+
+    def _get_start_height(self, database: Database, stage: PARSESTAGE) -> int:
+        """Returns the height of the last block already parsed in the stage, 0 if none"""
+        if not self._resume:
+            return 0
+        checkpoint = database.get_checkpoint(self._blockchain, stage)
+        if checkpoint is None:
+            return 0
+        return checkpoint
 
     def parse_and_extract_blockchain(self, database: Database) -> None:
         """Parse the blockchain with the previously constructed options
@@ -119,39 +85,67 @@ class EthereumParser(DataExtractor):
         :type database: Database
         """
         context = zmq.Context()
-        database_event_sender = context.socket(zmq.PAIR)
-        database_event_receiver = context.socket(zmq.PAIR)
-        database_event_sender.bind("inproc://ethereum_dbbridge")
-        database_event_receiver.connect("inproc://ethereum_dbbridge")
-
-        writer = DatabaseWriter(database, database_event_receiver, self._blockchain)
-        writer.start()
-
-        for height, block_body in enumerate(
-            ParseEthereumBlockBodies(self._ancient_chaindata_path, self._chaindata_path)
-        ):
-            for (tx_index, tx) in enumerate(block_body.Transactions):
-                if len(tx.data) < 2:
-                    continue
-                if check_if_template_contract_call(tx.data):
-                    continue
-
-                database_event_sender.send_pyobj(
-                    EthereumDataMessage(tx.data, tx.hash(), DATATYPE.TX_DATA, height)
-                )
-
-        print("done parsing ethereum blocks, now parsing ethereum headers")
-
-        for height, header in enumerate(
-            ParseEthereumBlockHeaders(
-                self._ancient_chaindata_path, self._chaindata_path
-            )
-        ):
-            if len(header.Extra) > 0:
-                database_event_sender.send_pyobj(
-                    EthereumDataMessage(
-                        header.Extra, header.TxHash, DATATYPE.TX_DATA, height
+        self._metrics = ParseMetrics(self._blockchain.value)
+        metrics = self._metrics
+        writer = DatabaseWriter(
+            database, context, "inproc://ethereum_dbbridge", self._blockchain, metrics
+        )
+        with writer.running():
+            batch_sender = writer.connect(context)
+
+            # The iterators start with block 1, the genesis block has no transactions
+            start_height = self._get_start_height(database, PARSESTAGE.BLOCKS)
+            height = start_height
+            for height, block_body in enumerate(
+                metrics.timed(
+                    ParseEthereumBlockBodies(
+                        self._ancient_chaindata_path, self._chaindata_path, start_height
+                    ),
+                    "decode",
+                ),
+                start_height + 1,
+            ):
+                metrics.add("blocks")
+                metrics.add("txs", len(block_body.Transactions))
+                classify_start = time.perf_counter()
+                for tx_index, tx in enumerate(block_body.Transactions):
+                    if len(tx.data) < 2:
+                        continue
+                    if check_if_template_contract_call(tx.data):
+                        continue
+
+                    batch_sender.send(tx.data, tx.hash(), DATATYPE.TX_DATA, height, 0)
+                metrics.add_time("classify", time.perf_counter() - classify_start)
+
+                if height % 500 == 0:
+                    batch_sender.send_checkpoint(PARSESTAGE.BLOCKS, height)
+                metrics.maybe_report()
+
+            batch_sender.send_checkpoint(PARSESTAGE.BLOCKS, height)
+            print("done parsing ethereum blocks, now parsing ethereum headers")
+
+            start_height = self._get_start_height(database, PARSESTAGE.HEADERS)
+            height = start_height
+            for height, header in enumerate(
+                metrics.timed(
+                    ParseEthereumBlockHeaders(
+                        self._ancient_chaindata_path, self._chaindata_path, start_height
+                    ),
+                    "decode",
+                ),
+                start_height + 1,
+            ):
+                metrics.add("headers")
+                if len(header.Extra) > 0:
+                    batch_sender.send(
+                        header.Extra, header.TxHash, DATATYPE.TX_DATA, height, 0
                     )
-                )
 
+                if height % 500 == 0:
+                    batch_sender.send_checkpoint(PARSESTAGE.HEADERS, height)
+                metrics.maybe_report()
+
+            batch_sender.send_checkpoint(PARSESTAGE.HEADERS, height)
+            batch_sender.close()
         print("\n\n Completed Ethereum Parsing \n\n")
+        print(metrics.summary())
@@ -0,0 +1,333 @@
+# Taxonomy of the file types libmagic describes, shared by the magic file
+# detector of the analyzer and the histogram of the view. A description is
+# denied if it contains one of the DENIED_SUBSTRINGS, e.g. because libmagic
+# reports it for random bytes, otherwise it is stored as the file type of its
+# first matching normalization or as is. The histogram groups the stored file
+# types into buckets and leaves out the rare and implausible ones.
+#
+# The denied and the excluded substrings are each compiled into a single
+# regex. The classifications are cached by description, since libmagic
+# returns the same few descriptions for most payloads.
+
+import functools
+import re
+from typing import NamedTuple, Optional, Tuple
+
+
+class FileTypeRule(NamedTuple):
+    """Maps the descriptions containing all of the substrings to a file type"""
+
+    file_type: str
+    substrings: Tuple[str, ...]
+
+
+# Descriptions libmagic reports for data it does not recognize
+DENIED_DESCRIPTIONS = frozenset(("data", "shared library", "(non-conforming)"))
+
+# Descriptions containing one of these are almost always false positives
+DENIED_SUBSTRINGS = (
+    "title:",
+    "ddis/ddif",
+    "Message Sequence",
+    "rawbits",
+    "Binary II",
+    "ZPAQ stream",
+    "QL disk",
+    "LN03 output",
+    "LADS",
+    "XWD X",
+    "Smile",
+    "Nintendo",
+    "Kerberos",
+    "AMF",
+    "ctors/track",
+    "ICE authority",
+    "SAS",
+    "Stereo",
+    "ddis/dtif",
+    "Virtual TI skin",
+    "Multitracker",
+    "HP s200",
+    "ECMA-363",
+    "Monaural",
+    "32 kHz",
+    "48 kHz",
+    "locale archive",
+    "terminfo",
+    "GRand",
+    "font",
+    "Apache",
+    "OEM-ID",
+    "Bentley",
+    "huf output",
+    "disk quotas",
+    "PRCS",
+    "PEX",
+    "C64",
+    "lif file",
+    "GHost image",
+    "Linux",
+    "amd",
+    "XENIX",
+    "structured file",
+    "gfxboot",
+    "X11",
+    "cpio",
+    "Squeezed",
+    "compacted",
+    "Quasijarus",
+    "JVT",
+    "Poskanzer",
+    "VISX",
+    "TIM",
+    "PCX",
+    "MSVC",
+    "LZH",
+    "LVM1",
+    "Encore",
+    "ATSC",
+    "BASIC",
+    "frozen file",
+    "dBase",
+    "SCO",
+    "RDI",
+    "PostScript",
+    "Netpbm",
+    "Maple",
+    "i386",
+    "archive data",
+    "Motorola",
+    "FoxPro",
+    "packed data",
+    "fsav",
+    "crunched",
+    "compress'd",
+    "Terse",
+    "SoftQuad",
+    "Sendmail",
+    "OS9",
+    "MySQL",
+    "IRIS",
+    "Java",
+    "SOFF",
+    "PSI ",
+    "Clarion",
+    "BIOS",
+    "Atari",
+    "Ai32",
+    "ALAN",
+    "44.1",
+    "Microsoft",
+    "TeX",
+    "floppy",
+    "GLF_BINARY",
+    "AIN",
+    "Alpha",
+    "vfont",
+    "DOS",
+    "Sun disk",
+    "Group 3",
+    "Logitech",
+    "Solitaire",
+    "old ",
+    "SYMMETRY",
+    "DOS/MBR",
+    "Amiga",
+    "mumps",
+    "ID tags",
+    "GLS",
+    "dBase IV DBT",
+    "TTComp",
+    "EBCDIC",
+    "MGR bitmap",
+    "CLIPPER",
+    "Dyalog",
+    "PARIX",
+    "AIX",
+    "SysEx",
+    "ARJ",
+    "Applesoft",
+    "GeoSwath",
+    "ISO-8859",
+    "YAC",
+    "capture file",
+    "COFF",
+    "locale data table",
+    "Ucode",
+    "PDP",
+    "LXT",
+    "Tower",
+    "SGI",
+    "BS",
+    "exe",
+    "curses",
+    "endian",
+    "byte",
+    "ASCII",
+)
+
+# Applied in order, the first matching rule names the stored file type
+NORMALIZATIONS = (
+    FileTypeRule("mcrypt encrypted data", ("mcrypt",)),
+    FileTypeRule("MPEG stream", ("MPEG",)),
+    FileTypeRule("RLE image data", ("RLE image",)),
+    FileTypeRule("gzip compressed data", ("gzip compressed data",)),
+    FileTypeRule("GPG public key ring", ("GPG key public",)),
+    FileTypeRule("PGP Secret key", ("PGP Secret",)),
+    FileTypeRule("PGP Secret key", ("PGP\\011Secret",)),
+    FileTypeRule("PGP symmetric key encrypted data", ("PGP symmetric",)),
+    FileTypeRule("Bio-Rad .PIC Image File", ("Bio-Rad",)),
+    FileTypeRule("Targa image data", ("Targa",)),
+)
+
+# Applied in order, the first matching rule names the bar of a stored file
+# type in the histogram. The bars appear in this order after the others.
+HISTOGRAM_BUCKETS = (
+    FileTypeRule("GIF image", ("GIF",)),
+    FileTypeRule("PDF document", ("PDF",)),
+    FileTypeRule("LZMA compressed d.", ("LZMA",)),
+    FileTypeRule("UTF-8", ("UTF",)),
+    FileTypeRule("JPEG image data", ("JPEG",)),
+    FileTypeRule("PNG image data", ("PNG",)),
+    FileTypeRule("Gringotts data file", ("Gringotts",)),
+    FileTypeRule("DIF (DVCPRO) movie file", ("DIF",)),
+    FileTypeRule("tar archive", ("tar archive",)),
+    FileTypeRule("openssl enc'd data", ("openssl",)),
+    FileTypeRule("OS/2 graphic", ("OS/2",)),
+    FileTypeRule("PGP encrypted data", ("PGP", "encrypted")),
+    FileTypeRule("PGP key", ("PGP", "key")),
+    FileTypeRule("GPG encrypted data", ("GPG", "encrypted")),
+    FileTypeRule("GPG key", ("GPG", "key")),
+    FileTypeRule("MP3 audio", ("Audio file with ID3 version",)),
+    FileTypeRule("MP3 audio", ("MP3",)),
+    FileTypeRule("MSX music file", ("MSX",)),
+    FileTypeRule("Musepack audio", ("Musepack",)),
+)
+
+# Stored file types without a bucket that are left out of the histogram
+HISTOGRAM_EXCLUDED_SUBSTRINGS = (
+    "Windows metafile",
+    "TOC sound file",
+    "Bacula volume",
+    "Concise Binary Object Representation",
+    "DEC SRC",
+    "EdLib",
+    "SPARC",
+    "ispell hash",
+    "SoundBlaster",
+    "Squeak image",
+    "Windows Precom",
+    "Macintosh MFS data",
+    "HP PCL",
+    "core file (Xenix)",
+    "compiled Lisp",
+    "Zebra Metafile",
+    "StarOffice Gallery",
+    "Minix filesystem",
+    "Macintosh HFS",
+    "MacBinary",
+    "Embedded OpenType",
+    "DIY-Thermocam",
+    "Apple HFS",
+    "object file",
+    "b.out",
+    "RISC OS",
+    "MMDF",
+    "Lotus",
+    "FuseCompress",
+    "FIGlet",
+    "AppleDouble",
+    "AppleSingle",
+    "MED_Song",
+    "Android binary",
+    "GDSII",
+    "SunOS",
+    "AppledDouble",
+    "Core file",
+    "MAthematica",
+    "Berkeley DB",
+    "Microstation",
+    "overlay object file",
+    "LADS",
+    "Netscape",
+    "ESRI Shapefile",
+    "Cytovision",
+    "i960",
+    "ddis",
+    "SPEC",
+    "MMFD",
+    "AHX",
+    "libfprint",
+    "SeqBox",
+    "Psion",
+    "PCP compiled",
+    "separate object",
+    "Compiled XKB",
+    "dar archive",
+    "cisco",
+    "Symbian",
+    "Spectrum .TAP",
+    "StuffIt",
+    "Spectrum",
+    "RAD",
+    "Psion Series",
+    "Progressive Graphics",
+    "Palm",
+    "LFS",
+    "GEM",
+    "keymap",
+    "Aster*x",
+)
+
+# Number of distinct descriptions whose classification is cached
+FILE_TYPE_CACHE_SIZE = 4096
+
+
+def compile_substrings(substrings: Tuple[str, ...]) -> re.Pattern:
+    """Returns a regex matching any text containing one of the substrings"""
+    return re.compile("|".join(re.escape(substring) for substring in substrings))
+
+
+DENIED_REGEX = compile_substrings(DENIED_SUBSTRINGS)
+
+HISTOGRAM_EXCLUDED_REGEX = compile_substrings(HISTOGRAM_EXCLUDED_SUBSTRINGS)
+
+
+def match_rule(text: str, rules: Tuple[FileTypeRule, ...]) -> Optional[str]:
+    """Returns the file type of the first rule whose substrings are all in the text"""
+    for rule in rules:
+        if all(substring in text for substring in rule.substrings):
+            return rule.file_type
+    return None
+
+
+@functools.lru_cache(maxsize=FILE_TYPE_CACHE_SIZE)
+def classify_magic_description(description: str) -> Optional[str]:
+    """Returns the file type stored for a libmagic description
+    :param description: Description of a payload returned by libmagic.
+    :type description: str
+    :return: The normalized file type, None if the description is denied.
+    :rtype: Optional[str]
+    """
+    if description in DENIED_DESCRIPTIONS or DENIED_REGEX.search(description):
+        return None
+    file_type = match_rule(description, NORMALIZATIONS)
+    if file_type is None:
+        return description
+    return file_type
+
+
+@functools.lru_cache(maxsize=FILE_TYPE_CACHE_SIZE)
+def get_histogram_bucket(file_type: str) -> Optional[str]:
+    """Returns the bar of the histogram a stored file type is counted in
+    :param file_type: File type stored by the magic file detector.
+    :type file_type: str
+    :return: The label of its bucket, None if the file type has a bar of its own.
+    :rtype: Optional[str]
+    """
+    return match_rule(file_type, HISTOGRAM_BUCKETS)
+
+
+def is_excluded_from_histogram(file_type: str) -> bool:
+    """Returns whether a stored file type without a bucket is left out of the histogram"""
+    return HISTOGRAM_EXCLUDED_REGEX.search(file_type) is not None
@@ -1,7 +1,15 @@
 from pathlib import Path
 from tkinter import N
 from bitcoin_parser import BitcoinParser
-from database import BLOCKCHAIN, Database, coinStringToCoin
+from database import (
+    BACKEND,
+    BLOCKCHAIN,
+    DATATYPE,
+    Database,
+    RecordFilter,
+    coinStringToCoin,
+)
+from database_parquet import export_tables, import_tables
 import binascii
 import argparse
 from ethereum_parser import EthereumParser
@@ -17,28 +25,61 @@ def unhexlify_str(h: str) -> bytes:
     return binascii.unhexlify(h.encode("ascii"))
 
 
-def parse(blockchain_raw: str, raw_coin_path: str, database_name: str) -> None:
+def parse(
+    blockchain_raw: str,
+    raw_coin_path: str,
+    database_name: str,
+    workers: int,
+    resume: bool,
+    bulk_load: bool,
+    deduplicate: bool,
+    backend: BACKEND,
+) -> None:
     coin_path = Path(raw_coin_path)
+    # Records are stored under the selected blockchain, which the analysis filters on
+    blockchain = coinStringToCoin(blockchain_raw)
     # Create a parser
     parser: DataExtractor
     if "bitcoin" in blockchain_raw:
-        parser = BitcoinParser(coin_path, BLOCKCHAIN.BITCOIN_REGTEST)
+        parser = BitcoinParser(coin_path, blockchain, workers, resume)
     elif "ethereum" in blockchain_raw:
-        parser = EthereumParser(coin_path, BLOCKCHAIN.ETHEREUM_MAINNET)
+        parser = EthereumParser(coin_path, blockchain, resume)
     elif "monero" in blockchain_raw:
-        parser = MoneroParser(coin_path, BLOCKCHAIN.MONERO_STAGENET)
+        parser = MoneroParser(coin_path, blockchain, resume)
     else:
         raise BaseException("invalid blockchain argument in parse method")
 
     # Create a database handler
-    database = Database(database_name)
+    database = Database(
+        database_name, bulk_load, deduplicate=deduplicate, backend=backend
+    )
+    if bulk_load:
+        # Created again once the parse completes. After an interrupted parse
+        # they are created by the completed --resume or --maintain create_indexes.
+        database.drop_indexes()
 
     # Parse the blockchains
-    parser.parse_and_extract_blockchain(database)
+    try:
+        parser.parse_and_extract_blockchain(database)
+    except KeyboardInterrupt:
+        # The records up to the last checkpoint are committed by the writer
+        print("parsing interrupted, continue it with --resume")
+        return
+    # Only the missing indexes are created, e.g. after a bulk load or on a
+    # database created before them
+    database.create_indexes()
+    database.close()
     return
 
 
-def analyze(blockchain_raw: str, database_path: str, detector_raw: str) -> None:
+def analyze(
+    blockchain_raw: str,
+    database_path: str,
+    detector_raw: str,
+    backend: BACKEND,
+    record_filter: RecordFilter,
+    workers: int,
+) -> None:
     detector: Detector
     if detector_raw == "native_strings":
         detector = Detector.native_strings
@@ -52,13 +93,15 @@ def analyze(blockchain_raw: str, database_path: str, detector_raw: str) -> None:
         raise BaseException("invalid detector argument for analyze")
 
     blockchain = coinStringToCoin(blockchain_raw)
-    database = Database(database_path)
-    analyzer = Analyzer(blockchain, database)
-    analyzer.analyze(detector)
+    database = Database(database_path, backend=backend)
+    analyzer = Analyzer(blockchain, database, workers)
+    analyzer.analyze(detector, record_filter)
     return
 
 
-def view(blockchain_raw: str, database_path: str, mode_raw: str) -> None:
+def view(
+    blockchain_raw: str, database_path: str, mode_raw: str, backend: BACKEND
+) -> None:
     blockchain = coinStringToCoin(blockchain_raw)
     mode: ViewMode
     if mode_raw == "ascii_histogram":
@@ -69,11 +112,50 @@ def view(blockchain_raw: str, database_path: str, mode_raw: str) -> None:
         mode = ViewMode.IMGHDR_FILE_HISTOGRAM
     elif mode_raw == "record_stats":
         mode = ViewMode.RECORD_STATS
-    database = Database(database_path)
+    database = Database(database_path, backend=backend)
     view = View(blockchain, database)
     view.view(mode)
 
 
+def maintain(database_path: str, command: str, backend: BACKEND) -> None:
+    database = Database(database_path, backend=backend)
+    if command == "create_indexes":
+        database.create_indexes()
+    elif command == "drop_indexes":
+        database.drop_indexes()
+    elif command == "reindex":
+        database.reindex()
+    elif command == "analyze":
+        database.analyze()
+    elif command == "rebuild_summaries":
+        database.rebuild_summaries()
+    elif command == "explain":
+        for name, plan in database.explain_query_plans().items():
+            print(name + ":")
+            for step in plan:
+                print("    " + step)
+    else:
+        raise BaseException("invalid maintenance command")
+    return
+
+
+def transfer(
+    database_path: str,
+    directory: str,
+    export_format: str,
+    import_format: str,
+    backend: BACKEND,
+) -> None:
+    database = Database(database_path, backend=backend)
+    if export_format == "parquet":
+        export_tables(database, Path(directory))
+    elif import_format == "parquet":
+        import_tables(database, Path(directory))
+    else:
+        raise BaseException("invalid transfer format")
+    return
+
+
 if __name__ == "__main__":
     """Main function"""
     parser = argparse.ArgumentParser(
@@ -86,6 +168,13 @@ if __name__ == "__main__":
         default="test.db",
         help="name of the database used to store results",
     )
+    parser.add_argument(
+        "-s",
+        "--backend",
+        default=BACKEND.SQLITE.value,
+        choices=[backend.value for backend in BACKEND],
+        help="storage engine of the database, duckdb is faster for the views and statistics of large databases",
+    )
     parser.add_argument(
         "-b",
         "--blockchain",
@@ -109,12 +198,53 @@ if __name__ == "__main__":
                 ~/.bitcoin
             """,
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes used for parsing bitcoin and for the analysis",
+    )
+    parser.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        help="Continue parsing after the last block height checkpoint stored in the database",
+    )
+    parser.add_argument(
+        "-l",
+        "--bulk-load",
+        action="store_true",
+        help="Write the database in WAL mode without syncing and commit in larger transactions while parsing",
+    )
+    parser.add_argument(
+        "-u",
+        "--deduplicate",
+        action="store_true",
+        help="Store every distinct payload once and let the parsed records reference it, the analysis then runs once per distinct payload",
+    )
     parser.add_argument(
         "-a",
         "--analyze",
         help="Run the tool in analysis mode to detect specific data types",
         choices=("native_strings", "gnu_strings", "imghdr_files", "magic_files"),
     )
+    parser.add_argument(
+        "-t",
+        "--data-type",
+        choices=[data_type.value for data_type in DATATYPE],
+        help="Only analyze the records of this data type",
+    )
+    parser.add_argument(
+        "--min-height",
+        type=int,
+        help="Only analyze the records of blocks at or above this height",
+    )
+    parser.add_argument(
+        "--max-height",
+        type=int,
+        help="Only analyze the records of blocks at or below this height",
+    )
     parser.add_argument(
         "-v",
         "--view",
@@ -126,6 +256,38 @@ if __name__ == "__main__":
             "record_stats",
         ),
     )
+    parser.add_argument(
+        "-m",
+        "--maintain",
+        help="Run a maintenance command on the database, e.g. after a bulk load",
+        choices=(
+            "create_indexes",
+            "drop_indexes",
+            "reindex",
+            "analyze",
+            "rebuild_summaries",
+            "explain",
+        ),
+    )
+    parser.add_argument(
+        "-e",
+        "--export",
+        help="Export the records, detections and checkpoints of the database into the directory",
+        choices=("parquet",),
+    )
+    parser.add_argument(
+        "-i",
+        "--import",
+        dest="import_format",
+        help="Import the records, detections and checkpoints of an export in the directory into the database",
+        choices=("parquet",),
+    )
+    parser.add_argument(
+        "-o",
+        "--directory",
+        default="export",
+        help="directory of the exported or imported files",
+    )
 
     # Parse the command line arguments
     args = parser.parse_args()
@@ -133,10 +295,40 @@ if __name__ == "__main__":
     if args.parse is not None:
         if args.blockchain is None:
             raise BaseException("require a blockchain argument for parse mode")
-        parse(args.blockchain, args.parse, args.database)
+        parse(
+            args.blockchain,
+            args.parse,
+            args.database,
+            args.workers,
+            args.resume,
+            args.bulk_load,
+            args.deduplicate,
+            BACKEND(args.backend),
+        )
     elif args.analyze is not None:
-        analyze(args.blockchain, args.database, args.analyze)
+        analyze(
+            args.blockchain,
+            args.database,
+            args.analyze,
+            BACKEND(args.backend),
+            RecordFilter(
+                data_type=None if args.data_type is None else DATATYPE(args.data_type),
+                min_height=args.min_height,
+                max_height=args.max_height,
+            ),
+            args.workers,
+        )
     elif args.view is not None:
-        view(args.blockchain, args.database, args.view)
+        view(args.blockchain, args.database, args.view, BACKEND(args.backend))
+    elif args.maintain is not None:
+        maintain(args.database, args.maintain, BACKEND(args.backend))
+    elif args.export is not None or args.import_format is not None:
+        transfer(
+            args.database,
+            args.directory,
+            args.export,
+            args.import_format,
+            BACKEND(args.backend),
+        )
     else:
         raise BaseException("require a mode to run in")
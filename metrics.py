@@ -0,0 +1,135 @@
+# Throughput and pipeline health of a parse run, shared by the parsers. Progress
+# is logged periodically as a single JSON object per line, e.g.
+#
+#   {"event": "progress", "parser": "bitcoin_mainnet", "elapsed": 10.0,
+#    "blocks": 5000, "blocks_per_s": 500.0, ..., "queue_depth": 3,
+#    "decode_s": 6.1, "classify_s": 2.2, "write_s": 1.4}
+#
+# and a final {"event": "summary", ...} object with the rates over the whole
+# run and the insert rate of the database, write_rows_per_s. Stage times
+# measured in worker processes are summed over the workers.
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, TypeVar
+
+# Counters every parser reports, even if they stay 0
+COUNTERS = (
+    "blocks",
+    "txs",
+    "bytes_read",
+    "payloads",
+    "frames_sent",
+    "frames_written",
+    "records_written",
+    "records_skipped",
+    "payloads_stored",
+)
+
+# Stages whose time is accumulated
+STAGES = ("decode", "classify", "write")
+
+T = TypeVar("T")
+
+
+class ParseMetrics:
+    """Counters and stage timers of a parse run, safe to update from several threads"""
+
+    def __init__(self, name: str, report_interval: float = 10.0):
+        """
+        :param name: Name of the parse run used in the log lines, e.g. the blockchain.
+        :type name: str
+        :param report_interval: Minimum number of seconds between two progress lines.
+        :type report_interval: float
+        """
+        self._name = name
+        self._report_interval = report_interval
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._last_report = self._start
+        self.counters: Dict[str, int] = {counter: 0 for counter in COUNTERS}
+        self.stage_seconds: Dict[str, float] = {stage: 0.0 for stage in STAGES}
+        self._last_counters = dict(self.counters)
+
+    def add(self, counter: str, n: int = 1) -> None:
+        """Increments a counter, counters not in COUNTERS are created on first use"""
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        """Accumulates time spent in a stage, e.g. as measured by a worker process"""
+        with self._lock:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """Accumulates the time spent in the with block in the stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def timed(self, iterable: Iterable[T], stage: str) -> Iterator[T]:
+        """Iterates the iterable, accumulating the time spent producing the items in the stage"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage, time.perf_counter() - start)
+                return
+            self.add_time(stage, time.perf_counter() - start)
+            yield item
+
+    def queue_depth(self) -> int:
+        """Number of frames sent to the DatabaseWriter that are not written yet"""
+        return self.counters["frames_sent"] - self.counters["frames_written"]
+
+    def _snapshot(
+        self, event: str, since: Dict[str, int], elapsed: float
+    ) -> Dict[str, Any]:
+        line: Dict[str, Any] = {
+            "event": event,
+            "parser": self._name,
+            "elapsed": round(time.perf_counter() - self._start, 3),
+        }
+        elapsed = max(elapsed, 1e-9)
+        for counter, value in self.counters.items():
+            line[counter] = value
+            line[counter + "_per_s"] = round(
+                (value - since.get(counter, 0)) / elapsed, 1
+            )
+        line["queue_depth"] = self.queue_depth()
+        for stage, seconds in self.stage_seconds.items():
+            line[stage + "_s"] = round(seconds, 3)
+        return line
+
+    def maybe_report(self) -> None:
+        """Prints a progress line with the rates since the last one, if the report interval has passed"""
+        now = time.perf_counter()
+        if now - self._last_report < self._report_interval:
+            return
+        with self._lock:
+            line = self._snapshot(
+                "progress", self._last_counters, now - self._last_report
+            )
+            self._last_counters = dict(self.counters)
+            self._last_report = now
+        print(json.dumps(line))
+
+    def summary(self) -> str:
+        """Returns the summary line with the rates over the whole run"""
+        with self._lock:
+            line = self._snapshot("summary", {}, time.perf_counter() - self._start)
+            # Insert throughput of the database itself, excluding the time the
+            # DatabaseWriter waited for frames
+            line["write_rows_per_s"] = round(
+                self.counters["records_written"]
+                / max(self.stage_seconds["write"], 1e-9),
+                1,
+            )
+        return json.dumps(line)
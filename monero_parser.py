@@ -1,5 +1,7 @@
-from typing import Any, List, NamedTuple
-from database import BLOCKCHAIN, DATATYPE, Database
+from typing import Any, List, NamedTuple, Optional
+from database import BLOCKCHAIN, DATATYPE, PARSESTAGE, Database
+from database_writer import DatabaseWriter
+from metrics import ParseMetrics
 import lmdb
 from monero_serialize import xmrserialize as x
 from monero_serialize import xmrtypes as xmr
@@ -7,6 +9,7 @@ import asyncio
 import struct
 from parser import DataExtractor
 import threading
+import time
 import zmq
 from pathlib import Path
 
@@ -19,12 +22,23 @@ class MoneroParserMessage(NamedTuple):
     monero_tx_indices: List[xmr.TxIndex]
 
 
-class MoneroDataMessage(NamedTuple):
-    """ZMQ Message for the DatabaseWriter thread to write the data to the database"""
+class MoneroCheckpointMessage(NamedTuple):
+    """ZMQ Message for the TxParser thread marking that all transactions up to
+    the height were sent, it is the last message of a parse run. The height is
+    None if no transactions were sent."""
 
-    counter: int
-    extra_bytes_list: List[bytes]
-    monero_tx_indices: List[xmr.TxIndex]
+    height: Optional[int]
+
+
+# Number of transaction batches queued for the TxParser before the parser blocks
+TX_QUEUE_SIZE = 2
+
+# Milliseconds the parser waits for room in the queue of the TxParser before
+# checking whether the TxParser failed
+TX_SEND_POLL_TIMEOUT = 100
+
+# A txindex is the tx hash followed by the tx_id, unlock_time and block_id uint64s
+TX_INDEX_BLOCK_ID_OFFSET = 32 + 8 + 8
 
 
 def async_results(i: List[Any]):
@@ -38,89 +52,103 @@ class TxParser(threading.Thread):
     """TxParser acts as a worker thread for parsing raw monero transactions
     and communicates through zmq sockets"""
 
-    def __init__(self, receiver: zmq.Socket, sender: zmq.Socket):
+    def __init__(
+        self,
+        receiver: zmq.Socket,
+        writer: DatabaseWriter,
+        context: zmq.Context,
+        metrics: ParseMetrics,
+    ):
         """
         :param receiver: Receives raw transactions to parse.
         :type receiver: zmq.Socket
-        :param sender: Sends parsed transactions.
-        :type sender: zmq.Socket
+        :param writer: Writes the frames of the nonstandard tx extra bytes.
+        :type writer: DatabaseWriter
+        :param context: Context the writer was created with.
+        :type context: zmq.Context
+        :param metrics: Metrics of the parse run.
+        :type metrics: ParseMetrics
         """
         self._receiver = receiver
-        self._sender = sender
-        threading.Thread.__init__(self)
+        self._writer = writer
+        self._context = context
+        self._metrics = metrics
+        # The error the transactions could not be parsed with, raised by the parser
+        self.error: Optional[BaseException] = None
+        threading.Thread.__init__(self, daemon=True)
 
     def run(self) -> None:
-        loop = asyncio.new_event_loop()
-        while True:
-            message: MoneroParserMessage = self._receiver.recv_pyobj()
-            monero_txs = loop.run_until_complete(
-                deserialize_transactions(map(async_results, message.monero_txs_raw))
-            )
-
-            # Extract the extra bytes from the monero serialized data,
-            extra_bytes_list = [
-                struct.pack("{}B".format(len(monero_tx.extra)), *monero_tx.extra)
-                for monero_tx in monero_txs
-            ]
-
-            self._sender.send_pyobj(
-                MoneroDataMessage(
-                    message.counter, extra_bytes_list, message.monero_tx_indices
-                )
-            )
-
-
-class DatabaseWriter(threading.Thread):
-    """DatabaseWriter acts as a worker thread for writing to the sql database
-    and receives from a zmq socket"""
-
-    def __init__(
-        self, database: Database, receiver: zmq.Socket, blockchain: BLOCKCHAIN
-    ):
+        # The sender belongs to this thread, its end frame lets the writer return
+        self._batch_sender = self._writer.connect(self._context)
+        try:
+            self._parse()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._batch_sender.close()
+
+    def raise_error(self) -> None:
+        """Raises the error the TxParser failed with, if any"""
+        if self.error is not None:
+            raise self.error
+
+    def send(self, sender: zmq.Socket, message: Any) -> None:
+        """Sends a message to the TxParser, blocking while its queue is full.
+        Raises the error of the TxParser instead if it stopped, which would
+        otherwise leave the queue full forever.
+        :param sender: Socket connected to the receiver of the TxParser.
+        :type sender: zmq.Socket
+        :param message: MoneroParserMessage or MoneroCheckpointMessage to be sent.
+        :type message: Any
         """
-        :param database: Database to be written into
-        :type database: Database
-        :param receiver: Receives parsed extra bytes and monero transaction indices
-        :type receiver: zmq.Socket
-        :param blockchain: Some Monero-compatible blockchain
-        :type blockchain: BLOCKCHAIN"""
-        self._db = database
-        self._receiver = receiver
-        self._blockchain = blockchain
-        threading.Thread.__init__(self)
+        while sender.poll(TX_SEND_POLL_TIMEOUT, zmq.POLLOUT) == 0:
+            if not self.is_alive():
+                self.raise_error()
+                raise BaseException(
+                    "the TxParser stopped before the end of the transactions"
+                )
+        sender.send_pyobj(message)
 
-    def run(self):
+    def _parse(self) -> None:
+        loop = asyncio.new_event_loop()
         default_extra_counter = 0
-
         while True:
-            message: MoneroDataMessage = self._receiver.recv_pyobj()
-            records = []
-
-            for i in range(len(message.extra_bytes_list)):
-                if is_default_extra(message.extra_bytes_list[i]):
+            message = self._receiver.recv_pyobj()
+            if isinstance(message, MoneroCheckpointMessage):
+                if message.height is not None:
+                    self._batch_sender.send_checkpoint(
+                        PARSESTAGE.BLOCKS, message.height
+                    )
+                return
+            with self._metrics.measure("decode"):
+                monero_txs = loop.run_until_complete(
+                    deserialize_transactions(map(async_results, message.monero_txs_raw))
+                )
+            self._metrics.add("txs", len(monero_txs))
+
+            classify_start = time.perf_counter()
+            for monero_tx, monero_tx_index in zip(
+                monero_txs, message.monero_tx_indices
+            ):
+                # Extract the extra bytes from the monero serialized data,
+                extra_bytes = struct.pack(
+                    "{}B".format(len(monero_tx.extra)), *monero_tx.extra
+                )
+                if is_default_extra(extra_bytes):
                     default_extra_counter += 1
                     continue
-
-                record = (
-                    message.extra_bytes_list[i],
-                    bytes(message.monero_tx_indices[i].key).hex(),
-                    self._blockchain.value,
-                    DATATYPE.TX_EXTRA.value,
-                    message.monero_tx_indices[i].data.block_id,
+                self._batch_sender.send(
+                    extra_bytes,
+                    bytes(monero_tx_index.key).hex(),
+                    DATATYPE.TX_EXTRA,
+                    monero_tx_index.data.block_id,
                     0,
                 )
-                records.append(record)
-
-            self._db.insert_records(records)
-
-            print(
-                "monero written blockchain:",
-                self._blockchain,
-                "counts:",
-                message.counter,
-                "default extra counts:",
-                default_extra_counter,
-            )
+            self._metrics.add_time("classify", time.perf_counter() - classify_start)
+            self._batch_sender.flush()
+            self._metrics.add("default_extras", default_extra_counter)
+            default_extra_counter = 0
+            self._metrics.maybe_report()
 
 
 async def deserialize_tx_index(tx_index_raw: bytes) -> xmr.TxIndex:
@@ -208,16 +236,61 @@ async def deserialize_transactions(monero_txs_raw: List[bytes]):
 
 
 class MoneroParser(DataExtractor):
-    def __init__(self, blockchain_path: Path, blockchain: BLOCKCHAIN) -> None:
+    def __init__(
+        self, blockchain_path: Path, blockchain: BLOCKCHAIN, resume: bool = False
+    ) -> None:
         """
         :param blockchain_path: Path to the Monero lmdb directory (e.g. /home/user/.bitmonero).
         :type blockchain_path: str
         :param blockchain: One of the Monero compatible blockchain types.
         :type blockchain: BLOCKCHAIN
+        :param resume: Skip the transactions of blocks up to the last stored checkpoint.
+        :type resume: bool
         """
 
         self.blockchain_path = str(blockchain_path.expanduser()) + "/lmdb"
         self.blockchain = blockchain
+        self.resume = resume
+        self._metrics = ParseMetrics(blockchain.value)
+
+    def send_tx_batch(
+        self,
+        txn: lmdb.Transaction,
+        tx_db: Any,
+        tx_parser_event_sender: zmq.Socket,
+        tx_reader: TxParser,
+        tx_indices_raw: List[bytes],
+        counter: int,
+    ) -> None:
+        """Retrieves the transactions of a batch of raw tx indices and sends them to the TxParser"""
+
+        # Get the TxIndex struct from the database value
+        with self._metrics.measure("decode"):
+            monero_tx_indices: List[
+                xmr.TxIndex
+            ] = asyncio.get_event_loop().run_until_complete(
+                deserialize_tx_indices(tx_indices_raw)
+            )
+
+        # translate the tx index back to bytes for retrieval of the full transaction
+        db_tx_indices: List[bytes] = [
+            monero_tx_index.data.tx_id.to_bytes(8, "little")
+            for monero_tx_index in monero_tx_indices
+        ]
+
+        # Get the full transaction from the database with the transaction id bytes
+        cursor = txn.cursor(db=tx_db)
+        monero_txs_raw: List[bytes] = cursor.getmulti(db_tx_indices)
+        cursor.close()
+        self._metrics.add(
+            "bytes_read",
+            sum(len(tx_index) for tx_index in tx_indices_raw)
+            + sum(len(monero_tx_raw[1]) for monero_tx_raw in monero_txs_raw),
+        )
+        tx_reader.send(
+            tx_parser_event_sender,
+            MoneroParserMessage(counter, monero_txs_raw, monero_tx_indices),
+        )
 
     def parse_and_extract_blockchain(self, database: Database):
         """Parse the blockchain with the previously constructed options
@@ -225,6 +298,12 @@ class MoneroParser(DataExtractor):
         :type database: Database
         """
 
+        start_height = 0
+        if self.resume:
+            checkpoint = database.get_checkpoint(self.blockchain, PARSESTAGE.BLOCKS)
+            if checkpoint is not None:
+                start_height = checkpoint + 1
+
         print(lmdb.version())
         env = lmdb.open(
             self.blockchain_path, subdir=True, lock=False, readonly=True, max_dbs=10,
@@ -237,49 +316,74 @@ class MoneroParser(DataExtractor):
 
         context = zmq.Context()
 
+        # The high-water marks have to be set before the sockets are connected
         tx_parser_event_sender = context.socket(zmq.PAIR)
+        tx_parser_event_sender.setsockopt(zmq.SNDHWM, TX_QUEUE_SIZE)
         tx_parser_event_receiver = context.socket(zmq.PAIR)
+        tx_parser_event_receiver.setsockopt(zmq.RCVHWM, TX_QUEUE_SIZE)
         tx_parser_event_sender.bind("inproc://monero_txbridge")
         tx_parser_event_receiver.connect("inproc://monero_txbridge")
 
-        database_event_sender = context.socket(zmq.PAIR)
-        database_event_receiver = context.socket(zmq.PAIR)
-        database_event_sender.bind("inproc://monero_dbbridge")
-        database_event_receiver.connect("inproc://monero_dbbridge")
-
-        tx_reader = TxParser(tx_parser_event_receiver, database_event_sender)
-        tx_reader.start()
-        writer = DatabaseWriter(database, database_event_receiver, self.blockchain)
-        writer.start()
-
-        tx_indices_cache = []
-        counter = 0
-        with env.begin(write=False) as txn:
-            for _, tx_index in txn.cursor(db=index_db):
-                counter += 1
-                tx_indices_cache.append(tx_index)
-                if len(tx_indices_cache) == 10000:
-
-                    # Get the TxIndex struct from the database value
-                    monero_tx_indices: List[
-                        xmr.TxIndex
-                    ] = asyncio.get_event_loop().run_until_complete(
-                        deserialize_tx_indices(tx_indices_cache)
+        self._metrics = ParseMetrics(self.blockchain.value)
+        writer = DatabaseWriter(
+            database,
+            context,
+            "inproc://monero_dbbridge",
+            self.blockchain,
+            self._metrics,
+        )
+        tx_reader = TxParser(tx_parser_event_receiver, writer, context, self._metrics)
+        with writer.running():
+            tx_reader.start()
+            tx_indices_cache = []
+            counter = 0
+            max_height = start_height - 1
+            with env.begin(write=False) as txn:
+                for _, tx_index in txn.cursor(db=index_db):
+                    # The tx indices are sorted by tx hash, not by height. Read the
+                    # height from the raw index to skip already parsed transactions
+                    # without deserializing them.
+                    height = int.from_bytes(
+                        tx_index[
+                            TX_INDEX_BLOCK_ID_OFFSET : TX_INDEX_BLOCK_ID_OFFSET + 8
+                        ],
+                        "little",
                     )
-
-                    # translate the tx index back to bytes for retrieval of the full transaction
-                    db_tx_indices: List[bytes] = [
-                        monero_tx_index.data.tx_id.to_bytes(8, "little")
-                        for monero_tx_index in monero_tx_indices
-                    ]
-
-                    # Get the full transaction from the database with the transaction id bytes
-                    cursor = txn.cursor(db=tx_db)
-                    monero_txs_raw: List[bytes] = cursor.getmulti(db_tx_indices)
-                    cursor.close()
-                    tx_parser_event_sender.send_pyobj(
-                        MoneroParserMessage(counter, monero_txs_raw, monero_tx_indices)
+                    if height < start_height:
+                        continue
+                    max_height = max(max_height, height)
+                    counter += 1
+                    tx_indices_cache.append(tx_index)
+                    if len(tx_indices_cache) == 10000:
+                        self.send_tx_batch(
+                            txn,
+                            tx_db,
+                            tx_parser_event_sender,
+                            tx_reader,
+                            tx_indices_cache,
+                            counter,
+                        )
+                        tx_indices_cache = []
+
+                if len(tx_indices_cache) > 0:
+                    self.send_tx_batch(
+                        txn,
+                        tx_db,
+                        tx_parser_event_sender,
+                        tx_reader,
+                        tx_indices_cache,
+                        counter,
                     )
-                    tx_indices_cache = []
 
-            print("\n\nCompleted Monero parsing\n\n")
+                # Only a complete walk over the hash ordered indices covers a height range
+                tx_reader.send(
+                    tx_parser_event_sender,
+                    MoneroCheckpointMessage(
+                        max_height if max_height >= start_height else None
+                    ),
+                )
+                tx_reader.join()
+                tx_reader.raise_error()
+
+        print("\n\nCompleted Monero parsing\n\n")
+        print(self._metrics.summary())
@@ -0,0 +1,171 @@
+import random
+import shutil
+import subprocess
+import unittest
+from typing import Optional, Union
+
+from analyzer import (
+    PrintableRun,
+    find_printable_runs,
+    find_printable_runs_batch,
+    gnu_strings,
+    native_strings,
+    native_strings_batch,
+)
+from database import DATATYPE, DetectorPayload
+
+# Payloads and the length of the strings gnu_strings detects in them, None if
+# it detects nothing
+KNOWN_LENGTHS = (
+    (b"", None),
+    (b"abcdefghi", None),
+    (b"abcdefghij", 10),
+    (b"\x00abcdefghij\x00", 10),
+    (b"  abcdefghij", 10),
+    (b"abcdefghij\t\t", 10),
+    # the run is long enough, but not once the tabs are stripped
+    (b"\tabcdefghi\t", None),
+    # strings are printed one per line
+    (b"abcdefghij\x00klmnopqrst", 21),
+    (b"abcdefghij\nklmnopqrst", 21),
+    (b"abcdefghij\rklmnopqrst\x0b\x0c", 21),
+    (b"abc\x00defghijklm\x01nop", 10),
+    (b"\x80\xff\xe4\xb8\xad\xe6\x96\x87abcdefghij\xc3\xa9", 10),
+    (b"~~~~~~~~~~~ \x7f !!!!!!!!!!", 24),
+)
+
+
+def payload(data: Union[bytes, str]) -> DetectorPayload:
+    return DetectorPayload("tx", DATATYPE.TX_DATA.value, 0, data)
+
+
+def strings_length(data: bytes, min: int = 10) -> Optional[int]:
+    """Returns the length of the output of strings -n min, None if shorter than min"""
+    output = subprocess.run(
+        ["strings", "-n", str(min)], input=data, stdout=subprocess.PIPE, check=True
+    ).stdout
+    length = len(output.decode("ascii").strip())
+    if length < min:
+        return None
+    return length
+
+
+def detected_length(data: bytes, min: int = 10) -> Optional[int]:
+    detected = gnu_strings(payload(data), min)
+    if detected is None:
+        return None
+    return detected.detected_data_length
+
+
+class GnuStringsTest(unittest.TestCase):
+    def test_known_lengths(self) -> None:
+        for data, length in KNOWN_LENGTHS:
+            with self.subTest(data=data):
+                self.assertEqual(detected_length(data), length)
+
+    def test_minimum_length(self) -> None:
+        self.assertEqual(detected_length(b"\x00abcd\x00", 4), 4)
+        self.assertIsNone(detected_length(b"\x00abc\x00", 4))
+
+    @unittest.skipUnless(shutil.which("strings"), "GNU strings is not installed")
+    def test_matches_strings(self) -> None:
+        rng = random.Random(0)
+        alphabet = b"abcXYZ019 ~\t\n\r\x00\x01\x7f\x80\xff"
+        cases = [data for data, _ in KNOWN_LENGTHS] + [bytes(range(256)) * 2]
+        cases += [
+            bytes(rng.choice(alphabet) for _ in range(rng.randint(0, 80)))
+            for _ in range(200)
+        ]
+        for data in cases:
+            with self.subTest(data=data):
+                self.assertEqual(detected_length(data), strings_length(data))
+
+
+class PrintableRunsTest(unittest.TestCase):
+    def test_multiple_runs(self) -> None:
+        self.assertEqual(
+            find_printable_runs(b"abcdefghij\x00\x01klmnopqrstuv\xffxyz"),
+            [PrintableRun(0, 10), PrintableRun(12, 12)],
+        )
+
+    def test_runs_at_payload_boundaries(self) -> None:
+        self.assertEqual(
+            find_printable_runs(b"0123456789\x80ABCDEFGHIJ"),
+            [PrintableRun(0, 10), PrintableRun(11, 10)],
+        )
+        self.assertEqual(
+            find_printable_runs(b"\tabc\r\ndefg\x0b"), [PrintableRun(0, 11)]
+        )
+        self.assertEqual(find_printable_runs(b"abcdefghi"), [])
+
+    def test_batch_separates_payloads(self) -> None:
+        # Adjacent printable payloads would form a single run without the
+        # separator, and short ones a run of at least the minimum length
+        self.assertEqual(
+            find_printable_runs_batch(
+                [
+                    b"abcdefghij",
+                    b"klmnopqrst",
+                    b"",
+                    b"ab\x00cdefghijklm",
+                    b"uvwxyzabcd\x00",
+                    b"abcde",
+                    b"fghij",
+                    b"\x00",
+                    b"0123456789\x80ABCDEFGHIJ",
+                ]
+            ),
+            [
+                [PrintableRun(0, 10)],
+                [PrintableRun(0, 10)],
+                [],
+                [PrintableRun(3, 11)],
+                [PrintableRun(0, 10)],
+                [],
+                [],
+                [],
+                [PrintableRun(0, 10), PrintableRun(11, 10)],
+            ],
+        )
+
+    def test_batch_matches_single_payloads(self) -> None:
+        rng = random.Random(0)
+        alphabet = b"abcXYZ019 ~\t\n\r\x00\x01\x7f\x80\xff"
+        data = [
+            bytes(rng.choice(alphabet) for _ in range(rng.randint(0, 80)))
+            for _ in range(500)
+        ]
+        self.assertEqual(
+            find_printable_runs_batch(data, 4),
+            [find_printable_runs(payload, 4) for payload in data],
+        )
+
+
+class NativeStringsTest(unittest.TestCase):
+    def test_first_run_is_stored(self) -> None:
+        detected = native_strings(payload(b"abcdefghij\x00" + b"k" * 20))
+        assert detected is not None
+        self.assertEqual(detected.detected_data_length, 10)
+        self.assertIsNone(native_strings(payload(b"abcdefghi\x00abc")))
+        # hex encoded payloads hold no bytes to be examined
+        self.assertIsNone(native_strings(payload("abcdefghijklmnop")))
+
+    def test_batch_matches_single_payloads(self) -> None:
+        payloads = [
+            payload(data)
+            for data in (
+                b"abcdefghij\x00" + b"k" * 20,
+                b"abcdefghi",
+                b"jklmnopqr",
+                "abcdefghijklmnop",
+                b"\x80\xffabcdefghijkl\x00",
+                b"",
+            )
+        ]
+        self.assertEqual(
+            native_strings_batch(payloads), [native_strings(p) for p in payloads]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,13 @@
 import enum
-from typing import Iterable, Optional, Tuple
+from typing import Dict, Iterable, Optional, Tuple
 from matplotlib.axes import Axes
 from matplotlib.figure import Figure
 from database import BLOCKCHAIN, Database
+from file_types import (
+    HISTOGRAM_BUCKETS,
+    get_histogram_bucket,
+    is_excluded_from_histogram,
+)
 import matplotlib.colors as mcolors
 import matplotlib.pyplot as plt
 import numpy as np
@@ -192,217 +197,26 @@ class View:
         file_types = np.array(list(map(lambda item: item[0], result)))
         counts = np.array(list(map(lambda item: item[1], result)))
 
-        # remove some more magic file type entries
+        # group the file types into buckets and remove some more entries
         filtered_file_types = []
         filtered_counts = []
-        utf_count = 0
-        jpeg_count = 0
-        png_count = 0
-        gringotts_count = 0
-        dif_count = 0
-        tar_archive_count = 0
-        openssl_encrypted_count = 0
-        pgp_encrypted_count = 0
-        pgp_key_count = 0
-        gpg_encrypted_count = 0
-        gpg_key_count = 0
-        os_2_count = 0
-        lzma_count = 0
-        gif_count = 0
-        pdf_count = 0
-        mp3_count = 0
-        msx_count = 0
-        musepack_count = 0
+        bucket_counts: Dict[str, int] = {}
 
         for file_type, count in zip(file_types, counts):
-            if "GIF" in file_type:
-                gif_count += count
+            bucket = get_histogram_bucket(file_type)
+            if bucket is not None:
+                bucket_counts[bucket] = bucket_counts.get(bucket, 0) + count
                 continue
-            if "PDF" in file_type:
-                pdf_count += count
-                continue
-            if "LZMA" in file_type:
-                lzma_count += count
-                continue
-            if "UTF" in file_type:
-                utf_count += count
-                continue
-            if "JPEG" in file_type:
-                jpeg_count += count
-                continue
-            if "PNG" in file_type:
-                png_count += count
-                continue
-            if "Gringotts" in file_type:
-                gringotts_count += count
-                continue
-            if "DIF" in file_type:
-                dif_count += count
-                continue
-            if "tar archive" in file_type:
-                tar_archive_count += count
-                continue
-            if "openssl" in file_type:
-                openssl_encrypted_count += count
-                continue
-            if "OS/2" in file_type:
-                os_2_count += count
-                continue
-            if "PGP" in file_type and "encrypted" in file_type:
-                pgp_encrypted_count += count
-                continue
-            if "PGP" in file_type and "key" in file_type:
-                pgp_key_count += count
-                continue
-            if "GPG" in file_type and "encrypted" in file_type:
-                gpg_encrypted_count += count
-                continue
-            if "GPG" in file_type and "key" in file_type:
-                gpg_key_count += count
-                continue
-            if "Audio file with ID3 version" in file_type or "MP3" in file_type:
-                mp3_count += count
-                continue
-            if "MSX" in file_type:
-                msx_count += count
-                continue
-            if "Musepack" in file_type:
-                musepack_count += count
-                continue
-            if (
-                "Windows metafile" in file_type
-                or "TOC sound file" in file_type
-                or "Bacula volume" in file_type
-                or "Concise Binary Object Representation" in file_type
-                or "DEC SRC" in file_type
-                or "EdLib" in file_type
-                or "SPARC" in file_type
-                or "ispell hash" in file_type
-                or "SoundBlaster" in file_type
-                or "Squeak image" in file_type
-                or "Windows Precom" in file_type
-                or "Macintosh MFS data" in file_type
-                or "HP PCL" in file_type
-                or "core file (Xenix)" in file_type
-                or "compiled Lisp" in file_type
-                or "Zebra Metafile" in file_type
-                or "StarOffice Gallery" in file_type
-                or "Minix filesystem" in file_type
-                or "Macintosh HFS" in file_type
-                or "MacBinary" in file_type
-                or "Embedded OpenType" in file_type
-                or "DIY-Thermocam" in file_type
-                or "Apple HFS" in file_type
-                or "object file" in file_type
-                or "b.out" in file_type
-                or "RISC OS" in file_type
-                or "MMDF" in file_type
-                or "Lotus" in file_type
-                or "FuseCompress" in file_type
-                or "FIGlet" in file_type
-                or "AppleDouble" in file_type
-                or "AppleSingle" in file_type
-                or "MED_Song" in file_type
-                or "Android binary" in file_type
-                or "GDSII" in file_type
-                or "SunOS" in file_type
-                or "AppledDouble" in file_type
-                or "Core file" in file_type
-                or "MAthematica" in file_type
-                or "Berkeley DB" in file_type
-                or "Microstation" in file_type
-                or "overlay object file" in file_type
-                or "LADS" in file_type
-                or "Netscape" in file_type
-                or "ESRI Shapefile" in file_type
-                or "Cytovision" in file_type
-                or "i960" in file_type
-                or "ddis" in file_type
-                or "SPEC" in file_type
-                or "MMFD" in file_type
-                or "AHX" in file_type
-                or "libfprint" in file_type
-                or "SeqBox" in file_type
-                or "Psion" in file_type
-                or "PCP compiled" in file_type
-                or "separate object" in file_type
-                or "Compiled XKB" in file_type
-                or "dar archive" in file_type
-                or "cisco" in file_type
-                or "Symbian" in file_type
-                or "Spectrum .TAP" in file_type
-                or "StuffIt" in file_type
-                or "Spectrum" in file_type
-                or "Spectrum" in file_type
-                or "RAD" in file_type
-                or "Psion Series" in file_type
-                or "Progressive Graphics" in file_type
-                or "Palm" in file_type
-                or "LFS" in file_type
-                or "GEM" in file_type
-                or "ESRI Shapefile" in file_type
-                or "keymap" in file_type
-                or "Aster*x" in file_type
-            ):
+            if is_excluded_from_histogram(file_type):
                 continue
             if count == 1:
                 continue
             filtered_file_types.append(file_type)
             filtered_counts.append(count)
-        if utf_count > 0:
-            filtered_file_types.append("UTF-8")
-            filtered_counts.append(utf_count)
-        if jpeg_count > 0:
-            filtered_file_types.append("JPEG image data")
-            filtered_counts.append(jpeg_count)
-        if png_count > 0:
-            filtered_file_types.append("PNG image data")
-            filtered_counts.append(png_count)
-        if gringotts_count > 0:
-            filtered_file_types.append("Gringotts data file")
-            filtered_counts.append(gringotts_count)
-        if dif_count > 0:
-            filtered_file_types.append("DIF (DVCPRO) movie file")
-            filtered_counts.append(dif_count)
-        if tar_archive_count > 0:
-            filtered_file_types.append("tar archive")
-            filtered_counts.append(tar_archive_count)
-        if openssl_encrypted_count > 0:
-            filtered_file_types.append("openssl enc'd data")
-            filtered_counts.append(openssl_encrypted_count)
-        if os_2_count > 0:
-            filtered_file_types.append("OS/2 graphic")
-            filtered_counts.append(os_2_count)
-        if pgp_encrypted_count > 0:
-            filtered_file_types.append("PGP encrypted data")
-            filtered_counts.append(pgp_encrypted_count)
-        if pgp_key_count > 0:
-            filtered_file_types.append("PGP key")
-            filtered_counts.append(pgp_key_count)
-        if gpg_encrypted_count > 0:
-            filtered_file_types.append("GPG encrypted data")
-            filtered_counts.append(pgp_encrypted_count)
-        if gpg_key_count > 0:
-            filtered_file_types.append("GPG key")
-            filtered_counts.append(gpg_key_count)
-        if lzma_count > 0:
-            filtered_file_types.append("LZMA compressed d.")
-            filtered_counts.append(lzma_count)
-        if gif_count > 0:
-            filtered_file_types.append("GIF image")
-            filtered_counts.append(gif_count)
-        if pdf_count > 0:
-            filtered_file_types.append("PDF document")
-            filtered_counts.append(pdf_count)
-        if mp3_count > 0:
-            filtered_file_types.append("MP3 audio")
-            filtered_counts.append(mp3_count)
-        if msx_count > 0:
-            filtered_file_types.append("MSX music file")
-            filtered_counts.append(msx_count)
-        if musepack_count > 0:
-            filtered_file_types.append("Musepack audio")
-            filtered_counts.append(musepack_count)
+        for bucket in dict.fromkeys(rule.file_type for rule in HISTOGRAM_BUCKETS):
+            if bucket_counts.get(bucket, 0) > 0:
+                filtered_file_types.append(bucket)
+                filtered_counts.append(bucket_counts[bucket])
 
         file_types = np.array(filtered_file_types)
         counts = np.array(filtered_counts)